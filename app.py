@@ -1,8 +1,22 @@
 import streamlit as st
 import pandas as pd
-from datetime import date, datetime
+import numpy as np
+from datetime import date, datetime, timedelta
 from zoneinfo import ZoneInfo
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
+import csv
+import hashlib
+import importlib.util
+import io
+import json
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from settlement import drifted_parts, input_checksums, net_balances, payout_entries, settle
 
 
 # ─────────────────────────────────────────
@@ -129,23 +143,258 @@ def metric_cards(items: list[tuple[str, str]]):
     parts.append('</div>')
     st.markdown("".join(parts), unsafe_allow_html=True)
 
+def _secret(name: str, default=None):
+    try:
+        return st.secrets.get(name, default)
+    except Exception:
+        return default
+
 # ============================
-# Supabase (옵션)
+# Supabase (옵션) — 프로세스 전역 1개 클라이언트 + HTTP 커넥션 풀(keep-alive)
 # ============================
+# Secrets로 조정 가능: SUPABASE_POOL_SIZE(최대 동시 연결), SUPABASE_KEEPALIVE(유휴 연결 수),
+# SUPABASE_TIMEOUT_SEC(요청 타임아웃). 병렬 페이지 조회(FETCH_MAX_WORKERS)보다 작지 않게 둡니다.
+SUPABASE_POOL_SIZE = 20
+SUPABASE_KEEPALIVE = 10
+SUPABASE_TIMEOUT_SEC = 15.0
+
+def _pooled_http_client(pool_size: int, keepalive: int, timeout: float):
+    """keep-alive 커넥션 풀을 가진 httpx.Client (재실행 간 TLS 연결 재사용)"""
+    import httpx
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=pool_size,
+                            max_keepalive_connections=keepalive,
+                            keepalive_expiry=60.0),
+        timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+    )
+
+@st.cache_resource(show_spinner=False)
+def _create_supabase_client(url: str, key: str, pool_size: int, keepalive: int, timeout: float):
+    from supabase import create_client
+    try:
+        from supabase import ClientOptions
+    except ImportError:
+        from supabase.lib.client_options import ClientOptions
+    try:
+        # supabase-py 2.x 최신: 공용 httpx 클라이언트 주입 지원
+        opts = ClientOptions(postgrest_client_timeout=timeout,
+                             httpx_client=_pooled_http_client(pool_size, keepalive, timeout))
+    except (TypeError, ImportError):
+        # 구버전: postgrest 내부 세션이 클라이언트 수명 동안 keep-alive로 재사용됨
+        opts = ClientOptions(postgrest_client_timeout=timeout)
+    return create_client(url, key, options=opts)
+
 def get_supabase_client():
     try:
         url = st.secrets["SUPABASE_URL"]
         key = st.secrets["SUPABASE_ANON_KEY"]
     except Exception:
         return None
+    pool_size = int(_secret("SUPABASE_POOL_SIZE", SUPABASE_POOL_SIZE))
+    keepalive = int(_secret("SUPABASE_KEEPALIVE", SUPABASE_KEEPALIVE))
+    timeout = float(_secret("SUPABASE_TIMEOUT_SEC", SUPABASE_TIMEOUT_SEC))
     try:
-        from supabase import create_client
-        return create_client(url, key)
+        return _create_supabase_client(url, key, max(pool_size, 1), max(keepalive, 0), timeout)
     except Exception:
         st.warning("Supabase 클라이언트를 불러오지 못해 세션 메모리로 동작합니다. (requirements 설치 필요)")
         return None
 
-sb = get_supabase_client()
+# ============================
+# 저장소 백엔드 선택 (Secrets: STORAGE_BACKEND = "supabase" | "sqlite", SQLITE_PATH)
+# ============================
+# 두 백엔드 모두 같은 쿼리 빌더 모양(sb.table(...).select()...execute())을 제공하므로
+# 아래 코드는 어느 쪽이든 그대로 동작합니다. Supabase를 쓸 수 없고(설정 없음/연결 실패)
+# SQLITE_PATH가 설정돼 있으면 로컬 SQLite를 오프라인 저장소로 사용합니다(없으면 기존처럼 세션 메모리).
+@st.cache_resource
+def get_sqlite_store(path: str):
+    from sqlite_store import SqliteStore
+    return SqliteStore(path)
+
+# 연결 확인: 가벼운 count 조회(행 1개)를 짧은 타임아웃으로 보내고, 결과는 잠시 캐시해
+# rerun마다 왕복하지 않습니다. 실패하면 SQLITE_PATH가 있을 때 로컬 SQLite로 전환합니다.
+SUPABASE_PROBE_TIMEOUT_SEC = 3.0
+SUPABASE_PROBE_TTL_SEC = 30
+
+@st.cache_resource(ttl=SUPABASE_PROBE_TTL_SEC, show_spinner=False)
+def _supabase_reachable(url: str, _client) -> bool:
+    """Supabase 응답 여부 (url별로 SUPABASE_PROBE_TTL_SEC 동안 캐시)."""
+    def probe():
+        _client.table("team_members").select("id", count="exact").limit(1).execute()
+    pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        pool.submit(probe).result(timeout=float(_secret("SUPABASE_PROBE_TIMEOUT_SEC",
+                                                        SUPABASE_PROBE_TIMEOUT_SEC)))
+        return True
+    except Exception:
+        return False
+    finally:
+        pool.shutdown(wait=False)
+
+def get_storage_client():
+    """설정에 따라 (클라이언트, 종류) 반환 — 종류: "supabase" | "sqlite" | None(세션 메모리)."""
+    backend = str(_secret("STORAGE_BACKEND", "supabase")).lower()
+    sqlite_path = _secret("SQLITE_PATH")
+    if backend == "sqlite":
+        return get_sqlite_store(sqlite_path or "teamincome.db"), "sqlite"
+    client = get_supabase_client()
+    if client:
+        if not sqlite_path or _supabase_reachable(str(_secret("SUPABASE_URL", "")), client):
+            return client, "supabase"
+        st.warning("Supabase에 연결할 수 없어 로컬 SQLite 저장소로 전환합니다.")
+    if sqlite_path:
+        return get_sqlite_store(sqlite_path), "sqlite"
+    return None, None
+
+sb, STORAGE_KIND = get_storage_client()
+
+# ============================
+# 공유 데이터 캐시 (프로세스 전체, 모든 세션 공용)
+# ============================
+# 테이블별 버전 번호 + 키별 불변 스냅샷(tuple)을 보관합니다.
+# 쓰기 함수가 bump_version(table)을 호출하면, 다음 rerun에서 처음 접근한 세션 하나만
+# 다시 가져오고(나머지 세션은 같은 스냅샷 재사용) — 세션마다 중복 다운로드/보관하지 않습니다.
+# 다른 경로(직접 DB 수정 등)의 변경은 SHARED_CACHE_TTL_SEC 주기로 반영됩니다.
+SHARED_CACHE_TTL_SEC = 60
+
+@st.cache_resource
+def _shared_store() -> dict:
+    return {"lock": threading.Lock(), "key_locks": {}, "key_refs": {}, "versions": {}, "entries": {},
+            "sync": {}, "lru": {}, "resync": set(), "swept": time.monotonic()}
+
+def data_version(table: str, store: dict | None = None) -> int:
+    return (store or _shared_store())["versions"].get(table, 0)
+
+def bump_version(*tables: str):
+    """쓰기 후 호출 — 해당 테이블 스냅샷을 모든 세션에서 무효화합니다."""
+    store = _shared_store()
+    with store["lock"]:
+        for t in tables:
+            store["versions"][t] = store["versions"].get(t, 0) + 1
+
+def _touch_lru(store: dict, key: tuple, lru: tuple[str, int]):
+    """lru=(그룹, 최대 개수) — 그룹에서 가장 오래 안 쓴 키의 스냅샷/동기화 상태를 버립니다."""
+    group, cap = lru
+    order = store["lru"].setdefault(group, OrderedDict())
+    order[key] = True
+    order.move_to_end(key)
+    while len(order) > cap:
+        old, _ = order.popitem(last=False)
+        store["entries"].pop(old, None)
+        store["sync"].pop(old, None)
+        _drop_key_lock(store, old)
+
+def _drop_key_lock(store: dict, key: tuple):
+    """아무도 잡고 있거나 기다리지 않는 키 잠금을 버립니다(다음 접근 때 새로 만듦).
+    store["lock"] 안에서 호출."""
+    if not store["key_refs"].get(key):
+        store["key_locks"].pop(key, None)
+
+@contextmanager
+def _key_lock(store: dict, key: tuple, lru: tuple[str, int] | None = None):
+    """key 잠금을 잡습니다. store["lock"]을 놓기 전에 참조 수를 올려 두므로, 잠금을 기다리는
+    사이에 LRU 퇴출/정리가 같은 키의 잠금을 새로 바꿔 끼우지 못합니다(같은 키 동시 로드 방지)."""
+    with store["lock"]:
+        lock = store["key_locks"].setdefault(key, threading.Lock())
+        store["key_refs"][key] = store["key_refs"].get(key, 0) + 1
+        if lru:
+            _touch_lru(store, key, lru)
+    try:
+        with lock:
+            yield
+    finally:
+        with store["lock"]:
+            left = store["key_refs"][key] - 1
+            if left:
+                store["key_refs"][key] = left
+            else:
+                del store["key_refs"][key]
+
+def _sweep_expired(store: dict):
+    """SHARED_CACHE_TTL_SEC마다 TTL이 지난 스냅샷과 주인 없는 키 잠금을 정리합니다.
+    (LRU 그룹이 없는 키 — 월별 정산 묶음 등 — 도 잠금/스냅샷이 무한히 쌓이지 않도록)"""
+    now = time.monotonic()
+    if now - store["swept"] < SHARED_CACHE_TTL_SEC:
+        return
+    store["swept"] = now
+    for key, ent in list(store["entries"].items()):
+        ttl = ent.get("ttl", SHARED_CACHE_TTL_SEC)
+        if ttl is not None and now - ent["at"] >= ttl and not store["key_refs"].get(key):
+            del store["entries"][key]
+    for key in [k for k in store["key_locks"] if k not in store["entries"]]:
+        _drop_key_lock(store, key)
+
+def shared_get(key: tuple, table: str | tuple[str, ...], loader, ttl: float | None = SHARED_CACHE_TTL_SEC,
+               lru: tuple[str, int] | None = None):
+    """key 스냅샷을 반환합니다. table(여러 개면 그중 하나라도) 버전이 바뀌었거나 TTL이 지났으면
+    loader()로 다시 채웁니다. loader가 예외를 내면 캐시하지 않고 그대로 전파합니다."""
+    store = _shared_store()
+    with store["lock"]:
+        _sweep_expired(store)
+    with _key_lock(store, key, lru):
+        ver = tuple(data_version(t) for t in table) if isinstance(table, tuple) else data_version(table)
+        ent = store["entries"].get(key)
+        if ent and ent["version"] == ver and (ttl is None or time.monotonic() - ent["at"] < ttl):
+            return ent["value"]
+        value = loader()
+        store["entries"][key] = {"version": ver, "at": time.monotonic(), "ttl": ttl, "value": value}
+        return value
+
+# ============================
+# 병렬 페이지 조회 (Supabase .range() 페이지를 동시에)
+# ============================
+# 첫 페이지를 count="exact"로 받아 전체 건수를 알아낸 뒤, 나머지 페이지 범위를
+# 스레드 풀에서 한꺼번에 요청하고 순서대로 이어 붙입니다. 실패한 페이지만 개별 재시도.
+# (콜드 스타트 ≈ 2 RTT — 테이블 크기에 비례해 늘어나지 않음)
+FETCH_PAGE_SIZE = 1000
+FETCH_MAX_WORKERS = 8
+FETCH_PAGE_RETRIES = 2
+
+def _run_page(make_query, start: int, page_size: int, retries: int) -> list[dict]:
+    for attempt in range(retries + 1):
+        try:
+            return make_query().range(start, start + page_size - 1).execute().data or []
+        except Exception:
+            if attempt >= retries:
+                raise
+            time.sleep(0.2 * (2 ** attempt))
+    return []
+
+def fetch_all_parallel(make_query, page_size: int = FETCH_PAGE_SIZE,
+                       max_workers: int = FETCH_MAX_WORKERS, retries: int = FETCH_PAGE_RETRIES) -> list[dict]:
+    """make_query(count=None) → (select/필터/정렬이 적용된) 새 쿼리 빌더.
+    페이지 경계가 흔들리지 않도록 정렬은 유일 키(id 등)로 끝나야 합니다."""
+    first = None
+    for attempt in range(retries + 1):
+        try:
+            first = make_query(count="exact").range(0, page_size - 1).execute()
+            break
+        except Exception:
+            if attempt >= retries:
+                raise
+            time.sleep(0.2 * (2 ** attempt))
+    rows = list(first.data or [])
+    total = getattr(first, "count", None)
+    if len(rows) < page_size or (isinstance(total, int) and total <= page_size):
+        return rows
+
+    starts = list(range(page_size, total, page_size)) if isinstance(total, int) else []
+    if starts:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(starts)))) as pool:
+            pages = list(pool.map(lambda s: _run_page(make_query, s, page_size, retries), starts))
+        for p in pages:
+            rows.extend(p)
+        last = pages[-1]
+        next_start = starts[-1] + page_size
+    else:
+        last = rows
+        next_start = page_size
+
+    # count 이후 추가된 행(또는 count 미지원) → 짧은 페이지가 나올 때까지 순차 조회
+    while len(last) >= page_size:
+        last = _run_page(make_query, next_start, page_size, retries)
+        rows.extend(last)
+        next_start += page_size
+    return rows
 
 # ============================
 # State & "DB"
@@ -164,62 +413,864 @@ def init_state():
     if "income_records" not in st.session_state:
         st.session_state.income_records = []
 
-def load_data():
-    if sb:
-        try:
-            tmem = sb.table("team_members").select("*").order("order").execute().data
-            locs = sb.table("locations").select("*").order("order").execute().data
-            incs = []
+def _member_from_db(x: dict) -> dict:
+    return {"id": x["id"], "name": x["name"], "order": x.get("order", 0)}
+
+def _location_from_db(x: dict) -> dict:
+    return {"id": x["id"], "name": x["name"], "category": x.get("category", ""), "order": x.get("order", 0)}
+
+def _income_from_db(x: dict) -> dict:
+    return {
+        "id": x["id"], "date": x["date"],
+        "teamMemberId": x.get("team_member_id"),
+        "locationId": x.get("location_id"),
+        "amount": float(x["amount"]),
+        "memo": x.get("memo", ""),
+    }
+
+def _income_to_db(payload: dict) -> dict:
+    return {
+        "id": payload["id"], "date": payload["date"],
+        "team_member_id": payload["teamMemberId"],
+        "location_id": payload["locationId"],
+        "amount": payload["amount"], "memo": payload.get("memo",""),
+    }
 
-            _offset = 0
+# ─────────────────────────────────────────
+# 증분 동기화(delta sync) — sql/001_delta_sync.sql 필요
+#   테이블별 high-water mark(updated_at 최대값)를 공유 캐시(_shared_store)에 보관하고,
+#   이후에는 그 이후 변경분 + sync_tombstones(삭제분)만 가져와 병합합니다.
+#   워터마크가 없거나(첫 로드) 무효(컬럼/테이블 없음, 조회 실패)면 전체 로드.
+# ─────────────────────────────────────────
+# 워터마크보다 이만큼 앞에서부터 다시 조회: now()/clock_timestamp() 는 커밋 시각이 아니므로
+# 동기화 도중 커밋된 (더 이른 시각이 찍힌) 트랜잭션을 놓치지 않게 겹쳐 읽습니다(병합은 id 기준).
+SYNC_OVERLAP_SEC = 120
+
+SYNC_TABLES = {
+    # table: (정렬 컬럼, DB행 → 세션행 변환)
+    "team_members": ("order", _member_from_db),
+    "locations":    ("order", _location_from_db),
+    "incomes":      ("date",  _income_from_db),
+}
+
+def _fetch_paged(table: str, order_col: str, since: str | None = None, year: int | None = None) -> list[dict]:
+    def make_query(count=None):
+        q = sb.table(table).select("*", count=count)
+        if since:
+            # 같은 시각에 커밋된 행을 놓치지 않도록 gte (병합은 id 기준이라 중복 무해)
+            q = q.gte("updated_at", since)
+        elif year:
+            q = q.gte("date", f"{year:04d}-01-01").lt("date", f"{year + 1:04d}-01-01")
+        return q.order(order_col).order("id")
+    return fetch_all_parallel(make_query)
+
+def _fetch_tombstones(table: str, since: str) -> list[dict]:
+    return sb.table("sync_tombstones").select("row_id, deleted_at") \
+             .eq("table_name", table).gte("deleted_at", since).execute().data or []
+
+def _overlap_since(wm: str) -> str:
+    try:
+        return (pd.Timestamp(wm) - pd.Timedelta(seconds=SYNC_OVERLAP_SEC)).isoformat()
+    except Exception:
+        return wm
+
+def _max_stamp(current: str | None, rows: list[dict], col: str) -> str | None:
+    stamps = [r.get(col) for r in rows if r.get(col)]
+    if current:
+        stamps.append(current)
+    return max(stamps) if stamps else None
+
+def _in_year(row: dict, year: int | None) -> bool:
+    return year is None or str(row.get("date") or "").startswith(f"{year:04d}-")
 
-            _step = 1000
+def sync_table(table: str, year: int | None = None, store: dict | None = None) -> list[dict]:
+    """table(incomes는 year 파티션 단위)을 증분 동기화하고 (정렬된) DB행 목록을 반환합니다."""
+    order_col, _ = SYNC_TABLES[table]
+    state = (store or _shared_store())["sync"].setdefault((table, year), {"watermark": None, "rows": {}})
+    wm = state.get("watermark")
 
-            while True:
+    if wm:
+        try:
+            # 변경분은 연도 필터 없이 받아서, 다른 연도로 옮겨간 행은 이 파티션에서 제거
+            since = _overlap_since(wm)
+            changed = _fetch_paged(table, order_col, since=since)
+            gone = _fetch_tombstones(table, since)
+            for r in changed:
+                if _in_year(r, year):
+                    state["rows"][r["id"]] = r
+                else:
+                    state["rows"].pop(r["id"], None)
+            for t in gone:
+                # 겹쳐 읽은 구간의 오래된 삭제 기록이 그 뒤에 다시 쓰인 행을 지우지 않도록
+                row = state["rows"].get(t.get("row_id"))
+                if row is not None and str(row.get("updated_at") or "") <= str(t.get("deleted_at") or ""):
+                    state["rows"].pop(t.get("row_id"), None)
+            state["watermark"] = _max_stamp(_max_stamp(wm, changed, "updated_at"), gone, "deleted_at")
+        except Exception:
+            wm = None  # 워터마크 무효 → 전체 로드
+
+    if not wm:
+        full = _fetch_paged(table, order_col, year=year)
+        state["rows"] = {r["id"]: r for r in full}
+        # updated_at 컬럼이 없으면(마이그레이션 전) 워터마크를 두지 않아 매번 전체 로드(기존 동작)
+        new_wm = _max_stamp(None, full, "updated_at")
+        if new_wm and any(not r.get("updated_at") for r in full):
+            new_wm = None
+        if new_wm:
+            try:
+                _fetch_tombstones(table, new_wm)
+            except Exception:
+                new_wm = None  # 삭제 추적 불가
+        state["watermark"] = new_wm
+
+    return _sorted_rows(state["rows"].values(), order_col)
 
-                _chunk = sb.table("incomes").select("*").order("date").range(_offset, _offset + _step - 1).execute().data or []
+def _sorted_rows(rows, order_col: str) -> list[dict]:
+    return sorted(rows, key=lambda r: (r.get(order_col) is None, r.get(order_col) or 0))
+
+# ─────────────────────────────────────────
+# 쓰기 결과 로컬 반영 — DB가 돌려준 행(returning="representation")을 공유 캐시에 바로 적용
+#   전체 재조회 없이 다음 load_data()가 새 스냅샷을 보게 하고(저장 = 1 RTT),
+#   다른 사용자의 동시 수정은 잠시 후 백그라운드 증분 동기화로 맞춥니다.
+# ─────────────────────────────────────────
+RESYNC_DELAY_SEC = 2.0
+
+def apply_local_write(table: str, rows=(), deleted_ids=()):
+    """table 의 캐시된 모든 파티션에 rows(추가/수정, DB행)와 deleted_ids(삭제)를 한 번에 반영합니다."""
+    store = _shared_store()
+    order_col, conv = SYNC_TABLES[table]
+    bump_version(table)
+    ver = data_version(table)
+    for key in [k for k in list(store["sync"]) if k[0] == table]:
+        with _key_lock(store, key):
+            state = store["sync"].get(key)
+            if state is None:
+                continue
+            cached = state["rows"]
+            for rid in deleted_ids:
+                cached.pop(rid, None)
+            for row in rows:
+                if _in_year(row, key[1]):
+                    cached[row["id"]] = row
+                else:
+                    cached.pop(row["id"], None)
+            store["entries"][key] = {
+                "version": ver, "at": time.monotonic(),
+                "value": tuple(conv(x) for x in _sorted_rows(cached.values(), order_col)),
+            }
+    _schedule_resync(store, table)
+
+def _schedule_resync(store: dict, table: str):
+    """백그라운드 정합성 확인: 잠시 후 table 의 캐시 파티션을 증분 동기화합니다.
+    테이블당 대기 중인 타이머는 하나 — 그 사이의 쓰기는 같은 동기화 한 번으로 합쳐집니다."""
+    with store["lock"]:
+        if table in store["resync"]:
+            return
+        store["resync"].add(table)
+    timer = threading.Timer(RESYNC_DELAY_SEC, _resync_table, args=(store, table))
+    timer.daemon = True
+    timer.start()
+
+def _resync_table(store: dict, table: str):
+    with store["lock"]:
+        store["resync"].discard(table)  # 이후의 쓰기는 다음 타이머가 맡음
+    _, conv = SYNC_TABLES[table]
+    for key in [k for k in list(store["sync"]) if k[0] == table]:
+        with _key_lock(store, key):
+            state = store["sync"].get(key)
+            if not state or not state.get("watermark"):
+                continue  # 증분 동기화 불가 → 전체 로드는 다음 load_data()에 맡김
+            try:
+                rows = sync_table(*key, store=store)
+            except Exception:
+                continue
+            store["entries"][key] = {
+                "version": data_version(table, store), "at": time.monotonic(),
+                "value": tuple(conv(x) for x in rows),
+            }
 
-                incs.extend(_chunk)
+def reset_sync(table: str | None = None):
+    """워터마크를 버려 다음 load_data()에서 전체 로드하도록 합니다."""
+    sync = _shared_store()["sync"]
+    tables = list(SYNC_TABLES) if table is None else [table]
+    for k in [k for k in list(sync) if k[0] in tables]:
+        sync.pop(k, None)
+    bump_version(*tables)
+
+def table_snapshot(table: str, year: int | None = None) -> tuple:
+    """공유 캐시의 불변 스냅샷(세션행 tuple) — 버전이 같으면 모든 세션이 재사용.
+    incomes 연도 파티션은 INCOME_YEAR_CACHE_MAX 개까지만 LRU로 보관합니다."""
+    _, conv = SYNC_TABLES[table]
+    return shared_get(
+        (table, year), table,
+        lambda: tuple(conv(x) for x in sync_table(table, year)),
+        lru=(("income_partitions", INCOME_YEAR_CACHE_MAX) if year is not None else None),
+    )
 
-                if len(_chunk) < _step:
+# ─────────────────────────────────────────
+# 수입 연도 파티션 — 세션(income_records)에는 올해만 둡니다. 다른 연도는 income_store(year) 등이
+#   공유 캐시(INCOME_YEAR_CACHE_MAX 개 LRU)에서 필요할 때만 꺼내 쓰고 세션에 쌓지 않습니다.
+#   연도 목록(드롭다운)은 income_years() RPC(sql/002_income_years.sql)로 행 데이터 없이 조회
+# ─────────────────────────────────────────
+INCOME_YEAR_CACHE_MAX = 3
 
-                    break
+def _fetch_income_years() -> tuple:
+    years: set[int] = set()
+    try:
+        for r in (sb.rpc("income_years").execute().data or []):
+            years.add(int(r["year"] if isinstance(r, dict) else r))
+    except Exception:
+        # RPC 미설치 → 최소/최대 날짜로 범위 추정
+        rmin = sb.table("incomes").select("date").order("date").limit(1).execute().data or []
+        rmax = sb.table("incomes").select("date").order("date", desc=True).limit(1).execute().data or []
+        if rmin and rmax:
+            years.update(range(int(str(rmin[0]["date"])[:4]), int(str(rmax[0]["date"])[:4]) + 1))
+    return tuple(sorted(years))
+
+def income_year_options() -> list[int]:
+    """수입 연도 드롭다운 옵션 (데이터가 있는 연도, 없으면 올해)."""
+    years: set[int] = set()
+    if sb:
+        try:
+            years.update(shared_get(("income_years",), "incomes", _fetch_income_years))
+        except Exception:
+            pass
+    years.update(int(str(r.get("date"))[:4]) for r in st.session_state.get("income_records", []) if r.get("date"))
+    return sorted(years) or [NOW_KST.year]
 
-                _offset += _step
-            st.session_state.team_members = [{"id":x["id"],"name":x["name"],"order":x.get("order",0)} for x in tmem]
-            st.session_state.locations = [{"id":x["id"],"name":x["name"],"category":x.get("category",""),"order":x.get("order",0)} for x in locs]
-            st.session_state.income_records = [{
-                "id": x["id"], "date": x["date"],
-                "teamMemberId": x.get("team_member_id"),
-                "locationId": x.get("location_id"),
-                "amount": float(x["amount"]),
-                "memo": x.get("memo",""),
-            } for x in incs]
+def load_data():
+    if sb:
+        try:
+            # 세션에는 공유 스냅샷을 가리키는 얕은 리스트만 둡니다(행 dict는 공유 — 제자리 수정 금지).
+            st.session_state.team_members = list(table_snapshot("team_members"))
+            st.session_state.locations = list(table_snapshot("locations"))
+            st.session_state.income_records = list(table_snapshot("incomes", NOW_KST.year))
         except Exception:
+            reset_sync()
             st.warning("오프라인(또는 Supabase 오류) 감지 → 임시 메모리 모드로 전환합니다.")
             init_state()
     else:
         init_state()
 
+# ============================
+# 참조 데이터 인덱스 (팀원/업체)
+# ============================
+class RefIndex:
+    """팀원/업체 조회 인덱스 — 참조 데이터 버전당 1회 생성, 모든 탭/세션 공유(읽기 전용).
+
+    id→이름, id→분류, 이름→id, 분류→업체 목록, id→정수 코드를 dict로 제공하고,
+    코드 → 값 배열(마지막 칸은 코드 -1용 빈 값)으로 벡터화 조인(map/take)을 지원합니다.
+    """
+
+    def __init__(self, members, locations):
+        self.members = tuple(members)
+        self.locations = tuple(locations)
+
+        self.member_name = {m["id"]: m.get("name", "") for m in self.members}
+        self.member_code = {m["id"]: i for i, m in enumerate(self.members)}
+        self.member_id: dict[str, str] = {}
+        for m in self.members:
+            if m.get("name"):
+                self.member_id.setdefault(m["name"], m["id"])   # 동명이인이면 첫 항목(기존 동작)
+
+        self.location_by_id = {l["id"]: l for l in self.locations}
+        self.location_name = {l["id"]: l.get("name", "") for l in self.locations}
+        self.location_category = {l["id"]: l.get("category", "") for l in self.locations}
+        self.location_code = {l["id"]: i for i, l in enumerate(self.locations)}
+        self.location_id: dict[str, str] = {}
+        self.by_category: dict[str, list[dict]] = {}
+        for l in sorted(self.locations, key=lambda x: x.get("order", 0)):
+            if l.get("name"):
+                self.location_id.setdefault(l["name"], l["id"])
+            self.by_category.setdefault(l.get("category", ""), []).append(l)
+
+        self.member_ids = np.asarray([m["id"] for m in self.members] + [None], dtype=object)
+        self.member_names = np.asarray([m.get("name", "") for m in self.members] + [""], dtype=object)
+        self.location_ids = np.asarray([l["id"] for l in self.locations] + [None], dtype=object)
+        self.location_names = np.asarray([l.get("name", "") for l in self.locations] + [""], dtype=object)
+        self.location_categories = np.asarray([l.get("category", "") for l in self.locations] + [""], dtype=object)
+
+    def member_codes(self, ids) -> np.ndarray:
+        return pd.Index(self.member_ids[:-1]).get_indexer(list(ids)).astype(np.int32)
+
+    def location_codes(self, ids) -> np.ndarray:
+        return pd.Index(self.location_ids[:-1]).get_indexer(list(ids)).astype(np.int32)
+
+    def locations_in(self, category: str) -> list[dict]:
+        """분류별 업체 목록 (order 순)."""
+        return self.by_category.get(category, [])
+
+def ref_index() -> RefIndex:
+    """현재 팀원/업체의 RefIndex (팀원/업체 버전당 1회 생성·공유)."""
+    if sb:
+        try:
+            return shared_get(("ref_index",), ("team_members", "locations"),
+                              lambda: RefIndex(table_snapshot("team_members"), table_snapshot("locations")))
+        except Exception:
+            pass
+    return RefIndex(st.session_state.get("team_members", []), st.session_state.get("locations", []))
+
+# ============================
+# 열 지향(columnar) 수입 저장소
+# ============================
+class IncomeStore:
+    """연도 파티션 수입의 열 지향 저장소 — 데이터 버전당 1회 생성, 모든 세션이 공유(읽기 전용).
+
+    member/location: int32 코드(RefIndex 기준, -1=없음), date: datetime64[D], amount: float64,
+    category: Categorical. 탭들은 to_frame()/filter()만 사용합니다.
+    """
+
+    def __init__(self, ids, date, member, location, amount, category, memo, ref: RefIndex):
+        self.ids = ids
+        self.date = date
+        self.member = member
+        self.location = location
+        self.amount = amount
+        self.category = category
+        self.memo = memo
+        self.ref = ref
+        self._frame = None
+
+    @classmethod
+    def build(cls, records, ref: RefIndex) -> "IncomeStore":
+        date = pd.to_datetime(pd.Series([r.get("date") for r in records], dtype=object), errors="coerce")
+        keep = date.notna().to_numpy()
+        records = [r for r, k in zip(records, keep) if k]
+
+        location = ref.location_codes(r.get("locationId") for r in records)
+        amount = pd.to_numeric(pd.Series([r.get("amount") for r in records], dtype=object), errors="coerce")
+        return cls(
+            ids=np.asarray([r.get("id") for r in records], dtype=object),
+            date=date[keep].to_numpy().astype("datetime64[D]"),
+            member=ref.member_codes(r.get("teamMemberId") for r in records),
+            location=location,
+            amount=amount.fillna(0.0).to_numpy(np.float64),
+            category=pd.Categorical(ref.location_categories[location]),
+            memo=np.asarray([r.get("memo", "") for r in records], dtype=object),
+            ref=ref,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def take(self, idx) -> "IncomeStore":
+        return IncomeStore(
+            self.ids[idx], self.date[idx], self.member[idx], self.location[idx],
+            self.amount[idx], self.category[idx], self.memo[idx], self.ref,
+        )
+
+    def filter(self, month: int | None = None, member_id: str | None = None,
+               location_id: str | None = None, category: str | None = None) -> "IncomeStore":
+        mask = np.ones(len(self), dtype=bool)
+        if month is not None:
+            mask &= (self.date.astype("datetime64[M]").astype(int) % 12 + 1) == month
+        if member_id is not None:
+            mask &= self.member == self.ref.member_code.get(member_id, -2)
+        if location_id is not None:
+            mask &= self.location == self.ref.location_code.get(location_id, -2)
+        if category is not None:
+            mask &= np.asarray(self.category == category)
+        return self.take(mask)
+
+    def to_frame(self) -> pd.DataFrame:
+        """탭 공용 DataFrame (한 번 만든 뒤 재사용 — 호출 측에서 제자리 수정 금지)."""
+        if self._frame is None:
+            ref = self.ref
+            date = pd.DatetimeIndex(self.date.astype("datetime64[ns]"))
+            self._frame = pd.DataFrame({
+                "id": self.ids,
+                "date": date,
+                "amount": self.amount,
+                "member_id": ref.member_ids[self.member],
+                "member": ref.member_names[self.member],
+                "location_id": ref.location_ids[self.location],
+                "location": ref.location_names[self.location],
+                "category": self.category,
+                "memo": self.memo,
+                "year": date.year.astype(int),
+                "month": date.month.astype(int),
+                "day": date.strftime("%Y-%m-%d"),
+            })
+        return self._frame
+
+def income_store(year: int) -> IncomeStore:
+    """year 파티션의 열 지향 저장소 (수입/팀원/업체 버전당 1회 생성·공유)."""
+    if sb:
+        try:
+            return shared_get(
+                ("income_store", year), ("incomes", "team_members", "locations"),
+                lambda: IncomeStore.build(table_snapshot("incomes", year), ref_index()),
+                lru=("income_store", INCOME_YEAR_CACHE_MAX),
+            )
+        except Exception:
+            pass
+    return IncomeStore.build(
+        [r for r in st.session_state.get("income_records", []) if _in_year(r, year)], ref_index(),
+    )
+
+# ============================
+# 통계 탭 서버 집계 (RPC income_stats — sql/003_income_stats.sql)
+# ============================
+# (월, 팀원, 업체, 분류)별 합계/건수만 받아 오므로 전송량·연산량이 거래 건수가 아니라
+# 그룹 수에 비례합니다. RPC가 없거나(미배포) 오프라인이면 열 지향 저장소에서 같은 모양으로 집계.
+STATS_COLUMNS = ["month", "team_member_id", "location_id", "category", "amount", "cnt"]
+
+def _stats_frame(rows, ref: RefIndex) -> pd.DataFrame:
+    """집계 행 → 표시용 DataFrame(month, member_id, member, location_id, location, category, amount, cnt)."""
+    agg = pd.DataFrame(list(rows), columns=STATS_COLUMNS)
+    mcode = ref.member_codes(agg["team_member_id"])
+    lcode = ref.location_codes(agg["location_id"])
+    return pd.DataFrame({
+        "month": pd.to_numeric(agg["month"], errors="coerce").fillna(0).astype(int),
+        "member_id": agg["team_member_id"],
+        "member": ref.member_names[mcode],
+        "location_id": agg["location_id"],
+        "location": ref.location_names[lcode],
+        "category": agg["category"].fillna("").astype(str),
+        "amount": pd.to_numeric(agg["amount"], errors="coerce").fillna(0.0).astype(float),
+        "cnt": pd.to_numeric(agg["cnt"], errors="coerce").fillna(0).astype(int),
+    })
+
+def _stats_from_store(year: int) -> list[dict]:
+    df = income_store(year).to_frame()
+    if df.empty:
+        return []
+    g = (df.assign(category=df["category"].astype(str))
+           .groupby(["month", "member_id", "location_id", "category"], dropna=False, sort=True)["amount"]
+           .agg(amount="sum", cnt="size").reset_index()
+           .rename(columns={"member_id": "team_member_id"}))
+    return g[STATS_COLUMNS].to_dict("records")
+
+def _fetch_income_stats(year: int) -> tuple[dict, ...]:
+    try:
+        return tuple(sb.rpc("income_stats", {"p_year": int(year)}).execute().data or [])
+    except Exception:
+        return tuple(_stats_from_store(year))
+
+def income_stats(year: int) -> pd.DataFrame:
+    """year의 (월, 팀원, 업체, 분류) 집계 (수입/팀원/업체 버전당 1회 조회·공유 — 제자리 수정 금지)."""
+    if sb:
+        try:
+            return shared_get(
+                ("income_stats", year), ("incomes", "team_members", "locations"),
+                lambda: _stats_frame(_fetch_income_stats(year), ref_index()),
+                lru=("income_stats", INCOME_YEAR_CACHE_MAX),
+            )
+        except Exception:
+            pass
+    return _stats_frame(_stats_from_store(year), ref_index())
+
+class IncomeCube:
+    """연도별 통계 큐브 — 합계/건수 밀집 배열 [월(12), 팀원(+없음), 업체(+없음)], 분류는 업체 속성.
+
+    income_stats 집계에서 데이터 버전당 1회 생성·공유(읽기 전용). 통계 뷰는 모두 마스크 슬라이스 + 합.
+    팀원/업체 축은 RefIndex 코드(-1=없음은 마지막 칸)이며, 결과는 기존처럼 이름 기준으로 묶습니다.
+    """
+
+    def __init__(self, amount: np.ndarray, cnt: np.ndarray, ref: RefIndex):
+        self.amount = amount
+        self.cnt = cnt
+        self.member_names = ref.member_names
+        self.location_names = ref.location_names
+        self.location_categories = ref.location_categories
+
+    @classmethod
+    def build(cls, stats: pd.DataFrame, ref: RefIndex) -> "IncomeCube":
+        shape = (12, len(ref.member_names), len(ref.location_names))
+        amount = np.zeros(shape, dtype=np.float64)
+        cnt = np.zeros(shape, dtype=np.int64)
+        month = stats["month"].to_numpy(dtype=int)
+        ok = (month >= 1) & (month <= 12)
+        idx = (month[ok] - 1, ref.member_codes(stats["member_id"])[ok], ref.location_codes(stats["location_id"])[ok])
+        np.add.at(amount, idx, stats["amount"].to_numpy(dtype=np.float64)[ok])
+        np.add.at(cnt, idx, stats["cnt"].to_numpy(dtype=np.int64)[ok])
+        return cls(amount, cnt, ref)
+
+    def _masks(self, month=None, member=None, location=None, category=None):
+        mm = np.ones(12, dtype=bool) if month is None else (np.arange(1, 13) == int(month))
+        em = np.ones(len(self.member_names), dtype=bool) if member is None else (self.member_names == member)
+        lm = np.ones(len(self.location_names), dtype=bool) if location is None else (self.location_names == location)
+        if category is not None:
+            lm = lm & (self.location_categories == category)
+        return mm, em, lm
+
+    def _slice(self, **where):
+        ix = np.ix_(*self._masks(**where))
+        return self.amount[ix], self.cnt[ix]
+
+    def empty(self, **where) -> bool:
+        return not self._slice(**where)[1].any()
+
+    def total(self, **where) -> tuple[float, int]:
+        """조건(month/member/location/category)에 맞는 (합계, 건수)."""
+        a, c = self._slice(**where)
+        return float(a.sum()), int(c.sum())
+
+    def months(self, **where) -> list[int]:
+        """데이터가 있는 월 목록."""
+        return [int(m) + 1 for m in np.flatnonzero(self._slice(**where)[1].sum(axis=(1, 2)))]
+
+    def _by(self, axis: int, names: np.ndarray, mask: np.ndarray, a: np.ndarray, c: np.ndarray) -> pd.Series:
+        keep = c.sum(axis=axis) > 0
+        s = pd.Series(a.sum(axis=axis)[keep], index=names[mask][keep], dtype=float)
+        return s.groupby(level=0).sum()
+
+    def by_member(self, **where) -> pd.Series:
+        """팀원 이름 → 합계 (데이터가 있는 팀원만)."""
+        _, em, _ = self._masks(**where)
+        a, c = self._slice(**where)
+        return self._by((0, 2), self.member_names, em, a, c)
+
+    def by_location(self, **where) -> pd.Series:
+        """업체 이름 → 합계 (데이터가 있는 업체만)."""
+        _, _, lm = self._masks(**where)
+        a, c = self._slice(**where)
+        return self._by((0, 1), self.location_names, lm, a, c)
+
+    def by_member_category(self, **where) -> pd.DataFrame:
+        """팀원 × 분류 합계표 (데이터가 있는 칸만 합산, 없는 칸 0)."""
+        _, em, lm = self._masks(**where)
+        a, c = self._slice(**where)
+        cats = self.location_categories[lm]
+        out = {}
+        for cat in pd.unique(cats):
+            sel = cats == cat
+            out[cat] = self._by((0, 2), self.member_names, em, a[:, :, sel], c[:, :, sel])
+        table = pd.DataFrame(out, dtype=float).fillna(0.0)
+        table.index.name = "member"
+        return table
+
+def income_cube(year: int) -> IncomeCube:
+    """year 통계 큐브 (수입/팀원/업체 버전당 1회 생성·공유)."""
+    if sb:
+        try:
+            return shared_get(
+                ("income_cube", year), ("incomes", "team_members", "locations"),
+                lambda: IncomeCube.build(income_stats(year), ref_index()),
+                lru=("income_cube", INCOME_YEAR_CACHE_MAX),
+            )
+        except Exception:
+            pass
+    return IncomeCube.build(income_stats(year), ref_index())
+
+def check_income_rollup(rebuild: bool = False) -> tuple[list[dict], int | None]:
+    """월별 롤업(income_monthly) 점검 → (어긋난 그룹 목록, 재구성 시 고친 그룹 수).
+    rebuild=True 면 원본에서 다시 만들고 통계 캐시를 무효화합니다."""
+    drift = sb.rpc("income_monthly_verify", {}).execute().data or []
+    fixed = None
+    if rebuild:
+        fixed = int(sb.rpc("income_monthly_rebuild", {}).execute().data or 0)
+        bump_version("incomes")
+    return drift, fixed
+
+def income_detail(year: int, month: int, member_ids: list[str]) -> pd.DataFrame:
+    """한 팀원·한 달의 원본 행 (일별 합계/상세 보기용). 올해는 세션 파티션을 그대로 사용."""
+    if sb and year != NOW_KST.year:
+        def load():
+            ids = sorted(member_ids)
+            start = f"{year:04d}-{month:02d}-01"
+            end = f"{year + month // 12:04d}-{month % 12 + 1:02d}-01"
+            rows = fetch_all_parallel(
+                lambda count=None: sb.table("incomes").select("*", count=count)
+                                     .in_("team_member_id", ids).gte("date", start).lt("date", end)
+                                     .order("date").order("id"))
+            return IncomeStore.build([_income_from_db(r) for r in rows], ref_index()).to_frame()
+        try:
+            return shared_get(("income_detail", year, month, tuple(sorted(member_ids))),
+                              ("incomes", "team_members", "locations"), load, lru=("income_detail", 8))
+        except Exception:
+            pass
+    df = income_store(year).filter(month=month).to_frame()
+    return df[df["member_id"].isin(member_ids)]
+
+# ============================
+# 기록 관리 조회 (필터/정렬을 저장소 쿼리로 — 키셋 페이지)
+# ============================
+# 연도 전체를 DataFrame으로 만들지 않고 기간/팀원/업체(분류) 조건과 정렬을 incomes 쿼리에 내려
+# 한 페이지만 받아 옵니다. 다음 페이지는 offset 대신 직전 페이지 마지막 행의 정렬 키 "이후"로
+# 조회(키셋)하고, 건수는 id 만 count 로 따로 (조건·버전당 1회). 인덱스: sql/008_incomes_keyset.sql
+RECORDS_PAGE_SIZE = 20
+RECORDS_SORTS = {   # 정렬 이름 → [(컬럼, 내림차순)] — 마지막은 유일 키 id
+    "날짜↓(최신)": [("date", True), ("id", False)],
+    "날짜↑":       [("date", False), ("id", False)],
+    "금액↓":       [("amount", True), ("date", True), ("id", False)],
+    "금액↑":       [("amount", False), ("date", True), ("id", False)],
+}
+
+def records_condition(year: int, date_range, member: str, category: str, location: str,
+                      ref: RefIndex) -> tuple:
+    """기록 관리 필터 → (시작일, 종료일(미포함), 팀원 id들|None, 업체 id들|None). 캐시 키로도 사용."""
+    start, end = date(year, 1, 1), date(year + 1, 1, 1)
+    if isinstance(date_range, tuple) and len(date_range) == 2:
+        start, end = max(start, date_range[0]), min(end, date_range[1] + timedelta(days=1))
+    members = None
+    if member != "전체":
+        members = tuple(sorted(m["id"] for m in ref.members if m.get("name") == member))
+    locations = None
+    if location != "전체" or category != "전체":
+        locations = tuple(sorted(
+            l["id"] for l in ref.locations
+            if (location == "전체" or l.get("name") == location)
+            and (category == "전체" or l.get("category", "") == category)
+        ))
+    return start.isoformat(), end.isoformat(), members, locations
+
+def _records_query(cond: tuple, cols: str = "*", count: str | None = None):
+    start, end, members, locations = cond
+    q = sb.table("incomes").select(cols, count=count).gte("date", start).lt("date", end)
+    if members is not None:
+        q = q.in_("team_member_id", list(members))
+    if locations is not None:
+        q = q.in_("location_id", list(locations))
+    return q
+
+def _keyset_filter(keys: list[tuple[str, bool]], cursor: tuple) -> str:
+    """정렬 키와 직전 페이지 마지막 행의 키 값 → 그 행 "이후" 조건 (postgrest or 문자열)."""
+    terms = []
+    for i, (col, desc) in enumerate(keys):
+        conds = [f'{c}.eq."{cursor[j]}"' for j, (c, _) in enumerate(keys[:i])]
+        conds.append(f'{col}.{"lt" if desc else "gt"}."{cursor[i]}"')
+        terms.append(f"and({','.join(conds)})" if len(conds) > 1 else conds[0])
+    return ",".join(terms)
+
+def records_cursor(row: dict, sort: str) -> tuple:
+    """페이지 마지막 행 → 다음 페이지 키셋 커서."""
+    return tuple(row[c] for c, _ in RECORDS_SORTS[sort])
+
+def _records_local_frame(cond: tuple, sort: str) -> pd.DataFrame:
+    """오프라인: 연도 파티션(열 지향 저장소)에서 같은 조건/정렬의 행."""
+    start, end, members, locations = cond
+    df = income_store(int(start[:4])).to_frame()
+    mask = (df["day"] >= start) & (df["day"] < end)
+    if members is not None:
+        mask &= df["member_id"].isin(members)
+    if locations is not None:
+        mask &= df["location_id"].isin(locations)
+    keys = RECORDS_SORTS[sort]
+    return df[mask].sort_values([c for c, _ in keys], ascending=[not d for _, d in keys])
+
+def _frame_records(part: pd.DataFrame) -> tuple:
+    return tuple(
+        {"id": r.id, "date": r.day, "teamMemberId": r.member_id, "locationId": r.location_id,
+         "amount": float(r.amount), "memo": r.memo}
+        for r in part.itertuples(index=False)
+    )
+
+def _records_local(cond: tuple, sort: str, page: int) -> tuple[tuple, int]:
+    """오프라인: 같은 조건/정렬로 offset 페이지."""
+    q = _records_local_frame(cond, sort)
+    return _frame_records(q.iloc[page * RECORDS_PAGE_SIZE:(page + 1) * RECORDS_PAGE_SIZE]), len(q)
+
+def records_page(cond: tuple, sort: str, page: int, cursor: tuple | None) -> tuple[tuple, int]:
+    """한 페이지(세션행 tuple)와 조건 전체 건수. 서버는 cursor(직전 페이지 마지막 키) 이후를 조회."""
+    if sb:
+        keys = RECORDS_SORTS[sort]
+
+        def load_page():
+            q = _records_query(cond)
+            if cursor is not None:
+                q = q.or_(_keyset_filter(keys, cursor))
+            for col, desc in keys:
+                q = q.order(col, desc=desc)
+            return tuple(_income_from_db(r) for r in (q.limit(RECORDS_PAGE_SIZE).execute().data or []))
+
+        def load_count():
+            return int(_records_query(cond, "id", count="exact").limit(1).execute().count or 0)
+        try:
+            rows = shared_get(("records_page", cond, sort, cursor), "incomes", load_page, lru=("records_page", 32))
+            total = shared_get(("records_count", cond), "incomes", load_count, lru=("records_count", 16))
+            return rows, total
+        except Exception:
+            pass
+    return _records_local(cond, sort, page)
+
+def income_export_chunks(cond: tuple, sort: str, ref: RefIndex) -> Iterator[list[dict]]:
+    """기록 관리 조건 전체 → 내보내기 행 청크 (서버 키셋 조회, 오프라인이면 연도 파티션)."""
+    def view(recs):
+        return [{
+            "date": r["date"], "member": ref.member_name.get(r["teamMemberId"], ""),
+            "location": ref.location_name.get(r["locationId"], ""),
+            "category": ref.location_category.get(r["locationId"], ""),
+            "amount": r["amount"], "memo": r.get("memo") or "",
+        } for r in recs]
+
+    if sb:
+        for rows in iter_keyset(lambda: _records_query(cond), RECORDS_SORTS[sort]):
+            yield view(_income_from_db(r) for r in rows)
+        return
+    q = _records_local_frame(cond, sort)
+    for i in range(0, len(q), EXPORT_CHUNK_SIZE):
+        yield view(_frame_records(q.iloc[i:i + EXPORT_CHUNK_SIZE]))
+
+def records_all(cond: tuple, sort: str) -> tuple:
+    """기록 관리 조건 전체(세션행) — 일괄 작업 대상으로 "필터 결과 전체"를 고를 때만 조회."""
+    if sb:
+        try:
+            return shared_get(
+                ("records_all", cond, sort), "incomes",
+                lambda: tuple(_income_from_db(r) for rows in iter_keyset(lambda: _records_query(cond), RECORDS_SORTS[sort])
+                              for r in rows),
+                lru=("records_all", 4),
+            )
+        except Exception:
+            pass
+    return _frame_records(_records_local_frame(cond, sort))
+
+def income_by_id(id_value: str) -> dict | None:
+    """수정 대상 1건 (세션행). 현재 페이지 밖이면 id 로 조회."""
+    for r in st.session_state.get("income_records", []):
+        if r["id"] == id_value:
+            return r
+    if sb:
+        try:
+            rows = sb.table("incomes").select("*").eq("id", id_value).limit(1).execute().data or []
+            return _income_from_db(rows[0]) if rows else None
+        except Exception:
+            pass
+    return None
+
+# ============================
+# 전체 내보내기 (CSV/XLSX/Parquet — 청크 스트리밍)
+# ============================
+# 저장소에서 EXPORT_CHUNK_SIZE 행씩 키셋으로 받아(generator) 받은 청크만 바로 디스크 임시 파일에 씁니다.
+# 결과 전체를 DataFrame/바이트로 만들지 않으므로 생성 중 작업 메모리는 청크 1개 분량입니다.
+# 단, Streamlit 다운로드 버튼은 파일 내용을 서버 메모리에 한 번 올려 두므로(세션당 1부)
+# 파일 크기를 EXPORT_MAX_BYTES 로 제한합니다 — 넘으면 기간/조건을 나눠 내보내세요.
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_MAX_BYTES = 200 * 1024 * 1024
+EXPORT_XLSX_MAX_ROWS = 1_048_575   # 엑셀 시트 한도(헤더 제외)
+EXPORT_FORMATS = {   # 이름 → (확장자, MIME, 필요한 패키지)
+    "CSV": ("csv", "text/csv", None),
+    "XLSX": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "openpyxl"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet", "pyarrow"),
+}
+
+def export_formats() -> list[str]:
+    """설치된 패키지로 만들 수 있는 형식만 (Parquet 는 pyarrow 가 있을 때만)."""
+    return [f for f, (_, _, pkg) in EXPORT_FORMATS.items() if pkg is None or importlib.util.find_spec(pkg)]
+
+def iter_keyset(make_query, keys: list[tuple[str, bool]], chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list[dict]]:
+    """make_query() → 필터만 적용된 새 쿼리 빌더. keys 정렬(마지막은 유일 키)로 chunk_size 행씩
+    직전 청크 마지막 행 이후를 조회해 DB행 목록을 내보냅니다."""
+    cursor = None
+    while True:
+        q = make_query()
+        if cursor is not None:
+            q = q.or_(_keyset_filter(keys, cursor))
+        for col, desc in keys:
+            q = q.order(col, desc=desc)
+        rows = q.limit(chunk_size).execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        cursor = tuple(rows[-1][c] for c, _ in keys)
+
+def frame_chunks(df: pd.DataFrame, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list[dict]]:
+    """이미 메모리에 있는 결과(공유 캐시 등) → 같은 모양의 행 청크."""
+    for i in range(0, len(df), chunk_size):
+        yield df.iloc[i:i + chunk_size].to_dict("records")
+
+def write_export(chunks: Iterable[list[dict]], columns: dict[str, str], fmt: str, out,
+                 numeric: Iterable[str] = (), max_bytes: int = EXPORT_MAX_BYTES):
+    """행 청크 → 이진 파일 객체 out 에 기록. columns: {행 키: 헤더}(순서대로), numeric: 숫자 컬럼 키.
+    CSV는 utf-8-sig(엑셀 호환), XLSX는 openpyxl write-only, Parquet는 pyarrow 로 청크마다 씁니다.
+    기록된 크기가 max_bytes 를 넘으면 ValueError — 청크마다 확인하므로 넘는 즉시 조회를 멈춥니다.
+    XLSX는 저장 전까지 out 크기를 알 수 없어 셀 텍스트 크기(압축 전)와 시트 행 한도로 판단합니다."""
+    keys, headers, numeric = list(columns), list(columns.values()), set(numeric)
+
+    def cell(r, k):
+        v = r.get(k)
+        if k in numeric:
+            return float(v or 0)
+        return "" if v is None else str(v)
+
+    def checked(it, size=lambda: out.tell()):
+        for chunk in it:
+            yield chunk
+            if size() > max_bytes:
+                raise ValueError(f"내보낼 파일이 {max_bytes // (1024 * 1024)}MB 를 넘습니다. 기간/조건을 나눠 주세요.")
+
+    if fmt == "CSV":
+        def encoded(rows) -> bytes:
+            text = io.StringIO()
+            csv.writer(text).writerows(rows)
+            return text.getvalue().encode("utf-8")
+        out.write(b"\xef\xbb\xbf" + encoded([headers]))   # utf-8-sig BOM
+        for chunk in checked(chunks):
+            out.write(encoded([cell(r, k) for k in keys] for r in chunk))
+    elif fmt == "XLSX":
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)   # 행은 openpyxl 임시 파일로, 저장 시 out 에 압축 기록
+        ws = wb.create_sheet("data")
+        ws.append(headers)
+        written = {"rows": 0, "bytes": 0}
+        for chunk in checked(chunks, size=lambda: written["bytes"]):
+            written["rows"] += len(chunk)
+            if written["rows"] > EXPORT_XLSX_MAX_ROWS:
+                raise ValueError(f"XLSX는 {EXPORT_XLSX_MAX_ROWS:,}행까지 가능합니다. CSV/Parquet를 쓰거나 조건을 나눠 주세요.")
+            for r in chunk:
+                values = [cell(r, k) for k in keys]
+                written["bytes"] += sum(len(str(v).encode("utf-8")) for v in values)
+                ws.append(values)
+        wb.save(out)
+    elif fmt == "Parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([(h, pa.float64() if k in numeric else pa.string()) for k, h in columns.items()])
+        with pq.ParquetWriter(out, schema) as writer:
+            for chunk in checked(chunks):
+                writer.write_table(pa.Table.from_pydict(
+                    {h: [cell(r, k) for r in chunk] for k, h in columns.items()}, schema=schema))
+    else:
+        raise ValueError(f"지원하지 않는 형식: {fmt}")
+
+def export_controls(key: str, file_stem: str, make_chunks, columns: dict[str, str], numeric: Iterable[str] = ()):
+    """형식 선택 + [전체 내보내기] → 임시 파일 생성 후 다운로드 버튼 (클릭할 때만 조회)."""
+    c1, c2 = st.columns([1, 2])
+    with c1:
+        fmt = st.selectbox("형식", export_formats(), key=f"{key}_fmt", label_visibility="collapsed")
+    with c2:
+        go = st.button("⬇ 전체 내보내기 (필터 결과 전체)", key=f"{key}_go")
+    if not go:
+        return
+    ext, mime, _ = EXPORT_FORMATS[fmt]
+    with tempfile.TemporaryFile() as f:
+        try:
+            with st.spinner("내보내는 중..."):
+                write_export(make_chunks(), columns, fmt, f, numeric)
+        except Exception as e:
+            st.error(f"내보내기 실패: {e}")
+            return
+        size = f.tell()
+        f.seek(0)
+        st.download_button(f"{file_stem}.{ext} 다운로드 ({size:,} bytes)", data=f,
+                           file_name=f"{file_stem}.{ext}", mime=mime, key=f"{key}_dl")
+
+def _apply_write_result(table: str, res):
+    """insert/update 응답 행을 캐시에 반영 (응답이 비었으면 무효화만 — 다음 로드에서 증분 동기화)."""
+    rows = getattr(res, "data", None) or []
+    if rows:
+        apply_local_write(table, rows=rows)
+    else:
+        bump_version(table)
+
 def upsert_row(table: str, payload: Dict[str, Any]):
     if sb:
         try:
+            res = None
             if table == "incomes":
-                sb.table("incomes").insert({
-                    "id": payload["id"], "date": payload["date"],
-                    "team_member_id": payload["teamMemberId"],
-                    "location_id": payload["locationId"],
-                    "amount": payload["amount"], "memo": payload.get("memo",""),
-                }).execute()
+                res = sb.table("incomes").insert(_income_to_db(payload), returning="representation").execute()
             elif table == "team_members":
-                sb.table("team_members").insert({
+                res = sb.table("team_members").insert({
                     "id": payload["id"], "name": payload["name"], "order": payload.get("order",0),
-                }).execute()
+                }, returning="representation").execute()
             elif table == "locations":
-                sb.table("locations").insert({
+                res = sb.table("locations").insert({
                     "id": payload["id"], "name": payload["name"],
                     "category": payload["category"], "order": payload.get("order",0),
-                }).execute()
+                }, returning="representation").execute()
+            _apply_write_result(table, res)
             load_data(); return
         except Exception:
             st.warning("Supabase 기록 실패(오프라인?) → 임시 메모리에 저장합니다.")
@@ -230,26 +1281,30 @@ def upsert_row(table: str, payload: Dict[str, Any]):
 def update_income(id_value: str, payload: dict):
     if sb:
         try:
-            sb.table("incomes").update({
+            res = sb.table("incomes").update({
                 "date": payload["date"], "team_member_id": payload["teamMemberId"],
                 "location_id": payload["locationId"], "amount": payload["amount"],
                 "memo": payload.get("memo",""),
-            }).eq("id", id_value).execute()
+            }, returning="representation").eq("id", id_value).execute()
+            _apply_write_result("incomes", res)
             load_data(); return
         except Exception:
             st.warning("Supabase 업데이트 실패(오프라인?) → 임시 메모리에만 반영합니다.")
-    for r in st.session_state.income_records:
+    recs = st.session_state.income_records
+    for i, r in enumerate(recs):
         if r["id"] == id_value:
-            r.update({
+            recs[i] = {
+                **r,
                 "date": payload["date"], "teamMemberId": payload["teamMemberId"],
                 "locationId": payload["locationId"], "amount": float(payload["amount"]),
                 "memo": payload.get("memo",""),
-            }); break
+            }; break
 
 def delete_row(table: str, id_value: str):
     if sb:
         try:
             sb.table(table).delete().eq("id", id_value).execute()
+            apply_local_write(table, deleted_ids=[id_value])
             load_data(); return
         except Exception:
             st.warning("Supabase 삭제 실패(오프라인?) → 임시 메모리에서만 삭제합니다.")
@@ -260,78 +1315,482 @@ def delete_row(table: str, id_value: str):
     elif table == "locations":
         st.session_state.locations = [r for r in st.session_state.locations if r["id"] != id_value]
 
-def ensure_order(list_key: str):
-    lst = st.session_state.get(list_key, [])
-    lst_sorted = sorted(lst, key=lambda x: x.get("order", 0))
-    changed = False
-    for i, x in enumerate(lst_sorted):
-        if x.get("order") != i: x["order"] = i; changed = True
-    st.session_state[list_key] = lst_sorted
-    if changed and sb:
-        table = "team_members" if list_key == "team_members" else "locations"
+# ─────────────────────────────────────────
+# 기록 관리 표 편집 — 페이지 단위로 여러 칸/행을 고친 뒤 한 번에 저장
+#   변경·추가 행은 upsert 배열 1회, 삭제 행은 delete().in_("id") 1회, 캐시는 apply_local_write 1회
+# ─────────────────────────────────────────
+GRID_COLUMNS = {"date": "날짜", "member": "팀원", "location": "업체", "amount": "금액(만원)", "memo": "메모"}
+
+def income_grid_frame(rows, ref: RefIndex) -> pd.DataFrame:
+    """세션행 → 표 편집용 DataFrame (id 는 숨김 열)."""
+    return pd.DataFrame({
+        "id": [r["id"] for r in rows],
+        "date": [pd.to_datetime(r["date"]).date() for r in rows],
+        "member": [ref.member_name.get(r["teamMemberId"], "") for r in rows],
+        "location": [ref.location_name.get(r["locationId"], "") for r in rows],
+        "amount": [float(r["amount"]) for r in rows],
+        "memo": [r.get("memo") or "" for r in rows],
+    }, columns=["id", *GRID_COLUMNS])
+
+def income_grid_diff(original, edited: pd.DataFrame, ref: RefIndex) -> tuple[list[dict], list[str], list[str]]:
+    """원래 페이지 행과 편집 결과 비교 → (upsert 할 세션행, 삭제 id, 오류 메시지)."""
+    before = {r["id"]: r for r in original}
+    rows = edited.to_dict("records")
+    present = {r.get("id") for r in rows}
+    upserts, errors = [], []
+    base = datetime.utcnow().timestamp()
+    for i, row in enumerate(rows):
+        rid = row.get("id") if isinstance(row.get("id"), str) and row.get("id") else None
+        old = before.get(rid)
+        if old is None and all(pd.isna(row.get(c)) or row.get(c) == "" for c in GRID_COLUMNS):
+            continue   # 비어 있는 새 행
+        member, location = str(row.get("member") or ""), str(row.get("location") or "")
+        # 이름이 그대로면 원래 id 유지 (동명이인/같은 이름 업체가 있어도 바뀌지 않도록)
+        if old and ref.member_name.get(old["teamMemberId"]) == member:
+            member_id = old["teamMemberId"]
+        else:
+            member_id = ref.member_id.get(member)
+        if old and ref.location_name.get(old["locationId"]) == location:
+            location_id = old["locationId"]
+        else:
+            location_id = ref.location_id.get(location)
+        d = pd.to_datetime(row.get("date"), errors="coerce")
+        amount = pd.to_numeric(row.get("amount"), errors="coerce")
+        memo = row.get("memo")
+
+        bad = [msg for cond, msg in (
+            (pd.isna(d), "날짜 형식 오류"),
+            (not member_id, "등록되지 않은 팀원"),
+            (not location_id, "등록되지 않은 업체"),
+            (pd.isna(amount) or amount <= 0, "금액은 0보다 큰 숫자"),
+        ) if cond]
+        if bad:
+            errors.append(f"{i + 1}행: " + " / ".join(bad))
+            continue
+        rec = {
+            "id": rid or f"inc_{base}_{i}", "date": d.strftime("%Y-%m-%d"),
+            "teamMemberId": member_id, "locationId": location_id,
+            "amount": float(amount), "memo": "" if memo is None or pd.isna(memo) else str(memo),
+        }
+        if old is None or any(rec[k] != old.get(k) for k in ("date", "teamMemberId", "locationId", "amount")) \
+                or rec["memo"] != (old.get("memo") or ""):
+            upserts.append(rec)
+    deleted = [rid for rid in before if rid not in present]
+    return upserts, deleted, errors
+
+def save_income_batch(upserts: list[dict], deleted_ids: list[str]) -> str | None:
+    """표 편집 결과 일괄 저장 (upsert 1회 + 삭제 1회) → 오류 메시지(성공이면 None)."""
+    if sb:
+        saved = []
         try:
-            for x in lst_sorted:
-                sb.table(table).update({"order": x["order"]}).eq("id", x["id"]).execute()
-        except Exception:
-            st.warning(f"{table} order 정규화 저장 실패(네트워크/권한)")
+            if upserts:
+                res = sb.table("incomes").upsert(
+                    [_income_to_db(r) for r in upserts], on_conflict="id", returning="representation"
+                ).execute()
+                saved = res.data or []
+            for part in id_chunks(deleted_ids):
+                sb.table("incomes").delete().in_("id", part).execute()
+        except Exception as e:
+            bump_version("incomes")
+            load_data()
+            return f"일괄 저장 실패: {e}"
+        if saved or deleted_ids:
+            apply_local_write("incomes", rows=saved, deleted_ids=deleted_ids)
+        if upserts and not saved:
+            bump_version("incomes")
+        load_data()
+        return None
+    by_id = {r["id"]: r for r in upserts}
+    recs = [by_id.pop(r["id"], r) for r in st.session_state.income_records if r["id"] not in set(deleted_ids)]
+    st.session_state.income_records = recs + list(by_id.values())
+    return None
 
-def swap_order(list_key: str, idx_a: int, idx_b: int):
-    lst = st.session_state[list_key]
-    a, b = lst[idx_a], lst[idx_b]
-    a["order"], b["order"] = b.get("order",0), a.get("order",0)
-    st.session_state[list_key] = sorted(lst, key=lambda x: x["order"])
+# ─────────────────────────────────────────
+# 일괄 작업 (선택 행 삭제 / 팀원·업체 변경 / 날짜·연월 이동)
+#   선택한 id 목록에 대한 집합 쿼리 1회(in_("id") 또는 RPC — sql/009_bulk_shift.sql) + 캐시 반영 1회
+# ─────────────────────────────────────────
+BULK_ACTIONS = {"delete": "삭제", "member": "팀원 변경", "location": "업체 변경", "shift": "날짜/연월 이동"}
+BULK_ID_CHUNK = 300   # in_("id", ...) 는 URL 에 실리므로 이 개수씩 나눠 보냄 (캐시 반영은 마지막에 1회)
+
+def id_chunks(ids) -> Iterator[list]:
+    ids = list(ids)
+    for i in range(0, len(ids), BULK_ID_CHUNK):
+        yield ids[i:i + BULK_ID_CHUNK]
+
+def shift_ym(ym: str, months: int) -> str:
+    y, m = int(str(ym)[:4]), int(str(ym)[5:7])
+    n = y * 12 + (m - 1) + int(months)
+    return f"{n // 12:04d}-{n % 12 + 1:02d}"
+
+def bulk_income_action(rows: list[dict], action: str, value=None) -> str | None:
+    """선택한 수입(세션행)에 일괄 작업 → 오류 메시지(성공이면 None).
+    action: delete | member(팀원 id) | location(업체 id) | shift(이동 일수)"""
+    ids = [r["id"] for r in rows]
+    if not ids:
+        return None
+    if action == "delete":
+        return save_income_batch([], ids)
+    if action == "shift":
+        if sb:
+            try:
+                res = sb.rpc("incomes_shift_date", {"p_ids": ids, "p_days": int(value)}).execute()
+                _apply_write_result("incomes", res)
+                load_data()
+                return None
+            except Exception:
+                pass   # RPC 미설치 → 새 날짜로 upsert 1회
+        days = pd.Timedelta(days=int(value))
+        return save_income_batch(
+            [{**r, "date": (pd.to_datetime(r["date"]) + days).strftime("%Y-%m-%d")} for r in rows], [])
+    key, col = {"member": ("teamMemberId", "team_member_id"), "location": ("locationId", "location_id")}[action]
     if sb:
-        table = "team_members" if list_key == "team_members" else "locations"
+        saved = []
         try:
-            sb.table(table).update({"order": a["order"]}).eq("id", a["id"]).execute()
-            sb.table(table).update({"order": b["order"]}).eq("id", b["id"]).execute()
-        except Exception:
-            st.warning("순서 저장 실패(네트워크/권한)")
-    load_data(); ensure_order(list_key); st.rerun()
+            for part in id_chunks(ids):
+                saved += sb.table("incomes").update({col: value}, returning="representation").in_("id", part).execute().data or []
+        except Exception as e:
+            bump_version("incomes")
+            load_data()
+            return f"일괄 변경 실패: {e}"
+        if saved:
+            apply_local_write("incomes", rows=saved)
+        else:
+            bump_version("incomes")
+        load_data()
+        return None
+    return save_income_batch([{**r, key: value} for r in rows], [])
+
+def bulk_controls(key: str, selected: list[dict], ref: RefIndex, shift_unit: str, run):
+    """선택 행 일괄 작업 UI — 작업/값 선택 → 확인 1회 → run(rows, action, value) 1회(오류 메시지|None)."""
+    pending_key = f"{key}_pending"
+    pending = st.session_state.get(pending_key)
+    if pending:
+        with st.container(border=True):
+            st.error(f"{len(pending['rows'])}건 {pending['label']} — 실행하시겠습니까?"
+                     + (" (되돌릴 수 없음)" if pending["action"] == "delete" else ""))
+            c1, c2 = st.columns(2)
+            done = False
+            with c1:
+                if st.button("✅ 확정", type="primary", key=f"{key}_confirm"):
+                    err = run(pending["rows"], pending["action"], pending["value"])
+                    if err:
+                        st.error(err)
+                    else:
+                        st.session_state[pending_key] = None
+                        done = True
+            with c2:
+                if st.button("❌ 취소", key=f"{key}_cancel"):
+                    st.session_state[pending_key] = None
+                    done = True
+            if done:
+                st.rerun()
+        return
+    if not selected:
+        st.caption("표에서 행을 선택하면 일괄 작업(삭제/팀원·업체 변경/이동)을 할 수 있습니다.")
+        return
+
+    c1, c2, c3 = st.columns([2, 3, 2])
+    with c1:
+        action = st.selectbox("일괄 작업", list(BULK_ACTIONS), format_func=BULK_ACTIONS.get, key=f"{key}_action")
+    value, label = None, BULK_ACTIONS[action]
+    with c2:
+        if action == "member":
+            name = st.selectbox("새 팀원", [m["name"] for m in ref.members if m.get("name")], key=f"{key}_member")
+            value, label = ref.member_id.get(name), f"팀원 → {name}"
+        elif action == "location":
+            name = st.selectbox("새 업체", list(ref.location_id), key=f"{key}_location")
+            value, label = ref.location_id.get(name), f"업체 → {name}"
+        elif action == "shift":
+            value = int(st.number_input(f"이동 ({shift_unit}, 음수 = 이전)", value=1, step=1, key=f"{key}_shift"))
+            label = f"{value:+d}{shift_unit} 이동"
+    with c3:
+        ask = st.button(f"선택 {len(selected)}건 실행", key=f"{key}_ask", disabled=(action != "delete" and not value))
+    if ask:
+        st.session_state[pending_key] = {"rows": list(selected), "action": action, "value": value, "label": label}
+        st.rerun()
 
 # ─────────────────────────────────────────
-# Invoices (계산서) – snake_case 테이블 전용  ← ① 추가 블록 시작
+# 수입 일괄 등록 (CSV/XLSX) — 이름→id 해석·검증은 벡터 연산, INSERT는 N건씩 배열 1회
 # ─────────────────────────────────────────
-def load_invoices(year: int | None = None):
-    """
-    Supabase invoices → st.session_state.invoice_records 로딩
-    (수입/팀원/업체 로직과 분리, incomes에는 영향 X)
-    """
-    st.session_state.setdefault("invoice_records", [])
+IMPORT_CHUNK_SIZE = 500
+IMPORT_COLUMNS = {  # 업로드 컬럼명 → 내부 이름 (기록 관리 CSV와 같은 한글 헤더 + 영문 별칭)
+    "날짜": "date", "발생일": "date", "date": "date",
+    "팀원": "member", "member": "member",
+    "업체": "location", "location": "location",
+    "금액(만원)": "amount", "금액": "amount", "amount": "amount",
+    "메모": "memo", "memo": "memo",
+}
+
+def import_row_ids(uploaded, index) -> list[str]:
+    """업로드 파일 내용 해시 + 파일 행 번호로 만든 고정 id (같은 파일을 다시 등록해도 같은 id)."""
+    digest = hashlib.sha1(uploaded.getvalue()).hexdigest()[:12]
+    return [f"inc_imp_{digest}_{i}" for i in index]
+
+def read_import_file(uploaded) -> pd.DataFrame:
+    name = (getattr(uploaded, "name", "") or "").lower()
+    if name.endswith(".xlsx"):
+        return pd.read_excel(uploaded, dtype=object)
+    return pd.read_csv(uploaded, dtype=object, encoding="utf-8-sig")
+
+def prepare_income_import(raw: pd.DataFrame, ref: RefIndex) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """업로드 표 → (등록 가능 행[세션 형식 컬럼], 오류 행[원본 + 오류 사유])."""
+    df = raw.rename(columns=lambda c: IMPORT_COLUMNS.get(str(c).strip(), str(c).strip()))
+    dup = df.columns[df.columns.duplicated()].unique()
+    if len(dup):
+        names = {v: [str(c).strip() for c in raw.columns if IMPORT_COLUMNS.get(str(c).strip(), str(c).strip()) == v]
+                 for v in dup}
+        raise ValueError("같은 항목의 컬럼이 여러 개 있습니다: "
+                         + ", ".join("/".join(n) for n in names.values()) + " — 하나만 남겨 주세요.")
+    missing = [c for c in ("date", "member", "location", "amount") if c not in df.columns]
+    if missing:
+        raise ValueError(f"필수 컬럼이 없습니다: {', '.join(missing)} (날짜/팀원/업체/금액(만원))")
+
+    date = pd.to_datetime(df["date"], errors="coerce")
+    member = df["member"].fillna("").astype(str).str.strip()
+    location = df["location"].fillna("").astype(str).str.strip()
+    amount = pd.to_numeric(df["amount"].fillna("").astype(str).str.replace(",", "").str.strip(), errors="coerce")
+    member_id = member.map(ref.member_id)
+    location_id = location.map(ref.location_id)
+
+    err = pd.Series("", index=df.index, dtype=object)
+    for mask, msg in (
+        (date.isna(), "날짜 형식 오류"),
+        (member_id.isna(), "등록되지 않은 팀원"),
+        (location_id.isna(), "등록되지 않은 업체"),
+        (~(amount > 0), "금액은 0보다 큰 숫자"),
+    ):
+        err = err.mask(mask, err + msg + " / ")
+    err = err.str.rstrip(" /")
+    ok = err == ""
+
+    errors = pd.DataFrame({
+        "행": df.index + 2,  # 헤더 다음 줄부터 (엑셀 행 번호)
+        "날짜": df["date"], "팀원": member, "업체": location, "금액(만원)": df["amount"], "오류": err,
+    })[~ok]
+    valid = pd.DataFrame({
+        "date": date.dt.strftime("%Y-%m-%d"),
+        "teamMemberId": member_id,
+        "locationId": location_id,
+        "amount": amount.astype(float),
+        "memo": df["memo"].fillna("").astype(str) if "memo" in df.columns else "",
+    })[ok]
+    return valid, errors
+
+def bulk_insert_incomes(rows: list[dict], chunk_size: int = IMPORT_CHUNK_SIZE) -> tuple[int, int, str | None]:
+    """rows(세션 형식, id 포함)를 chunk_size 건씩 배열 upsert(on_conflict=id, 중복 무시) 후 캐시에 한 번에 반영.
+    (등록 건수, 건너뛴 건수, 오류) — id 가 파일 행마다 고정이므로(import_row_ids) 중간 실패 후 다시 실행해도
+    중복되지 않고, 이미 있는 행(그사이 수정된 행 포함)은 덮어쓰지 않고 건너뜁니다."""
     if not sb:
-        return
+        have = {r["id"] for r in st.session_state.income_records}
+        new = [r for r in rows if r["id"] not in have]
+        st.session_state.income_records = st.session_state.income_records + new
+        return (len(new), len(rows) - len(new), None)
+    inserted, sent, err = [], 0, None
     try:
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            res = sb.table("incomes").upsert(
+                [_income_to_db(r) for r in chunk], on_conflict="id", ignore_duplicates=True,
+                returning="representation",
+            ).execute()
+            inserted.extend(res.data or [])
+            sent += len(chunk)
+    except Exception as e:
+        err = f"{len(inserted)}건 등록 후 실패: {e} — 다시 누르면 이어서 등록합니다(이미 등록된 행은 건너뜀)."
+    if inserted:
+        apply_local_write("incomes", rows=inserted)
+    else:
+        bump_version("incomes")
+    load_data()
+    return (len(inserted), sent - len(inserted), err)
+
+def _order_payload(table: str, x: dict) -> dict:
+    # upsert의 INSERT 후보 행도 NOT NULL 검사를 받으므로 필수 컬럼을 함께 보냄
+    if table == "locations":
+        return {"id": x["id"], "name": x["name"], "category": x.get("category", ""), "order": x["order"]}
+    return {"id": x["id"], "name": x["name"], "order": x["order"]}
+
+def save_order(list_key: str, ordered: list[dict], warn: str = "순서 저장 실패(네트워크/권한)") -> bool:
+    """ordered 순서대로 order=0..n-1 을 매기고, 바뀐 행만 bulk upsert 1회로 저장합니다.
+    세션 목록과 공유 캐시는 전체 재조회 없이 즉시 갱신됩니다."""
+    table = "team_members" if list_key == "team_members" else "locations"
+    new_list, changed = [], []
+    for i, x in enumerate(ordered):
+        if x.get("order") != i:
+            x = {**x, "order": i}
+            changed.append(x)
+        new_list.append(x)
+    st.session_state[list_key] = new_list
+    if changed and sb:
+        try:
+            res = sb.table(table).upsert(
+                [_order_payload(table, x) for x in changed], on_conflict="id", returning="representation"
+            ).execute()
+            _apply_write_result(table, res)
+        except Exception:
+            st.warning(warn)
+            return False
+    return True
+
+def ensure_order(list_key: str):
+    lst = st.session_state.get(list_key, [])
+    save_order(list_key, sorted(lst, key=lambda x: x.get("order", 0)),
+               warn=f"{list_key} order 정규화 저장 실패(네트워크/권한)")
+
+def swap_order(list_key: str, idx_a: int, idx_b: int):
+    lst = list(st.session_state[list_key])
+    lst[idx_a], lst[idx_b] = lst[idx_b], lst[idx_a]
+    save_order(list_key, lst); st.rerun()
+
+def move_order(list_key: str, idx_from: int, idx_to: int):
+    """idx_from 항목을 idx_to 위치로 옮깁니다 (사이 항목은 한 칸씩 밀림)."""
+    lst = list(st.session_state[list_key])
+    lst.insert(idx_to, lst.pop(idx_from))
+    save_order(list_key, lst); st.rerun()
+
+# ─────────────────────────────────────────
+# Invoices (계산서) – snake_case 테이블 전용  ← ① 추가 블록 시작
+# ─────────────────────────────────────────
+INVOICE_YEAR_CACHE_MAX = 4   # 공유 캐시에 동시에 두는 계산서 연도 수 (LRU)
+
+def _invoice_from_db(r: dict) -> dict:
+    return {
+        "id":           r.get("id"),
+        "ym":           r.get("ym"),
+        "teamMemberId": r.get("team_member_id"),
+        "locationId":   r.get("location_id"),
+        "insType":      r.get("ins_type", ""),
+        "issueAmount":  float(r.get("issue_amount") or 0),
+        "taxAmount":    float(r.get("tax_amount") or 0),
+        "createdAt":    r.get("created_at"),
+    }
+
+def _invoice_to_db(r: dict) -> dict:
+    return {
+        "id":           r.get("id"),
+        "ym":           r.get("ym"),
+        "team_member_id": r.get("teamMemberId"),
+        "location_id":  r.get("locationId"),
+        "ins_type":     r.get("insType", ""),
+        "issue_amount": float(r.get("issueAmount", 0) or 0),
+        "tax_amount":   float(r.get("taxAmount", 0) or 0),
+    }
+
+def _sorted_invoices(rows) -> tuple:
+    """ym desc, created_at desc, id — _fetch_invoices 의 DB 정렬과 동일."""
+    rows = sorted(rows, key=lambda r: str(r.get("id") or ""))
+    return tuple(sorted(rows, key=lambda r: (str(r.get("ym") or ""), str(r.get("createdAt") or "")), reverse=True))
+
+def _fetch_invoices(year: int | None) -> tuple:
+    def make_query(count=None):
         q = sb.table("invoices").select(
-            "id, ym, team_member_id, location_id, ins_type, issue_amount, tax_amount, created_at"
+            "id, ym, team_member_id, location_id, ins_type, issue_amount, tax_amount, created_at",
+            count=count,
         )
         if year:
             q = q.like("ym", f"{year}-%")
+        return q.order("ym", desc=True).order("created_at", desc=True).order("id")
+    return tuple(_invoice_from_db(r) for r in fetch_all_parallel(make_query))
+
+def invoice_year(year: int) -> tuple:
+    """year 계산서 목록 (연도별 공유 캐시, 최근 INVOICE_YEAR_CACHE_MAX개 연도 LRU — 제자리 수정 금지).
+    (연도, 데이터 버전)당 한 번만 조회하며, 여러 탭이 서로 다른 연도를 봐도 서로 밀어내지 않습니다."""
+    if sb:
         try:
-            q = q.order("ym", desc=True).order("created_at", desc=True)
-        except Exception:
-            pass
-        rows = []
-        _offset = 0
-        _step = 1000
-        while True:
-            _res = q.range(_offset, _offset + _step - 1).execute()
-            _chunk = (_res.data or [])
-            rows.extend(_chunk)
-            if len(_chunk) < _step:
-                break
-            _offset += _step
-        st.session_state.invoice_records = [{
-            "id":           r.get("id"),
-            "ym":           r.get("ym"),
-            "teamMemberId": r.get("team_member_id"),
-            "locationId":   r.get("location_id"),
-            "insType":      r.get("ins_type", ""),
-            "issueAmount":  float(r.get("issue_amount") or 0),
-            "taxAmount":    float(r.get("tax_amount") or 0),
-            "createdAt":    r.get("created_at"),
-        } for r in rows]
-    except Exception as e:
-        st.warning(f"계산서 로드 실패: {e}")
+            return _invoice_year_shared(year)
+        except Exception as e:
+            st.warning(f"계산서 로드 실패: {e}")
+            return ()
+    return tuple(r for r in st.session_state.get("invoice_records", []) if str(r.get("ym") or "").startswith(f"{year}-"))
+
+def _invoice_year_shared(year: int) -> tuple:
+    """공유 캐시 조회 — 실패는 그대로 전파(빈 결과를 캐시하지 않도록 경고는 화면 쪽에서)."""
+    return shared_get(("invoices", year), "invoices", lambda: _fetch_invoices(year),
+                      lru=("invoices", INVOICE_YEAR_CACHE_MAX))
+
+def apply_invoice_write(rows=(), deleted_ids=()):
+    """계산서 쓰기 결과(DB행 rows / 삭제 id)를 캐시된 모든 연도에 반영(write-through) 후 버전 갱신.
+    재조회 없이 새 버전 스냅샷으로 교체하므로 다음 렌더에서 다시 받지 않습니다."""
+    store = _shared_store()
+    changed = {r["id"]: _invoice_from_db(r) for r in rows if r.get("id")}
+    drop = set(deleted_ids) | set(changed)
+    bump_version("invoices")
+    ver = data_version("invoices")
+    for key in [k for k in list(store["entries"]) if k[0] == "invoices" and len(k) == 2]:
+        with _key_lock(store, key):
+            ent = store["entries"].get(key)
+            if ent is None:
+                continue
+            year = key[1]
+            kept = [r for r in ent["value"] if r.get("id") not in drop]
+            kept += [r for r in changed.values() if not year or str(r.get("ym") or "").startswith(f"{year}-")]
+            store["entries"][key] = {"version": ver, "at": time.monotonic(), "value": _sorted_invoices(kept)}
+    note_invoice_yms(*(r.get("ym") for r in changed.values()))
+
+class InvoiceStats:
+    """연도별 계산서 집계 — (월, 팀원 코드, 업체 코드)별 발행/세준금 합계 (데이터 버전당 1회 생성·공유).
+
+    ym 문자열은 생성 시 한 번만 벡터 파싱하고, 화면의 팀 전체/팀원/업체 표는 이 그룹 표를
+    다시 묶기만 합니다(행 수가 아니라 그룹 수에 비례).
+    """
+
+    def __init__(self, grouped: pd.DataFrame):
+        self.grouped = grouped   # month, member_code, member, location, issue, tax
+
+    @classmethod
+    def build(cls, records, year: int, ref: RefIndex) -> "InvoiceStats":
+        raw = pd.DataFrame(list(records), columns=["ym", "teamMemberId", "locationId", "issueAmount", "taxAmount"])
+        ym = raw["ym"].astype(str).str.extract(r"^(\d{4})-(\d{1,2})")
+        keep = (pd.to_numeric(ym[0], errors="coerce") == year).to_numpy()
+        raw = raw[keep]
+        typed = pd.DataFrame({
+            "month": pd.to_numeric(ym[1][keep], errors="coerce").fillna(0).astype(np.int16).to_numpy(),
+            "member_code": ref.member_codes(raw["teamMemberId"]),
+            "location_code": ref.location_codes(raw["locationId"]),
+            "issue": pd.to_numeric(raw["issueAmount"], errors="coerce").fillna(0.0).to_numpy(np.float64),
+            "tax": pd.to_numeric(raw["taxAmount"], errors="coerce").fillna(0.0).to_numpy(np.float64),
+        })
+        g = typed.groupby(["month", "member_code", "location_code"], sort=True)[["issue", "tax"]].sum().reset_index()
+        member = ref.member_names[g["member_code"].to_numpy()]
+        location = ref.location_names[g["location_code"].to_numpy()]
+        g["member"] = np.where(member == "", "(이름없음)", member)
+        g["location"] = np.where(location == "", "(업체없음)", location)
+        return cls(g[["month", "member_code", "member", "location", "issue", "tax"]])
+
+    def months(self) -> list[int]:
+        return sorted(int(m) for m in self.grouped["month"].unique() if m)
+
+    def select(self, month: int | None = None, member_code: int | None = None) -> pd.DataFrame:
+        g = self.grouped
+        if month is not None:
+            g = g[g["month"] == month]
+        if member_code is not None:
+            g = g[g["member_code"] == member_code]
+        return g
+
+    @staticmethod
+    def table(g: pd.DataFrame, by: str, label: str) -> pd.DataFrame:
+        """by(member/location)별 발행금액·세준금·비율 표 (발행금액 내림차순)."""
+        t = g.groupby(by, sort=False)[["issue", "tax"]].sum()
+        ratio = np.divide(t["tax"] * 100.0, t["issue"], out=np.zeros(len(t)), where=t["issue"].to_numpy() != 0)
+        out = pd.DataFrame({
+            label: t.index, "발행금액(만원)": t["issue"].to_numpy(),
+            "세준금(만원)": t["tax"].to_numpy(), "세준금비율(%)": ratio,
+        })
+        return out.sort_values("발행금액(만원)", ascending=False).reset_index(drop=True)
+
+def invoice_stats(year: int) -> InvoiceStats:
+    """year 계산서 집계 (계산서/팀원/업체 버전당 1회 생성·공유)."""
+    if sb:
+        try:
+            return shared_get(
+                ("invoice_stats", year), ("invoices", "team_members", "locations"),
+                lambda: InvoiceStats.build(_invoice_year_shared(year), year, ref_index()),
+                lru=("invoice_stats", INVOICE_YEAR_CACHE_MAX),
+            )
+        except Exception as e:
+            st.warning(f"계산서 로드 실패: {e}")
+    return InvoiceStats.build(st.session_state.get("invoice_records", []) or [], year, ref_index())
 
 def invoice_insert(payload: Dict[str, Any]) -> tuple[bool, str | None]:
     """
@@ -359,12 +1818,12 @@ def invoice_insert(payload: Dict[str, Any]) -> tuple[bool, str | None]:
                   "ins_type":       payload.get("insType", ""),
                   "issue_amount":   float(payload.get("issueAmount", 0) or 0),
                   "tax_amount":     float(payload.get("taxAmount",   0) or 0),
-              })
-              .select("id")
+              }, returning="representation")
               .execute()
         )
         if not res.data:
             return (False, "INSERT 응답이 비었습니다(RLS/권한/정책 문제 가능).")
+        apply_invoice_write(rows=res.data)
         return (True, None)
     except Exception as e:
         return (False, f"계산서 INSERT 실패: {e}")
@@ -377,14 +1836,19 @@ def invoice_update(id_value: str, payload: Dict[str, Any]) -> tuple[bool, str |
                 break
         return (True, None)
     try:
-        sb.table("invoices").update({
+        res = sb.table("invoices").update({
             "ym":             payload["ym"],
             "team_member_id": payload["teamMemberId"],
             "location_id":    payload["locationId"],
             "ins_type":       payload.get("insType", ""),
             "issue_amount":   float(payload.get("issueAmount", 0) or 0),
             "tax_amount":     float(payload.get("taxAmount",   0) or 0),
-        }).eq("id", id_value).execute()
+        }, returning="representation").eq("id", id_value).execute()
+        if res.data:
+            apply_invoice_write(rows=res.data)
+        else:
+            bump_version("invoices")
+            note_invoice_yms(payload["ym"])
         return (True, None)
     except Exception as e:
         return (False, f"계산서 UPDATE 실패: {e}")
@@ -397,6 +1861,8 @@ def invoice_delete(id_value: str) -> tuple[bool, str | None]:
         return (True, None)
     try:
         sb.table("invoices").delete().eq("id", id_value).execute()
+        apply_invoice_write(deleted_ids=[id_value])
+        bump_version("invoice_years")
     except Exception as e:
         return (False, f"계산서 삭제 실패: {e}")
     st.session_state["invoice_records"] = [
@@ -404,15 +1870,113 @@ def invoice_delete(id_value: str) -> tuple[bool, str | None]:
     ]
     return (True, None)
 
-# 기존 탭6 코드 호환용 별칭 (탭6에서 reload_invoice_records(...)를 호출하던 경우)
-def reload_invoice_records(year: int | None = None):
-    return load_invoices(year)
+def bulk_invoice_action(rows: list[dict], action: str, value=None) -> tuple[bool, str | None]:
+    """선택한 계산서에 일괄 작업 (집합 쿼리 1회 + 캐시 반영 1회).
+    action: delete | member(팀원 id) | location(업체 id) | shift(이동 개월 수)"""
+    ids = [r["id"] for r in rows if r.get("id")]
+    if not ids:
+        return (True, None)
+    key, col = {"member": ("teamMemberId", "team_member_id"),
+                "location": ("locationId", "location_id")}.get(action, (None, None))
+    if not sb:
+        picked = set(ids)
+        recs = []
+        for r in st.session_state.get("invoice_records", []):
+            if r.get("id") in picked:
+                if action == "delete":
+                    continue
+                r = {**r, "ym": shift_ym(r["ym"], value)} if action == "shift" else {**r, key: value}
+            recs.append(r)
+        st.session_state["invoice_records"] = recs
+        return (True, None)
+    try:
+        if action == "delete":
+            for part in id_chunks(ids):
+                sb.table("invoices").delete().in_("id", part).execute()
+            apply_invoice_write(deleted_ids=ids)
+            bump_version("invoice_years")
+        elif action == "shift":
+            try:
+                res = sb.rpc("invoices_shift_ym", {"p_ids": ids, "p_months": int(value)}).execute()
+            except Exception:   # RPC 미설치 → 새 ym 으로 upsert 1회
+                res = sb.table("invoices").upsert(
+                    [_invoice_to_db({**r, "ym": shift_ym(r["ym"], value)}) for r in rows if r.get("id")],
+                    on_conflict="id", returning="representation",
+                ).execute()
+            apply_invoice_write(rows=res.data or [])
+            bump_version("invoice_years")   # 옮겨 간 뒤 빈 연도가 생길 수 있음
+        else:
+            saved = []
+            for part in id_chunks(ids):
+                saved += sb.table("invoices").update({col: value}, returning="representation").in_("id", part).execute().data or []
+            apply_invoice_write(rows=saved)
+    except Exception as e:
+        bump_version("invoices")
+        return (False, f"계산서 일괄 {BULK_ACTIONS.get(action, action)} 실패: {e}")
+    return (True, None)
 
 
+# 계산서 연도 인덱스 (연도 목록 + 최신 ym) — invoice_years() RPC(sql/005_invoice_years.sql)로
+# 행 데이터 없이 한 번 조회해 공유 캐시에 두고, 계산서 쓰기가 제자리에서 갱신합니다(write-through).
+# 버전 키는 "invoice_years" — 일반 쓰기는 무효화하지 않고, 삭제만 무효화(그 연도의 마지막 건일 수 있음).
+INVOICE_YEAR_INDEX_KEY = ("invoice_year_index",)
+
+def _fetch_invoice_year_index() -> dict:
+    years: set[int] = set()
+    latest = None
+    try:
+        for r in (sb.rpc("invoice_years").execute().data or []):
+            years.add(int(r["year"]))
+            latest = max(latest or "", str(r.get("latest_ym") or "")) or None
+    except Exception:
+        # RPC 미설치 → 최소/최대 ym 으로 범위 추정
+        rmin = sb.table("invoices").select("ym").order("ym").limit(1).execute().data or []
+        rmax = sb.table("invoices").select("ym").order("ym", desc=True).limit(1).execute().data or []
+        if rmin and rmax:
+            try:
+                years.update(range(int(str(rmin[0]["ym"])[:4]), int(str(rmax[0]["ym"])[:4]) + 1))
+                latest = str(rmax[0]["ym"])
+            except Exception:
+                pass
+    return {"years": tuple(sorted(years)), "latest_ym": latest}
+
+def invoice_year_index() -> dict:
+    """{"years": (연도...), "latest_ym": "YYYY-MM" | None} — 공유 스냅샷(제자리 수정 금지)."""
+    if sb:
+        try:
+            return shared_get(INVOICE_YEAR_INDEX_KEY, "invoice_years", _fetch_invoice_year_index)
+        except Exception:
+            pass
+    return {"years": (), "latest_ym": None}
+
+def note_invoice_yms(*yms: str):
+    """계산서 추가/수정 후 연도 인덱스에 ym 을 반영 (재조회 없이 캐시 항목만 교체)."""
+    store = _shared_store()
+    with _key_lock(store, INVOICE_YEAR_INDEX_KEY):
+        ent = store["entries"].get(INVOICE_YEAR_INDEX_KEY)
+        if not ent or ent["version"] != data_version("invoice_years"):
+            return
+        years = set(ent["value"]["years"])
+        latest = ent["value"]["latest_ym"]
+        for ym in yms:
+            ym = str(ym or "")
+            if len(ym) >= 4 and ym[:4].isdigit():
+                years.add(int(ym[:4]))
+                latest = max(latest or "", ym)
+        ent["value"] = {"years": tuple(sorted(years)), "latest_ym": latest}
+
+def latest_invoice_year(default: int) -> int:
+    """데이터가 있는 최신 계산서 연도 (없으면 default)."""
+    latest = invoice_year_index()["latest_ym"]
+    try:
+        return int(str(latest)[:4]) if latest else default
+    except Exception:
+        return default
+
 def get_invoice_year_options() -> list[int]:
     """계산서(invoices) 연도 선택 옵션을 생성합니다.
 
-    - DB(Supabase)가 있으면 invoices.ym 기준으로 최소/최대 연도를 조회해 범위를 생성
+    - 연도 인덱스(공유 캐시)의 최소~최대 연도 범위
     - 세션(invoice_records)에서 파싱 가능한 연도도 포함
     - 항상 올해/작년을 포함(신규/소급 입력 편의)
     """
@@ -437,23 +2001,10 @@ def get_invoice_year_options() -> list[int]:
     except Exception:
         pass
 
-    # DB가 있으면 invoices 테이블에서 최소/최대 연도 범위 추가
-    if sb:
-        def _parse_year(v):
-            try:
-                s = str(v)
-                return int(s[:4]) if len(s) >= 4 else None
-            except Exception:
-                return None
-        try:
-            rmin = sb.table("invoices").select("ym").order("ym", desc=False).limit(1).execute()
-            rmax = sb.table("invoices").select("ym").order("ym", desc=True).limit(1).execute()
-            min_y = _parse_year((rmin.data or [{}])[0].get("ym")) if (rmin and hasattr(rmin, "data")) else None
-            max_y = _parse_year((rmax.data or [{}])[0].get("ym")) if (rmax and hasattr(rmax, "data")) else None
-            if isinstance(min_y, int) and isinstance(max_y, int) and 1900 <= min_y <= max_y <= 3000:
-                years.update(range(min_y, max_y + 1))
-        except Exception:
-            pass
+    # 연도 인덱스(캐시)의 최소~최대 범위 추가
+    idx_years = invoice_year_index()["years"]
+    if idx_years:
+        years.update(range(idx_years[0], idx_years[-1] + 1))
 
     out = sorted({y for y in years if isinstance(y, int) and 1900 <= y <= 3000})
     return out
@@ -465,14 +2016,14 @@ def get_invoice_year_options() -> list[int]:
 # Bootstrapping
 # ============================
 st.title("팀 수입 관리")
-if sb: st.success("✅ Supabase 연결됨 (팀 공동 사용 가능)")
+if STORAGE_KIND == "sqlite": st.info(f"💾 로컬 SQLite 저장소 사용 중 ({sb.path})")
+elif sb: st.success("✅ Supabase 연결됨 (팀 공동 사용 가능)")
 else: st.info("🧪 Supabase 미설정 — 세션 메모리로 동작합니다. 팀 사용은 Secrets에 SUPABASE 설정하세요.")
 
 load_data(); ensure_order("team_members"); ensure_order("locations")
 
-# ← ② 추가 두 줄 (계산서 세션키 보장 + 초기 로드)
+# 계산서 세션키 보장 (오프라인 저장용 — 온라인은 연도별 공유 캐시 invoice_year() 사용, 필요할 때 로드)
 st.session_state.setdefault("invoice_records", [])
-load_invoices(NOW_KST.year)
 
 # ============================
 # Global option lists (탭 공용) — NameError 방지
@@ -482,6 +2033,9 @@ locations_all = [l.get("name") for l in (st.session_state.get("locations") or []
 st.session_state["members_all"] = members_all
 st.session_state["locations_all"] = locations_all
 
+# 팀원/업체 조회 인덱스 (탭 공용)
+ref = ref_index()
+
 
 st.session_state.setdefault("confirm_target", None)
 st.session_state.setdefault("confirm_action", None)
@@ -489,7 +2043,54 @@ st.session_state.setdefault("edit_income_id", None)
 st.session_state.setdefault("confirm_delete_income_id", None)
 st.session_state.setdefault("records_page", 0)
 
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["입력", "통계", "정산", "계산서", "기록 관리", "설정"])
+# ============================
+# 섹션 선택 (선택한 섹션만 실행)
+# ============================
+# st.tabs 는 보이지 않는 탭 본문까지 매 rerun 실행하므로, 상단 선택 컨트롤로 현재 섹션 하나만 실행합니다.
+# 실행되지 않은 섹션의 위젯 상태는 Streamlit이 실행 끝에 지우므로, 섹션별 키 접두어로 값을 다시 써서 유지합니다.
+SECTIONS = ["입력", "통계", "정산", "계산서", "기록 관리", "설정"]
+SECTION_STATE_PREFIXES = {   # 섹션 → 그 섹션 위젯 키 접두어 (새 위젯도 접두어만 맞추면 자동 유지)
+    "입력": ("in_",),
+    "통계": ("stat_", "mem_", "member_day_", "loc_all_", "loc_each_", "t2_inv_"),
+    "정산": ("settle_", "inp_"),
+    "계산서": ("inv_", "edit_inv_"),
+    "기록 관리": ("records_", "edit_any_"),
+    "설정": ("member_move_", "loc_move_", "loc_cat_view"),
+}
+
+def section_nav() -> str:
+    """현재 섹션 (segmented_control 이 없는 Streamlit 에서는 가로 radio)."""
+    ss = st.session_state
+    ss.setdefault("nav_section", SECTIONS[0])
+    if hasattr(st, "segmented_control"):
+        picked = st.segmented_control("메뉴", SECTIONS, key="nav_section", label_visibility="collapsed")
+    else:
+        picked = st.radio("메뉴", SECTIONS, key="nav_section", horizontal=True, label_visibility="collapsed")
+    if picked:                      # segmented_control 은 선택 해제(None)가 가능 → 직전 섹션 유지
+        ss["nav_last"] = picked
+    return ss.get("nav_last", SECTIONS[0])
+
+# 버튼/다운로드 버튼 키는 이 접미어로 끝납니다(session_state 로 값을 쓰면 오류 → 다시 쓰지 않음).
+# 체크박스/토글(bool)은 그대로 유지 대상입니다.
+SECTION_BUTTON_SUFFIXES = ("_go", "_dl", "_ask", "_confirm", "_cancel", "_save", "_submit", "_btn",
+                           "_add", "_prev", "_next", "_reopen", "_close", "_conf", "_open")
+
+def _keepable(key: str, value) -> bool:
+    # 버튼·표 선택/편집 상태(dict)·업로드(None/파일)는 session_state 로 값을 쓸 수 없으므로 제외
+    if key.endswith(SECTION_BUTTON_SUFFIXES):
+        return False
+    return value is not None and not isinstance(value, dict) and not hasattr(value, "getvalue")
+
+def keep_section_state(active: str):
+    """다른 섹션의 위젯 값을 사용자 값으로 다시 써서, 실행되지 않는 동안에도 지워지지 않게 합니다."""
+    ss = st.session_state
+    prefixes = tuple(p for section, ps in SECTION_STATE_PREFIXES.items() if section != active for p in ps)
+    for k in [k for k in list(ss.keys()) if isinstance(k, str) and k.startswith(prefixes)]:
+        if _keepable(k, ss[k]):
+            ss[k] = ss[k]
+
+section = section_nav()
+keep_section_state(section)
 
 # ============================
 # Tab 1: 수입 입력 (최종 완성 - 오늘 기본 + 다른 날짜 입력 가능)
@@ -500,7 +2101,7 @@ from zoneinfo import ZoneInfo
 KST = ZoneInfo("Asia/Seoul")
 NOW_KST = datetime.now(KST)
 
-with tab1:
+if section == "입력":
     st.markdown('<div class="block">', unsafe_allow_html=True)
     st.subheader("수입 입력")
 
@@ -514,30 +2115,32 @@ with tab1:
         d = st.date_input(
             "발생일",
             value=today_kst,
-            format="YYYY-MM-DD"
+            format="YYYY-MM-DD",
+            key="in_date",
         )
 
         # 팀원 선택
         member_options = {m["name"]: m["id"] for m in st.session_state.team_members}
         member_name = st.selectbox(
             "팀원",
-            list(member_options.keys()) if member_options else ["(팀원을 먼저 추가하세요)"]
+            list(member_options.keys()) if member_options else ["(팀원을 먼저 추가하세요)"],
+            key="in_member",
         )
         member_id = member_options.get(member_name)
 
     with col2:
         # 보험/비보험 분류
-        cat = st.radio("업체 분류", ["보험", "비보험"], horizontal=True)
-        filtered_locations = [l for l in st.session_state.locations if l["category"] == cat]
+        cat = st.radio("업체 분류", ["보험", "비보험"], horizontal=True, key="in_cat")
+        filtered_locations = ref.locations_in(cat)
         loc_options = {l["name"]: l["id"] for l in filtered_locations}
 
         if not loc_options:
             st.warning(f"'{cat}' 분류 업체가 없습니다. 설정 탭에서 추가하세요.")
-        loc_name = st.selectbox("업체", list(loc_options.keys()) if loc_options else [])
+        loc_name = st.selectbox("업체", list(loc_options.keys()) if loc_options else [], key="in_loc")
         loc_id = loc_options.get(loc_name)
 
     # 금액 입력
-    amount_raw = st.text_input("금액(만원 단위)", value="", placeholder="예: 50 (만원)")
+    amount_raw = st.text_input("금액(만원 단위)", value="", placeholder="예: 50 (만원)", key="in_amount")
     try:
         amount = float(amount_raw.replace(",", "").strip()) if amount_raw.strip() != "" else None
     except ValueError:
@@ -562,19 +2165,64 @@ with tab1:
 
             st.success(f"{d.strftime('%Y-%m-%d')} 수입이 저장되었습니다 ✅")
 
+    # ✅ 일괄 등록 (CSV/엑셀)
+    with st.expander("📥 CSV/엑셀 일괄 등록"):
+        st.caption("컬럼: 날짜, 팀원, 업체, 금액(만원), 메모(선택) — 팀원/업체는 설정 탭에 등록된 이름과 같아야 합니다.")
+        st.download_button(
+            "양식 CSV 다운로드",
+            data="날짜,팀원,업체,금액(만원),메모\n".encode("utf-8-sig"),
+            file_name="incomes_template.csv", mime="text/csv", key="inc_import_template",
+        )
+        up = st.file_uploader(
+            "파일 선택", type=["csv", "xlsx"],
+            key=f"inc_import_file_{st.session_state.get('inc_import_nonce', 0)}",
+        )
+        if up is not None:
+            try:
+                valid_df, error_df = prepare_income_import(read_import_file(up), ref)
+            except Exception as e:
+                st.error(f"파일을 읽지 못했습니다: {e}")
+            else:
+                metric_cards([("등록 가능", f"{len(valid_df):,}건"), ("오류", f"{len(error_df):,}건")])
+                if not error_df.empty:
+                    st.markdown("##### 오류 행 (등록에서 제외)")
+                    st.dataframe(error_df, use_container_width=True, hide_index=True)
+                if not valid_df.empty:
+                    st.markdown("##### 미리보기")
+                    st.dataframe(
+                        pd.DataFrame({
+                            "날짜": valid_df["date"],
+                            "팀원": valid_df["teamMemberId"].map(ref.member_name),
+                            "업체": valid_df["locationId"].map(ref.location_name),
+                            "금액(만원)": valid_df["amount"],
+                            "메모": valid_df["memo"],
+                        }).head(100),
+                        use_container_width=True, hide_index=True,
+                        column_config={"금액(만원)": st.column_config.NumberColumn(format="%.0f")},
+                    )
+                    if st.button(f"{len(valid_df):,}건 일괄 등록", type="primary", key="inc_import_submit"):
+                        rows = [{**r, "id": rid} for rid, r in zip(import_row_ids(up, valid_df.index), valid_df.to_dict("records"))]
+                        n_ok, n_skip, err = bulk_insert_incomes(rows)
+                        if err:
+                            st.error(err)
+                        else:
+                            st.session_state["inc_import_nonce"] = st.session_state.get("inc_import_nonce", 0) + 1
+                            skipped = f" (이미 등록된 {n_skip:,}건은 건너뜀)" if n_skip else ""
+                            st.success(f"{n_ok:,}건이 저장되었습니다 ✅{skipped}")
+                            st.rerun()
+
     # ✅ 최근 입력 내역 (미리보기)
-    if st.session_state.income_records:
+    recent_src = income_store(NOW_KST.year).to_frame()
+    if not recent_src.empty:
         st.markdown("#### 최근 입력")
-        recent = sorted(st.session_state.income_records, key=lambda x: x["date"], reverse=True)[:50]
+        recent = recent_src.sort_values("date", ascending=False, kind="mergesort").head(50)
 
-        df_prev = pd.DataFrame([
-            {
-                "날짜": r["date"],
-                "팀원": next((m["name"] for m in st.session_state.team_members if m["id"] == r["teamMemberId"]), ""),
-                "업체": next((l["name"] for l in st.session_state.locations if l["id"] == r["locationId"]), ""),
-                "금액(만원)": r["amount"],
-            } for r in recent
-        ])
+        df_prev = pd.DataFrame({
+            "날짜": recent["day"],
+            "팀원": recent["member"],
+            "업체": recent["location"],
+            "금액(만원)": recent["amount"],
+        }).reset_index(drop=True)
 
         st.dataframe(
             df_prev,
@@ -589,49 +2237,12 @@ with tab1:
 # ============================
 # Tab 2: 통계 (요약 카드 + 상세)
 # ============================
-with tab2:
+if section == "통계":
     st.markdown('### 통계')
 
-    # 🔵 추가: 계산서(DB) 최신화 — 나머지 원본은 전부 그대로 유지
-    try:
-        if "reload_invoice_records" in globals():
-            reload_invoice_records(NOW_KST.year)
-    except Exception:
-        pass
-
-    # ── ID -> 이름 헬퍼
-    def _name_from(_id: str, coll: list[dict]) -> str:
-        for x in coll:
-            if x.get('id') == _id:
-                return x.get('name', '')
-        return ''
-
-    # ── 원천 데이터 → DF
-    records = st.session_state.get('income_records', [])
-    if not records:
-        st.info('데이터가 없습니다. 먼저 [수입 입력]에서 데이터를 추가해 주세요.')
-        st.stop()
-
-    df = pd.DataFrame([{
-        'date': r.get('date'),
-        'amount': r.get('amount'),
-        'member': _name_from(r.get('teamMemberId',''), st.session_state.team_members),
-        'location': _name_from(r.get('locationId',''), st.session_state.locations),
-        'category': next((l.get('category') for l in st.session_state.locations if l.get('id') == r.get('locationId')), ''),
-        'memo': r.get('memo',''),
-    } for r in records])
-
-    # ── 정규화
-    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0.0)
-    df['date'] = pd.to_datetime(df['date'], errors='coerce')
-    df = df.dropna(subset=['date']).copy()
-    df['year']  = df['date'].dt.year.astype(int)
-    df['month'] = df['date'].dt.month.astype(int)
-    df['day']   = df['date'].dt.strftime('%Y-%m-%d')
-
-    # ── 연도 선택
+    # ── 연도 선택 (연도 인덱스 → 선택 연도 파티션만 로드)
     cur_year = NOW_KST.year
-    years = sorted(df['year'].unique().tolist())
+    years = income_year_options()
     default_year = cur_year if cur_year in years else (years[-1] if years else cur_year)
     c1, c2 = st.columns([3,2])
     with c1:
@@ -639,9 +2250,10 @@ with tab2:
     with c2:
         st.caption('선택 연도 외 데이터는 저장만 유지(열람 전용)')
 
-    dfY = df[df['year'] == year].copy()
-    if dfY.empty:
-        st.warning(f'{year}년 데이터가 없습니다.')
+    # ── 서버 집계 → 통계 큐브 (월×팀원×업체 합계/건수 배열, 데이터 버전당 1회 생성)
+    cube = income_cube(year)
+    if cube.empty():
+        st.info('데이터가 없습니다. 먼저 [수입 입력]에서 데이터를 추가해 주세요.')
         st.stop()
 
     # ============================
@@ -653,7 +2265,7 @@ with tab2:
     with tab_mem:
         st.markdown('#### 팀원별 수입 통계')
 
-        members = sorted([m for m in dfY['member'].dropna().unique().tolist() if m])
+        members = sorted([m for m in cube.by_member().index if m])
         member_select = st.selectbox(
             '팀원 선택(최상단은 비교 보기)',
             ['팀원 비교(전체)'] + members,
@@ -663,7 +2275,7 @@ with tab2:
 
         if member_select == '팀원 비교(전체)':
             # 연간 합계 (팀원별)
-            annual_by_member = dfY.groupby('member', dropna=False, as_index=False)['amount'].sum()
+            annual_by_member = cube.by_member().rename_axis('member').reset_index(name='amount')
             annual_by_member.rename(columns={'member':'팀원', 'amount':'연간 합계(만원)'}, inplace=True)
             annual_by_member.sort_values('연간 합계(만원)', ascending=False, inplace=True, kind='mergesort')
             annual_by_member['순위'] = range(1, len(annual_by_member)+1)
@@ -678,12 +2290,10 @@ with tab2:
             )
 
             # 월 선택 (보험/비보험 분리)
-            months_avail_all = sorted(dfY['month'].unique().tolist())
+            months_avail_all = cube.months()
             if months_avail_all:
                 month_sel2 = st.selectbox('월 선택(보험/비보험 분리 보기)', months_avail_all, index=len(months_avail_all)-1, key='mem_month_all')
-                df_month = dfY[dfY['month'] == month_sel2].copy()
-                by_mem_cat = df_month.groupby(['member','category'], dropna=False)['amount'].sum().reset_index()
-                pivot = by_mem_cat.pivot(index='member', columns='category', values='amount').fillna(0.0)
+                pivot = cube.by_member_category(month=month_sel2)
                 for col in ['보험','비보험']:
                     if col not in pivot.columns: pivot[col] = 0.0
                 pivot = pivot[['보험','비보험']]
@@ -701,18 +2311,14 @@ with tab2:
                 st.info('해당 연도의 월 데이터가 없습니다.')
 
         else:
-            # 해당 팀원 데이터
-            dfM_all = dfY[dfY['member'] == member_select].copy()
-            months_avail = sorted(dfM_all['month'].unique().tolist()) or list(range(1, 13))
+            # 해당 팀원 집계 (큐브 슬라이스)
+            months_avail = cube.months(member=member_select) or list(range(1, 13))
             month_sel = st.selectbox('월 선택(일별 상세/요약)', months_avail, index=(len(months_avail)-1 if months_avail else 0), key='mem_month_single')
 
             # 연간 요약
-            y_ins_amt = dfM_all.loc[dfM_all['category']=='보험',   'amount'].sum()
-            y_non_amt = dfM_all.loc[dfM_all['category']=='비보험', 'amount'].sum()
-            y_tot_amt = dfM_all['amount'].sum()
-            y_ins_cnt = int((dfM_all['category']=='보험').sum())
-            y_non_cnt = int((dfM_all['category']=='비보험').sum())
-            y_tot_cnt = int(len(dfM_all))
+            y_ins_amt, y_ins_cnt = cube.total(member=member_select, category='보험')
+            y_non_amt, y_non_cnt = cube.total(member=member_select, category='비보험')
+            y_tot_amt, y_tot_cnt = cube.total(member=member_select)
 
             st.markdown('##### 연간 요약')
             metric_cards([
@@ -725,13 +2331,9 @@ with tab2:
             ])
 
             # 월간 요약
-            dfM_month = dfM_all[dfM_all['month'] == month_sel].copy()
-            m_ins_amt = dfM_month.loc[dfM_month['category']=='보험',   'amount'].sum()
-            m_non_amt = dfM_month.loc[dfM_month['category']=='비보험', 'amount'].sum()
-            m_tot_amt = dfM_month['amount'].sum()
-            m_ins_cnt = int((dfM_month['category']=='보험').sum())
-            m_non_cnt = int((dfM_month['category']=='비보험').sum())
-            m_tot_cnt = int(len(dfM_month))
+            m_ins_amt, m_ins_cnt = cube.total(member=member_select, month=month_sel, category='보험')
+            m_non_amt, m_non_cnt = cube.total(member=member_select, month=month_sel, category='비보험')
+            m_tot_amt, m_tot_cnt = cube.total(member=member_select, month=month_sel)
 
             st.markdown(f'##### {month_sel}월 요약')
             metric_cards([
@@ -743,9 +2345,10 @@ with tab2:
                 ("월 건수(비보험)", f"{m_non_cnt:,}"),
             ])
 
-            # 일별 합계
+            # 일별 합계 (선택 팀원·월의 원본 행만 조회)
+            dfD = income_detail(year, month_sel, [mid for mid, n in ref.member_name.items() if n == member_select])
             daily = (
-                dfM_all[dfM_all['month'] == month_sel]
+                dfD
                 .groupby('day', dropna=False)['amount'].sum().reset_index()
                 .rename(columns={'day':'날짜','amount':'금액(만원)'}).sort_values('날짜')
             )
@@ -758,10 +2361,10 @@ with tab2:
             )
 
             # 상세 보기
-            days_in_month = sorted(dfM_all.loc[dfM_all['month'] == month_sel, 'day'].dropna().unique().tolist())
+            days_in_month = sorted(dfD['day'].dropna().unique().tolist())
             if days_in_month:
                 sel_day = st.selectbox('상세 보기 날짜 선택', days_in_month, key='member_day_detail')
-                details = dfM_all[(dfM_all['day'] == sel_day) & (dfM_all['month'] == month_sel)][
+                details = dfD[dfD['day'] == sel_day][
                     ['day','location','category','amount','memo']
                 ].copy().rename(columns={'day':'날짜','location':'업체','category':'분류','amount':'금액(만원)','memo':'메모'})
                 st.markdown(f'##### {member_select} · {sel_day} 입력 내역')
@@ -778,16 +2381,14 @@ with tab2:
     with tab_loc_all:
         st.markdown('#### 업체종합 (보험/비보험 분리)')
         cat_sel = st.radio('분류 선택', ['보험','비보험'], horizontal=True, key='loc_all_cat')
-        dfC = dfY[dfY['category'] == cat_sel].copy()
-
-        if dfC.empty:
+        if cube.empty(category=cat_sel):
             st.warning(f'{year}년 {cat_sel} 데이터가 없습니다.')
         else:
             rank_mode = st.radio('랭킹 모드', ['연간 순위','월간 순위'], horizontal=True, index=0, key='loc_all_mode')
 
             if rank_mode == '연간 순위':
                 annual_loc = (
-                    dfC.groupby('location', dropna=False)['amount'].sum().reset_index()
+                    cube.by_location(category=cat_sel).rename_axis('location').reset_index(name='amount')
                     .rename(columns={'location':'업체','amount':'연간합계(만원)'})
                     .sort_values('연간합계(만원)', ascending=False).reset_index(drop=True)
                 )
@@ -800,14 +2401,13 @@ with tab2:
                     column_config={'연간합계(만원)': st.column_config.NumberColumn(format='%.0f')}
                 )
             else:
-                months_avail_c = sorted(dfC['month'].unique().tolist())
+                months_avail_c = cube.months(category=cat_sel)
                 if not months_avail_c:
                     st.info('선택 가능한 월이 없습니다.')
                 else:
                     month_rank = st.selectbox('월 선택(해당 월만 표시)', months_avail_c, index=len(months_avail_c)-1, key='loc_all_month')
-                    df_month = dfC[dfC['month'] == month_rank].copy()
                     monthly_loc = (
-                        df_month.groupby('location', dropna=False)['amount'].sum().reset_index()
+                        cube.by_location(category=cat_sel, month=month_rank).rename_axis('location').reset_index(name='amount')
                         .rename(columns={'location':'업체','amount':'월합계(만원)'})
                         .sort_values('월합계(만원)', ascending=False).reset_index(drop=True)
                     )
@@ -826,8 +2426,7 @@ with tab2:
 
         # 1) 분류(보험/비보험)
         cat_sel_e = st.radio('분류 선택', ['보험', '비보험'], horizontal=True, key='loc_each_cat')
-        dfC_e = dfY[dfY['category'] == cat_sel_e].copy()
-        if dfC_e.empty:
+        if cube.empty(category=cat_sel_e):
             st.warning(f"{year}년 {cat_sel_e} 데이터가 없습니다.")
             st.stop()
 
@@ -841,7 +2440,7 @@ with tab2:
         base_order = [x.get('name') for x in st.session_state.locations if x.get('name')]
 
         # 현재 분류(cat_sel_e)에 실제 데이터가 존재하는 업체만
-        present = set(dfC_e['location'].dropna().tolist())
+        present = set(cube.by_location(category=cat_sel_e).index)
 
         # 원본 순서에서 "현재 존재" 업체만
         ordered_filtered = [name for name in base_order if name in present]
@@ -855,8 +2454,8 @@ with tab2:
 
         sel_loc_e = st.selectbox('업체 선택', loc_opts_e, index=0, key='loc_each_loc')
 
-        # 선택된 업체 필터
-        dfS_e = dfC_e[dfC_e['location'] == sel_loc_e].copy()
+        # 선택된 업체 슬라이스 조건
+        where_e = {'category': cat_sel_e, 'location': sel_loc_e}
 
         # 표 유틸: 합계 행을 추가한 데이터프레임 반환
         def _df_with_total(df_in: pd.DataFrame, amount_col: str, name_col: str = '팀원') -> pd.DataFrame:
@@ -865,7 +2464,7 @@ with tab2:
             return out
 
         if mode_e == '월간 순위':
-            months_avail_e = sorted(dfS_e['month'].dropna().unique().tolist())
+            months_avail_e = cube.months(**where_e)
             if not months_avail_e:
                 st.info('선택된 업체에 해당하는 월 데이터가 없습니다.')
                 st.stop()
@@ -878,9 +2477,8 @@ with tab2:
             )
 
             # 팀원별 월간 합계
-            dfM_e = dfS_e[dfS_e['month'] == month_sel_e].copy()
             by_member_month_e = (
-                dfM_e.groupby('member', dropna=False)['amount'].sum().reset_index()
+                cube.by_member(month=month_sel_e, **where_e).rename_axis('member').reset_index(name='amount')
                 .rename(columns={'member':'팀원','amount':'월합계(만원)'})
                 .sort_values('월합계(만원)', ascending=False).reset_index(drop=True)
             )
@@ -896,7 +2494,7 @@ with tab2:
             # 아래에 참고: 연간 합계 표
             st.markdown('##### 참고: 팀원별 연간 합계')
             by_member_year_e = (
-                dfS_e.groupby('member', dropna=False)['amount'].sum().reset_index()
+                cube.by_member(**where_e).rename_axis('member').reset_index(name='amount')
                 .rename(columns={'member':'팀원','amount':'연간합계(만원)'})
                 .sort_values('연간합계(만원)', ascending=False).reset_index(drop=True)
             )
@@ -915,7 +2513,7 @@ with tab2:
             )
 
             by_member_year_e = (
-                dfS_e.groupby('member', dropna=False)['amount'].sum().reset_index()
+                cube.by_member(**where_e).rename_axis('member').reset_index(name='amount')
                 .rename(columns={'member':'팀원','amount':'연간합계(만원)'})
                 .sort_values('연간합계(만원)', ascending=False).reset_index(drop=True)
             )
@@ -931,13 +2529,6 @@ with tab2:
     with tab_invoice:
         st.markdown("#### 계산서 통계")
 
-        # 현재 세션에 있는 데이터(초기값: 올해만 로드될 수 있음)
-        inv = st.session_state.get("invoice_records", []) or []
-
-        # 이름 매핑 (표시용)
-        mmap = {m.get("id"): m.get("name") for m in (st.session_state.get("team_members",[]) or [])}
-        lmap = {l.get("id"): l.get("name") for l in (st.session_state.get("locations",[])   or [])}
-
         # 드롭다운(팀 전체 + 모든 팀원)
         all_member_names = [m.get("name") for m in (st.session_state.get("team_members",[]) or []) if m.get("name")]
         mem = st.selectbox("팀원 선택", ["팀 전체"] + all_member_names, index=0, key="t2_inv_mem")
@@ -950,47 +2541,31 @@ with tab2:
             key="t2_inv_year"
         )
 
-        # ✅ 선택한 연도의 계산서 데이터를 DB에서 다시 로드 (연도 변경 시에만)
-        if sb:
-            loaded_y = st.session_state.get("_t2_inv_loaded_year")
-            if loaded_y != y:
-                load_invoices(y)
-                st.session_state["_t2_inv_loaded_year"] = y
-        inv = st.session_state.get("invoice_records", []) or []
-
+        # ✅ 선택 연도 집계 (공유 캐시: 연도·데이터 버전당 1회 — 세션 invoice_records 는 건드리지 않음)
+        inv_stats = invoice_stats(y)
 
         # 연간/월간
         period = st.radio("기간 선택", ["연간", "월간"], horizontal=True, index=0, key="t2_inv_period")
 
-        # 보조 파서
-        def _ym_year(s):
-            try: return int(str(s).split("-")[0])
-            except: return None
-        def _ym_month(s):
-            try: return int(str(s).split("-")[1])
-            except: return None
-
-        # 선택 연도 필터
-        Q = [r for r in inv if _ym_year(r.get("ym")) == y]
-
         # 월간 모드면 월 선택
-        months_avail = sorted({_ym_month(r.get("ym")) for r in Q if _ym_month(r.get("ym"))})
+        month_q = None
+        months_avail = inv_stats.months()
         if period == "월간" and months_avail:
             m = st.selectbox("월", months_avail, index=len(months_avail)-1, key="t2_inv_month")
-            Q = [r for r in Q if _ym_month(r.get("ym")) == m]
+            month_q = m
             titleP = f"{y}년 {m}월"
         else:
             titleP = f"{y}년"
 
         # 개인 선택 시 개인만 필터
+        member_q = None
         if mem != "팀 전체":
-            name_to_id = {m.get("name"): m.get("id") for m in (st.session_state.get("team_members",[]) or [])}
-            mem_id = name_to_id.get(mem)
-            Q = [r for r in Q if r.get("teamMemberId") == mem_id]
+            member_q = ref.member_code.get(ref.member_id.get(mem), -2)
+        Q = inv_stats.select(month=month_q, member_code=member_q)
 
         # 합계 지표
-        tot_issue = sum(float(r.get("issueAmount") or 0) for r in Q)
-        tot_tax   = sum(float(r.get("taxAmount") or 0) for r in Q)
+        tot_issue = float(Q["issue"].sum())
+        tot_tax   = float(Q["tax"].sum())
         ratio_all = (tot_tax / tot_issue * 100.0) if tot_issue else 0.0
 
         c1,c2,c3 = st.columns(3)
@@ -998,70 +2573,34 @@ with tab2:
         c2.metric(f"{titleP} 세준금 총합(만원)",   f"{tot_tax:,.0f}")
         c3.metric("세준금 비율(%)",                f"{ratio_all:.2f}%")
 
+        inv_cols = {
+            "발행금액(만원)": st.column_config.NumberColumn(format="%.0f"),
+            "세준금(만원)":   st.column_config.NumberColumn(format="%.0f"),
+            "세준금비율(%)":  st.column_config.NumberColumn(format="%.2f"),
+        }
+
         # 팀 전체일 경우: 팀원별 누적 표
         if mem == "팀 전체":
             st.markdown("##### 팀원별 누적 (선택 기간 기준)")
-            if not Q:
+            if Q.empty:
                 st.info(f"{titleP} 팀원별 누적 데이터가 없습니다.")
             else:
-                agg = {}
-                for r in Q:
-                    name = mmap.get(r.get("teamMemberId")) or "(이름없음)"
-                    agg.setdefault(name, {"issue":0.0,"tax":0.0})
-                    agg[name]["issue"] += float(r.get("issueAmount") or 0)
-                    agg[name]["tax"]   += float(r.get("taxAmount") or 0)
-                rows = []
-                for name, v in agg.items():
-                    rows.append({
-                        "팀원": name,
-                        "발행금액(만원)": v["issue"],
-                        "세준금(만원)":   v["tax"],
-                        "세준금비율(%)":  (v["tax"]/v["issue"]*100.0) if v["issue"] else 0.0
-                    })
-                df_mem = pd.DataFrame(rows)
-                if not df_mem.empty:
-                    df_mem = df_mem.sort_values("발행금액(만원)", ascending=False).reset_index(drop=True)
-                    st.dataframe(
-                        df_mem,
-                        use_container_width=True, hide_index=True, key="t2_inv_by_member",
-                        column_config={
-                            "발행금액(만원)": st.column_config.NumberColumn(format="%.0f"),
-                            "세준금(만원)":   st.column_config.NumberColumn(format="%.0f"),
-                            "세준금비율(%)":  st.column_config.NumberColumn(format="%.2f"),
-                        }
-                    )
+                st.dataframe(
+                    InvoiceStats.table(Q, "member", "팀원"),
+                    use_container_width=True, hide_index=True, key="t2_inv_by_member",
+                    column_config=inv_cols,
+                )
 
         # 업체별 목록 (발행금액 기준 내림차순)
         st.markdown("##### 업체별 계산서 목록")
-        if not Q:
+        if Q.empty:
             st.info(f"{titleP} 조건에 맞는 계산서 데이터가 없습니다.")
         else:
-            loc_agg = {}
-            for r in Q:
-                loc = lmap.get(r.get("locationId")) or "(업체없음)"
-                d = loc_agg.setdefault(loc, {"issue":0.0,"tax":0.0})
-                d["issue"] += float(r.get("issueAmount") or 0)
-                d["tax"]   += float(r.get("taxAmount") or 0)
-            rows = []
-            for loc, v in loc_agg.items():
-                rows.append({
-                    "업체명": loc,
-                    "발행금액(만원)": v["issue"],
-                    "세준금(만원)":   v["tax"],
-                    "세준금비율(%)":  (v["tax"]/v["issue"]*100.0) if v["issue"] else 0.0
-                })
-            df_loc = pd.DataFrame(rows)
-            if not df_loc.empty:
-                df_loc = df_loc.sort_values("발행금액(만원)", ascending=False).reset_index(drop=True)
-                st.dataframe(
-                    df_loc,
-                    use_container_width=True, hide_index=True, key="t2_inv_by_loc",
-                    column_config={
-                        "발행금액(만원)": st.column_config.NumberColumn(format="%.0f"),
-                        "세준금(만원)":   st.column_config.NumberColumn(format="%.0f"),
-                        "세준금비율(%)":  st.column_config.NumberColumn(format="%.2f"),
-                    }
-                )
+            st.dataframe(
+                InvoiceStats.table(Q, "location", "업체명"),
+                use_container_width=True, hide_index=True, key="t2_inv_by_loc",
+                column_config=inv_cols,
+            )
 
 
 
@@ -1070,7 +2609,7 @@ with tab2:
 # ============================
 # Tab 6: 설정 (팀원/업체 추가·삭제·순서 이동)
 # ============================
-with tab6:
+if section == "설정":
     st.subheader("설정")
     st.caption("📱 모바일에서는 화면을 가로로 돌리면 설정 UI가 더 깔끔하게 표시됩니다.")
     def open_confirm(_type, _id, _name, action):
@@ -1133,6 +2672,16 @@ with tab6:
                 if st.button("🗑️", key=f"member_del_{m['id']}"):
                     open_confirm("member", m["id"], m["name"], "delete"); st.rerun()
         st.markdown('</div>', unsafe_allow_html=True)
+
+        # 원하는 위치로 바로 이동 (한 번에 저장)
+        mv1, mv2, mv3 = st.columns([3, 2, 1])
+        with mv1:
+            mv_idx = st.selectbox("이동할 팀원", range(len(tm)), format_func=lambda i: tm[i]["name"], key="member_move_item")
+        with mv2:
+            mv_to = st.selectbox("위치", range(len(tm)), format_func=lambda i: f"{i+1}번째", key="member_move_to")
+        with mv3:
+            if st.button("이동", key="member_move_btn", disabled=(mv_idx == mv_to)):
+                move_order("team_members", mv_idx, mv_to)
     else:
         st.info("등록된 팀원이 없습니다.")
 
@@ -1156,8 +2705,7 @@ with tab6:
     if st.session_state.locations:
         st.markdown("#### 업체 목록 (카테고리별 순서 이동/삭제)")
         locs_all = sorted(st.session_state.locations, key=lambda x: x.get("order", 0))
-        for l in locs_all:
-            if isinstance(l.get("category"), str): l["category"] = l["category"].strip()
+        locs_all = [{**l, "category": l["category"].strip()} if isinstance(l.get("category"), str) else l for l in locs_all]
 
         cat_view = st.radio("보기(카테고리)", ["보험", "비보험"], horizontal=True, key="loc_cat_view")
         filtered = [(i, l) for i, l in enumerate(locs_all) if l.get("category") == cat_view]
@@ -1192,201 +2740,257 @@ with tab6:
                     if st.button("🗑️", key=f"loc_del_{l['id']}"):
                         open_confirm("location", l["id"], l["name"], "delete"); st.rerun()
         st.markdown('</div>', unsafe_allow_html=True)
+
+        # 원하는 위치로 바로 이동 (현재 카테고리 안에서, 한 번에 저장)
+        if len(filtered) > 1:
+            lv1, lv2, lv3 = st.columns([3, 2, 1])
+            with lv1:
+                lv_k = st.selectbox("이동할 업체", range(len(filtered)), format_func=lambda k: filtered[k][1]["name"], key="loc_move_item")
+            with lv2:
+                lv_to = st.selectbox("위치", range(len(filtered)), format_func=lambda k: f"{k+1}번째", key="loc_move_to")
+            with lv3:
+                if st.button("이동", key="loc_move_btn", disabled=(lv_k == lv_to)):
+                    move_order("locations", filtered[lv_k][0], filtered[lv_to][0])
     else:
         st.info("등록된 업체가 없습니다.")
 
     st.divider()
     if st.button("데이터 새로고침"):
-        load_data(); st.success("새로고침 완료"); st.rerun()
+        reset_sync(); load_data(); st.success("새로고침 완료"); st.rerun()
+
+    if sb:
+        with st.expander("월별 집계(롤업) 점검"):
+            st.caption("통계/정산은 월별 롤업을 읽습니다. 원본에서 다시 계산해 어긋난 그룹이 있는지 확인합니다.")
+            rc1, rc2 = st.columns(2)
+            with rc1:
+                do_check = st.button("점검", key="rollup_check")
+            with rc2:
+                do_rebuild = st.button("재구성", key="rollup_rebuild")
+            if do_check or do_rebuild:
+                try:
+                    drift, fixed = check_income_rollup(rebuild=do_rebuild)
+                except Exception as e:
+                    st.error(f"점검 실패: {e} (sql/004_income_monthly.sql 적용 여부를 확인하세요)")
+                else:
+                    if not drift:
+                        st.success("어긋난 그룹이 없습니다.")
+                    else:
+                        st.warning(f"어긋난 그룹 {len(drift)}개")
+                        st.dataframe(pd.DataFrame(drift), use_container_width=True, hide_index=True)
+                    if fixed is not None:
+                        st.success(f"재구성 완료 (수정된 그룹 {fixed}개)")
 
 # ============================
 # Tab 5: 기록 관리 (전체 수정/삭제)
 # ============================
-with tab5:
+if section == "기록 관리":
     st.subheader("기록 관리 (전체 수정/삭제)")
 
-    def resolve_name2(id_value: str, coll: list[dict]) -> str:
-        for x in coll:
-            if x["id"] == id_value: return x.get("name", "")
-        return ""
+    years = income_year_options()
+    c1, c2, c3 = st.columns([2,3,2])
+    with c1: year_sel = st.selectbox("연도", years, index=len(years)-1, key="records_year")
 
-    records = st.session_state.get("income_records", [])
-    if not records:
+    # 연도 전체 건수 (기본 필터와 같은 캐시 키 — 필터를 바꾸지 않으면 추가 조회 없음)
+    _, year_total = records_page(records_condition(year_sel, None, "전체", "전체", "전체", ref),
+                                 "날짜↓(최신)", 0, None)
+    if year_total == 0:
         st.info("데이터가 없습니다. 먼저 [수입 입력]에서 데이터를 추가해 주세요.")
         st.stop()
 
-    df = pd.DataFrame([{
-        "id": r.get("id"),
-        "date": r.get("date"),
-        "amount": pd.to_numeric(r.get("amount"), errors="coerce"),
-        "member_id": r.get("teamMemberId"),
-        "member": resolve_name2(r.get("teamMemberId",""), st.session_state.team_members),
-        "location_id": r.get("locationId"),
-        "location": resolve_name2(r.get("locationId",""), st.session_state.locations),
-        "category": next((l["category"] for l in st.session_state.locations if l["id"] == r.get("locationId")), ""),
-        "memo": r.get("memo",""),
-    } for r in records])
-    df["amount"] = df["amount"].fillna(0.0)
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df = df.dropna(subset=["date"]).copy()
-    df["year"] = df["date"].dt.year
-    df["day"] = df["date"].dt.strftime("%Y-%m-%d")
-
-    years = sorted(df["year"].unique().tolist())
-    c1, c2, c3 = st.columns([2,3,2])
-    with c1: year_sel = st.selectbox("연도", years, index=len(years)-1)
-    dmin = df.loc[df["year"]==year_sel, "date"].min().date()
-    dmax = df.loc[df["year"]==year_sel, "date"].max().date()
-    with c2: date_range = st.date_input("기간", value=(dmin, dmax), min_value=dmin, max_value=dmax, format="YYYY-MM-DD")
-    with c3: order_by = st.selectbox("정렬", ["날짜↓(최신)", "날짜↑", "금액↓", "금액↑"])
+    dmin, dmax = date(year_sel, 1, 1), date(year_sel, 12, 31)
+    with c2: date_range = st.date_input("기간", value=(dmin, dmax), min_value=dmin, max_value=dmax, format="YYYY-MM-DD",
+                                        key=f"records_range_{year_sel}")
+    with c3: order_by = st.selectbox("정렬", list(RECORDS_SORTS), index=0, key="records_order")
 
     c4, c5, c6 = st.columns([2,2,2])
     with c4:
         mem_opts = ["전체"] + sorted([m["name"] for m in st.session_state.team_members])
-        mem_sel = st.selectbox("팀원", mem_opts, index=0)
+        mem_sel = st.selectbox("팀원", mem_opts, index=0, key="records_member")
     with c5:
-        cat_sel = st.selectbox("분류", ["전체","보험","비보험"], index=0)
+        cat_sel = st.selectbox("분류", ["전체","보험","비보험"], index=0, key="records_cat")
     with c6:
-        loc_candidates = [l for l in st.session_state.locations if (cat_sel=="전체" or l["category"]==cat_sel)]
+        loc_candidates = list(ref.locations) if cat_sel == "전체" else ref.locations_in(cat_sel)
         loc_opts = ["전체"] + [l["name"] for l in sorted(loc_candidates, key=lambda x: x.get("order",0))]
-        loc_sel = st.selectbox("업체", loc_opts, index=0)
-
-    q = df[df["year"]==year_sel].copy()
-    if isinstance(date_range, tuple) and len(date_range)==2:
-        q = q[(q["date"].dt.date >= date_range[0]) & (q["date"].dt.date <= date_range[1])]
-    if mem_sel != "전체": q = q[q["member"] == mem_sel]
-    if cat_sel != "전체": q = q[q["category"] == cat_sel]
-    if loc_sel != "전체": q = q[q["location"] == loc_sel]
-
-    if order_by == "날짜↓(최신)":
-        q = q.sort_values(["date","id"], ascending=[False, True])
-    elif order_by == "날짜↑":
-        q = q.sort_values(["date","id"], ascending=[True, True])
-    elif order_by == "금액↓":
-        q = q.sort_values(["amount","date"], ascending=[False, False])
-    else:
-        q = q.sort_values(["amount","date"], ascending=[True, False])
-
-    PAGE_SIZE = 20
-    total = len(q); total_pages = max((total - 1) // PAGE_SIZE + 1, 1)
-    st.session_state.records_page = min(st.session_state.records_page, total_pages-1)
-    st.session_state.records_page = max(st.session_state.records_page, 0)
+        loc_sel = st.selectbox("업체", loc_opts, index=0, key="records_loc")
+
+    # 필터/정렬이 바뀌면 첫 페이지부터 (records_cursors[i] = i페이지 시작 커서, 0페이지는 None)
+    cond = records_condition(year_sel, date_range, mem_sel, cat_sel, loc_sel, ref)
+    if st.session_state.get("records_sig") != (cond, order_by):
+        st.session_state.records_sig = (cond, order_by)
+        st.session_state.records_page = 0
+        st.session_state.records_cursors = [None]
+    cursors = st.session_state.setdefault("records_cursors", [None])
+    page = min(max(st.session_state.records_page, 0), len(cursors) - 1)
+
+    page_rows, total = records_page(cond, order_by, page, cursors[page])
+    total_pages = max((total - 1) // RECORDS_PAGE_SIZE + 1, 1)
+    if page > total_pages - 1:   # 삭제 등으로 마지막 페이지가 사라짐
+        page = total_pages - 1
+        page_rows, total = records_page(cond, order_by, page, cursors[page])
+    st.session_state.records_page = page
 
     pc1, pc2, pc3 = st.columns([1,2,1])
     with pc1:
-        if st.button("⬅ 이전", disabled=(st.session_state.records_page==0)):
-            st.session_state.records_page -= 1; st.rerun()
+        if st.button("⬅ 이전", disabled=(page==0)):
+            st.session_state.records_page = page - 1; st.rerun()
     with pc2:
-        st.markdown(f"<div style='text-align:center'>페이지 {st.session_state.records_page+1} / {total_pages} (총 {total}건)</div>", unsafe_allow_html=True)
+        st.markdown(f"<div style='text-align:center'>페이지 {page+1} / {total_pages} (총 {total}건)</div>", unsafe_allow_html=True)
     with pc3:
-        if st.button("다음 ➡", disabled=(st.session_state.records_page>=total_pages-1)):
-            st.session_state.records_page += 1; st.rerun()
+        if st.button("다음 ➡", disabled=(page>=total_pages-1 or not page_rows)):
+            del cursors[page+1:]
+            cursors.append(records_cursor(page_rows[-1], order_by))
+            st.session_state.records_page = page + 1; st.rerun()
 
-    start = st.session_state.records_page * PAGE_SIZE
-    page_df = q.iloc[start:start+PAGE_SIZE].copy()
+    page_by_id = {r["id"]: r for r in page_rows}
+    page_df = IncomeStore.build(page_rows, ref).to_frame()
 
     csv_bytes = page_df[["day","member","location","category","amount","memo"]].rename(
         columns={"day":"날짜","member":"팀원","location":"업체","category":"분류","amount":"금액(만원)","memo":"메모"}
     ).to_csv(index=False).encode("utf-8-sig")
-    st.download_button("현재 페이지 CSV 다운로드", data=csv_bytes, file_name=f"records_{year_sel}_{st.session_state.records_page+1}.csv", mime="text/csv")
+    st.download_button("현재 페이지 CSV 다운로드", data=csv_bytes, file_name=f"records_{year_sel}_{page+1}.csv", mime="text/csv")
+    export_controls(
+        "records_export", f"records_{year_sel}",
+        lambda: income_export_chunks(cond, order_by, ref),
+        {"date": "날짜", "member": "팀원", "location": "업체", "category": "분류", "amount": "금액(만원)", "memo": "메모"},
+        numeric=("amount",),
+    )
 
     st.markdown("#### 결과 (선택/수정/삭제)")
-    st.dataframe(
-        page_df[["day","member","location","category","amount","memo"]].rename(
-            columns={"day":"날짜","member":"팀원","location":"업체","category":"분류","amount":"금액(만원)","memo":"메모"}
-        ),
-        use_container_width=True,
-        column_config={"금액(만원)": st.column_config.NumberColumn(format="%.0f")}
-    )
+    grid_mode = st.radio("보기", ["카드", "표 편집(일괄 저장)"], horizontal=True, key="records_view") != "카드"
+    if grid_mode:
+        st.caption("여러 칸/행을 고친 뒤 한 번에 저장합니다. 행 추가는 표 아래 ＋, 삭제는 행 선택 후 🗑.")
+        grid_key = f"records_grid_{abs(hash((cond, order_by, page)))}_{st.session_state.get('records_grid_nonce', 0)}"
+        edited = st.data_editor(
+            income_grid_frame(page_rows, ref),
+            key=grid_key, num_rows="dynamic", hide_index=True, use_container_width=True,
+            column_order=list(GRID_COLUMNS),
+            column_config={
+                "date": st.column_config.DateColumn(GRID_COLUMNS["date"], format="YYYY-MM-DD", required=True),
+                "member": st.column_config.SelectboxColumn(
+                    GRID_COLUMNS["member"], options=[m["name"] for m in ref.members if m.get("name")], required=True),
+                "location": st.column_config.SelectboxColumn(
+                    GRID_COLUMNS["location"], options=list(ref.location_id), required=True),
+                "amount": st.column_config.NumberColumn(GRID_COLUMNS["amount"], min_value=0, format="%.0f", required=True),
+                "memo": st.column_config.TextColumn(GRID_COLUMNS["memo"]),
+            },
+        )
+        upserts, deleted, grid_errors = income_grid_diff(page_rows, edited, ref)
+        for msg in grid_errors:
+            st.error(msg)
+        saved = False
+        if st.button(f"💾 변경 저장 (수정·추가 {len(upserts)}건 / 삭제 {len(deleted)}건)", type="primary",
+                     disabled=bool(grid_errors) or not (upserts or deleted), key="records_grid_save"):
+            err = save_income_batch(upserts, deleted)
+            if err:
+                st.error(err)
+            else:
+                st.session_state["records_grid_nonce"] = st.session_state.get("records_grid_nonce", 0) + 1
+                saved = True
+        if saved:
+            st.rerun()
+    else:
+        picked = st.dataframe(
+            page_df[["day","member","location","category","amount","memo"]].rename(
+                columns={"day":"날짜","member":"팀원","location":"업체","category":"분류","amount":"금액(만원)","memo":"메모"}
+            ),
+            use_container_width=True,
+            column_config={"금액(만원)": st.column_config.NumberColumn(format="%.0f")},
+            on_select="rerun", selection_mode="multi-row", key=f"records_pick_{abs(hash((cond, order_by, page)))}",
+        )
 
-    for _, row in page_df.iterrows():
-        with st.container(border=True):
-            left, right = st.columns([6, 2])
-            left.write(f"**{row['day']} · {row['member']} · {row['location']} · {int(row['amount']):,}만원** — {row['memo']}")
-            with right:
-                col_a, col_b = st.columns(2)
-                with col_a:
-                    if st.button("🖉 수정", key=f"edit_any_{row['id']}"):
-                        st.session_state.edit_income_id = row["id"]; st.rerun()
-                with col_b:
-                    if st.button("🗑 삭제", key=f"del_any_{row['id']}"):
-                        st.session_state.confirm_delete_income_id = row["id"]; st.rerun()
-
-    if st.session_state.confirm_delete_income_id:
-        rid = st.session_state.confirm_delete_income_id
-        with st.container(border=True):
-            st.error("정말 삭제하시겠습니까? (되돌릴 수 없음)")
-            c1, c2 = st.columns(2)
-            with c1:
-                if st.button("✅ 삭제 확정"):
-                    delete_row("incomes", rid)
-                    st.session_state.confirm_delete_income_id = None
-                    st.success("삭제되었습니다."); st.rerun()
-            with c2:
-                if st.button("❌ 취소"):
-                    st.session_state.confirm_delete_income_id = None; st.rerun()
-
-    if st.session_state.edit_income_id:
-        target = next((x for x in st.session_state.income_records if x["id"] == st.session_state.edit_income_id), None)
-        if target:
-            st.markdown("#### 선택한 기록 수정")
-            def resolve_name(id_value: str, coll: list[dict]) -> str:
-                for x in coll:
-                    if x["id"] == id_value: return x.get("name", "")
-                return ""
-            cur_member = resolve_name(target["teamMemberId"], st.session_state.team_members)
-            cur_loc = next((l for l in st.session_state.locations if l["id"] == target["locationId"]), None)
-            cur_cat = cur_loc["category"] if cur_loc else "보험"
-
-            c1, c2 = st.columns([1,1])
-            with c1:
-                new_date = st.date_input("발생일", value=pd.to_datetime(target["date"]).date(), format="YYYY-MM-DD", key="edit_any_date")
-                member_options = {m["name"]: m["id"] for m in st.session_state.team_members}
-                member_name_edit = st.selectbox("팀원", list(member_options.keys()),
-                                                index=list(member_options.keys()).index(cur_member), key="edit_any_member")
-                member_id_edit = member_options[member_name_edit]
-            with c2:
-                cat_edit = st.radio("분류", ["보험","비보험"], index=0 if cur_cat=="보험" else 1, horizontal=True, key="edit_any_cat")
-                filtered_locations = [l for l in st.session_state.locations if l["category"] == cat_edit]
-                loc_options = {l["name"]: l["id"] for l in filtered_locations}
-                default_loc_idx = 0
-                if cur_loc and cur_loc["category"] == cat_edit:
-                    names = list(loc_options.keys())
-                    if cur_loc["name"] in names: default_loc_idx = names.index(cur_loc["name"])
-                loc_name_edit = st.selectbox("업체", list(loc_options.keys()), index=default_loc_idx, key="edit_any_loc")
-                loc_id_edit = loc_options[loc_name_edit]
-
-            amount_raw_edit = st.text_input("금액(만원 단위)", value=str(int(float(target["amount"]))), placeholder="예: 50 (만원)", key="edit_any_amount")
-            try:
-                amount_edit = float(amount_raw_edit.replace(",", "").strip())
-            except ValueError:
-                amount_edit = None; st.error("금액은 숫자만 입력하세요. (예: 50)")
-            memo_edit = st.text_input("메모(선택)", value=target.get("memo",""), key="edit_any_memo")
-
-            b1, b2 = st.columns(2)
-            with b1:
-                if st.button("✅ 저장", type="primary", key="edit_any_save"):
-                    if amount_edit is None or amount_edit <= 0:
-                        st.error("금액을 올바르게 입력하세요.")
-                    else:
-                        update_income(target["id"], {
-                            "date": new_date.strftime("%Y-%m-%d"),
-                            "teamMemberId": member_id_edit,
-                            "locationId": loc_id_edit,
-                            "amount": float(amount_edit),
-                            "memo": memo_edit,
-                        })
-                        st.session_state.edit_income_id = None
-                        st.success("수정되었습니다."); st.rerun()
-            with b2:
-                if st.button("❌ 취소", key="edit_any_cancel"):
-                    st.session_state.edit_income_id = None; st.rerun()
+        # 일괄 작업: 표에서 고른 행 또는 필터 결과 전체
+        with st.expander("일괄 작업 (선택 행 / 필터 결과 전체)"):
+            if st.checkbox(f"필터 결과 전체 {total:,}건 대상", key="records_bulk_all"):
+                bulk_rows = list(records_all(cond, order_by))
+            else:
+                bulk_rows = [page_by_id[page_df["id"].iloc[i]] for i in picked.selection.rows
+                             if page_df["id"].iloc[i] in page_by_id]
+            bulk_controls("records_bulk", bulk_rows, ref, "일", bulk_income_action)
+
+        for _, row in page_df.iterrows():
+            with st.container(border=True):
+                left, right = st.columns([6, 2])
+                left.write(f"**{row['day']} · {row['member']} · {row['location']} · {int(row['amount']):,}만원** — {row['memo']}")
+                with right:
+                    col_a, col_b = st.columns(2)
+                    with col_a:
+                        if st.button("🖉 수정", key=f"edit_any_{row['id']}_open"):
+                            st.session_state.edit_income_id = row["id"]; st.rerun()
+                    with col_b:
+                        if st.button("🗑 삭제", key=f"del_any_{row['id']}"):
+                            st.session_state.confirm_delete_income_id = row["id"]; st.rerun()
+
+        if st.session_state.confirm_delete_income_id:
+            rid = st.session_state.confirm_delete_income_id
+            with st.container(border=True):
+                st.error("정말 삭제하시겠습니까? (되돌릴 수 없음)")
+                c1, c2 = st.columns(2)
+                with c1:
+                    if st.button("✅ 삭제 확정"):
+                        delete_row("incomes", rid)
+                        st.session_state.confirm_delete_income_id = None
+                        st.success("삭제되었습니다."); st.rerun()
+                with c2:
+                    if st.button("❌ 취소"):
+                        st.session_state.confirm_delete_income_id = None; st.rerun()
+
+        if st.session_state.edit_income_id:
+            target = page_by_id.get(st.session_state.edit_income_id) or income_by_id(st.session_state.edit_income_id)
+            if target:
+                st.markdown("#### 선택한 기록 수정")
+                cur_member = ref.member_name.get(target["teamMemberId"], "")
+                cur_loc = ref.location_by_id.get(target["locationId"])
+                cur_cat = cur_loc["category"] if cur_loc else "보험"
+
+                c1, c2 = st.columns([1,1])
+                with c1:
+                    new_date = st.date_input("발생일", value=pd.to_datetime(target["date"]).date(), format="YYYY-MM-DD", key="edit_any_date")
+                    member_options = {m["name"]: m["id"] for m in st.session_state.team_members}
+                    member_name_edit = st.selectbox("팀원", list(member_options.keys()),
+                                                    index=list(member_options.keys()).index(cur_member), key="edit_any_member")
+                    member_id_edit = member_options[member_name_edit]
+                with c2:
+                    cat_edit = st.radio("분류", ["보험","비보험"], index=0 if cur_cat=="보험" else 1, horizontal=True, key="edit_any_cat")
+                    filtered_locations = ref.locations_in(cat_edit)
+                    loc_options = {l["name"]: l["id"] for l in filtered_locations}
+                    default_loc_idx = 0
+                    if cur_loc and cur_loc["category"] == cat_edit:
+                        names = list(loc_options.keys())
+                        if cur_loc["name"] in names: default_loc_idx = names.index(cur_loc["name"])
+                    loc_name_edit = st.selectbox("업체", list(loc_options.keys()), index=default_loc_idx, key="edit_any_loc")
+                    loc_id_edit = loc_options[loc_name_edit]
+
+                amount_raw_edit = st.text_input("금액(만원 단위)", value=str(int(float(target["amount"]))), placeholder="예: 50 (만원)", key="edit_any_amount")
+                try:
+                    amount_edit = float(amount_raw_edit.replace(",", "").strip())
+                except ValueError:
+                    amount_edit = None; st.error("금액은 숫자만 입력하세요. (예: 50)")
+                memo_edit = st.text_input("메모(선택)", value=target.get("memo",""), key="edit_any_memo")
+
+                b1, b2 = st.columns(2)
+                with b1:
+                    if st.button("✅ 저장", type="primary", key="edit_any_save"):
+                        if amount_edit is None or amount_edit <= 0:
+                            st.error("금액을 올바르게 입력하세요.")
+                        else:
+                            update_income(target["id"], {
+                                "date": new_date.strftime("%Y-%m-%d"),
+                                "teamMemberId": member_id_edit,
+                                "locationId": loc_id_edit,
+                                "amount": float(amount_edit),
+                                "memo": memo_edit,
+                            })
+                            st.session_state.edit_income_id = None
+                            st.success("수정되었습니다."); st.rerun()
+                with b2:
+                    if st.button("❌ 취소", key="edit_any_cancel"):
+                        st.session_state.edit_income_id = None; st.rerun()
 
 
 # ============================
 # Tab 3: 정산 (최종본 / 보험·비보험 규칙 포함)
 # ============================
-with tab3:
+if section == "정산":
     st.markdown("### 정산")
 
     # ───────── 렌더링 보정 (웨일 대응) ─────────
@@ -1397,25 +3001,17 @@ with tab3:
     </style>
     """, unsafe_allow_html=True)
 
-    # ───────── Supabase 연결 ─────────
-    from supabase import create_client
-    import postgrest
+    # ───────── 저장소 연결 (전역 sb 공유: Supabase 또는 SQLite) ─────────
     from datetime import datetime, timezone
     import pandas as pd
     import unicodedata, re
 
-    SUPA_URL  = st.secrets["SUPABASE_URL"]
-    SUPA_KEY  = st.secrets["SUPABASE_ANON_KEY"]
-    sb = create_client(SUPA_URL, SUPA_KEY)
+    if sb is None:
+        st.info("정산 기능은 저장소(Supabase 또는 SQLite) 설정이 필요합니다.")
+        st.stop()
     sdb = sb.schema("public")
 
     # ───────── 유틸 ─────────
-    def _name_from(_id, coll):
-        for x in (coll or []):
-            if x.get("id") == _id:
-                return x.get("name", "")
-        return ""
-
     def _members():
         return [x.get("name") for x in (st.session_state.team_members or []) if x.get("name")]
 
@@ -1442,16 +3038,54 @@ with tab3:
         s = _norm_text(cat).lower()
         return ("보험" in s) and ("비보험" not in s)
 
-    def sb_get_month(ym_key):
+    # 조회: 월 설정+팀비+이체를 한 묶음으로 (RPC settlement_bundle — sql/006_settlement_bundle.sql,
+    #       없으면 3개 동시 요청) 공유 캐시에 (ym_key, 버전)당 1회. 쓰기 헬퍼만 bump_version으로 무효화.
+    SETTLE_TABLES = ("settlement_month", "settlement_teamfee", "settlement_transfer", "settlement_snapshot")
+    SETTLE_PARTS = {"settlement_teamfee": "teamfee", "settlement_transfer": "transfer"}
+
+    def _fetch_month_bundle(ym_key) -> dict:
         try:
-            res = sdb.table("settlement_month").select("*").eq("ym_key", ym_key).limit(1).execute()
-            data = getattr(res, "data", None) or []
-            return data[0] if data else None
+            data = sdb.rpc("settlement_bundle", {"p_ym_key": ym_key}).execute().data
+            if isinstance(data, list):   # 일부 클라이언트는 스칼라 반환을 목록으로 감쌈
+                data = data[0] if data else {}
+            if isinstance(data, dict) and {"month", "teamfee", "transfer"} <= set(data):
+                return {"month": data["month"], "teamfee": tuple(data["teamfee"] or ()),
+                        "transfer": tuple(data["transfer"] or ()), "snapshot": data.get("snapshot")}
+        except Exception:
+            pass
+        # RPC 미설치 → 요청을 동시에
+        def _one(name):
+            return sdb.table(name).select("*").eq("ym_key", ym_key).limit(1).execute().data or []
+        def _rows(name):
+            return sdb.table(name).select("*").eq("ym_key", ym_key).order("created_at", desc=False).execute().data or []
+        def _snapshot():
+            try:
+                return _one("settlement_snapshot")
+            except Exception:   # 스냅샷 테이블 미설치 (sql/007_settlement_snapshot.sql)
+                return []
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            fm = pool.submit(_one, "settlement_month")
+            ft = pool.submit(_rows, "settlement_teamfee")
+            fr = pool.submit(_rows, "settlement_transfer")
+            fs = pool.submit(_snapshot)
+            month_rows, snap_rows = fm.result(), fs.result()
+            return {"month": month_rows[0] if month_rows else None,
+                    "teamfee": tuple(ft.result()), "transfer": tuple(fr.result()),
+                    "snapshot": snap_rows[0] if snap_rows else None}
+
+    def sb_month_bundle(ym_key) -> dict:
+        """{"month": 월설정|None, "teamfee": (...), "transfer": (...), "snapshot": 마감|None} — 공유 스냅샷(제자리 수정 금지)."""
+        try:
+            return shared_get(("settlement_bundle", ym_key), SETTLE_TABLES, lambda: _fetch_month_bundle(ym_key))
         except Exception as e:
-            st.warning(f"월 설정 조회 실패: {e}")
-            return None
+            st.warning(f"정산 데이터 조회 실패: {e}")
+            return {"month": None, "teamfee": (), "transfer": (), "snapshot": None}
+
+    def sb_get_month(ym_key):
+        return sb_month_bundle(ym_key)["month"]
 
     def sb_upsert_month(ym_key, sungmo_fixed, recv_bs, recv_am):
+        """월 설정 저장 → 저장된 행 반환 (같은 실행에서 다시 조회하지 않도록)."""
         payload = {
             "ym_key": ym_key,
             "sungmo_fixed": int(sungmo_fixed),
@@ -1459,36 +3093,70 @@ with tab3:
             "receiver_amiyou": recv_am,
             "updated_at": datetime.now(timezone.utc).isoformat(),
         }
-        sdb.table("settlement_month").upsert(payload, on_conflict="ym_key").execute()
+        res = sdb.table("settlement_month").upsert(payload, on_conflict="ym_key", returning="representation").execute()
+        bump_version("settlement_month")
+        rows = getattr(res, "data", None) or []
+        return rows[0] if rows else payload
 
     def sb_list(name, ym_key):
-        res = sdb.table(name).select("*").eq("ym_key", ym_key).order("created_at", desc=False).execute()
-        return getattr(res, "data", None) or []
+        return list(sb_month_bundle(ym_key)[SETTLE_PARTS[name]])
+
+    def sb_add(name, payload):
+        sdb.table(name).insert(payload).execute(); bump_version(name)
+    def sb_update(name, pid, payload):
+        sdb.table(name).update(payload).eq("id", pid).execute(); bump_version(name)
+    def sb_delete(name, pid):
+        sdb.table(name).delete().eq("id", pid).execute(); bump_version(name)
+
+    # ───────── 마감 스냅샷 (불변 — 해제 = 삭제) ─────────
+    def sb_close_month(ym_key, snapshot: dict):
+        def _dump(v):   # numpy 스칼라(np.int64 등) → 파이썬 값
+            return json.dumps(v, ensure_ascii=False, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+        row = {
+            "ym_key": ym_key,
+            "closed_at": datetime.now(timezone.utc).isoformat(),
+            "pay_mode": snapshot["pay_mode"],
+            "teamfee_balance": int(snapshot["teamfee_balance"]),
+            "net_json": _dump(snapshot["net"]),
+            "orders_json": _dump(snapshot["orders"]),
+            "summary_json": _dump(snapshot["summary"]),
+            "checksums_json": _dump(snapshot["checksums"]),
+        }
+        sdb.table("settlement_snapshot").insert(row).execute(); bump_version("settlement_snapshot")
+    def sb_reopen_month(ym_key):
+        sdb.table("settlement_snapshot").delete().eq("ym_key", ym_key).execute(); bump_version("settlement_snapshot")
 
-    def sb_add(name, payload): sdb.table(name).insert(payload).execute()
-    def sb_update(name, pid, payload): sdb.table(name).update(payload).eq("id", pid).execute()
-    def sb_delete(name, pid): sdb.table(name).delete().eq("id", pid).execute()
+    def _json_field(snap, name, default):
+        v = snap.get(name)
+        if isinstance(v, str):
+            try:
+                return json.loads(v)
+            except Exception:
+                return default
+        return v if v is not None else default
+
+    def _settle_inputs(dfM, mrow, tf, tr) -> dict:
+        """정산 입력 묶음 (체크섬 대상) — 수입 월 집계, 월 설정, 팀비, 이체."""
+        inc = dfM[["member", "location", "category", "amount", "cnt"]].copy()
+        inc["amount"] = inc["amount"].round(4)
+        return {
+            "incomes": sorted(inc.astype(str).values.tolist()),
+            "month": {k: (mrow or {}).get(k) for k in ("sungmo_fixed", "receiver_busansoom", "receiver_amiyou")},
+            "teamfee": sorted([str(x.get("id")), x.get("who"), int(x.get("amount") or 0), x.get("memo") or ""] for x in tf),
+            "transfer": sorted([str(x.get("id")), x.get("from"), x.get("to"), int(x.get("amount") or 0), x.get("memo") or ""] for x in tr),
+        }
+
+    # ───────── 정산 연도 (선택 연도 파티션만 로드) ─────────
+    cur_year = NOW_KST.year
+    years = income_year_options()
+    year = st.selectbox("정산 연도", years, index=years.index(cur_year) if cur_year in years else 0, key="settle_year")
 
-    # ───────── 원천 수입 ─────────
-    rec = st.session_state.get("income_records", [])
-    if not rec:
+    # ───────── 원천 수입 (월별 롤업 집계: 월·팀원·업체·분류별 합계) ─────────
+    df = income_stats(year)
+    if df.empty:
         st.info("수입 데이터가 없습니다. [수입 입력] 탭에서 먼저 추가해주세요.")
         st.stop()
 
-    df = pd.DataFrame([{
-        "date": r.get("date"),
-        "amount": pd.to_numeric(r.get("amount"), errors="coerce"),
-        "member": _name_from(r.get("teamMemberId",""), st.session_state.team_members),
-        "location": _name_from(r.get("locationId",""), st.session_state.locations),
-        "category": next((l.get("category") for l in (st.session_state.locations or []) if l.get("id")==r.get("locationId")), ""),
-        "memo": r.get("memo",""),
-    } for r in rec])
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df = df.dropna(subset=["date"]).copy()
-    df["year"]  = df["date"].dt.year.astype(int)
-    df["month"] = df["date"].dt.month.astype(int)
-    df["day"]   = df["date"].dt.strftime("%Y-%m-%d")
-
     members_all = _members()
 
     # ───────── 고정 이체(항상 포함) ─────────
@@ -1507,11 +3175,8 @@ with tab3:
         except Exception:
             return False
 
-    # ───────── 연/월 선택 ─────────
-    cur_year = NOW_KST.year
-    years = sorted(df["year"].unique().tolist())
-    year = st.selectbox("정산 연도", years, index=years.index(cur_year) if cur_year in years else 0, key="settle_year")
-    months = sorted(df[df["year"]==year]["month"].unique().tolist())
+    # ───────── 월 선택 ─────────
+    months = sorted(df["month"].unique().tolist())
     month = st.selectbox("정산 월", months, index=len(months)-1, key="settle_month")
     ym_key = f"{year}-{month:02d}"
 
@@ -1521,8 +3186,7 @@ with tab3:
     # ✅ 신규 월(특히 연도 넘어가는 1월)에서 잘못된 기본 수령자가 자동으로 들어가며 정산이 꼬이는 것을 방지:
     #    월 설정이 없으면 '성모 고정액=1000'만 넣고, 부산숨/아미유 수령자는 비워둔 채(사용자 선택) 생성합니다.
     if not mrow:
-        sb_upsert_month(ym_key, 1000, "", "")
-        mrow = sb_get_month(ym_key)
+        mrow = sb_upsert_month(ym_key, 1000, "", "")
 
     sungmo_fixed = int(mrow.get("sungmo_fixed") or 0)
     recv_bs = (mrow.get("receiver_busansoom") or "").strip()   # 부산숨 수령자(허브) — 매달 입력
@@ -1534,372 +3198,407 @@ with tab3:
     tab_in, tab_out = st.tabs(["입력", "정산"])
 
 # ==================== 입력 ====================
-with tab_in:
-    st.markdown("#### 월별 입력")
-
-    # ───────────────── 기본 설정 (항상 펼침) ─────────────────
-    with st.container(border=True):
-        st.markdown("##### 기본 설정")
-        c1, c2, c3 = st.columns(3)
-        nf = c1.number_input("성모 고정액(만원)", value=int(sungmo_fixed), step=10, key="inp_fixed")
-        bs_opts = ["(선택)"] + members_all
-        nb = c2.selectbox("부산숨 수령자", bs_opts, index=(bs_opts.index(recv_bs) if recv_bs in bs_opts else 0), key="inp_recv_bs")
-        am_opts = ["(선택)"] + members_all
-        na = c3.selectbox("아미유 수령자", am_opts, index=(am_opts.index(recv_am) if recv_am in am_opts else 0), key="inp_recv_am")
-
-        if st.button("저장", type="primary", key="inp_save_month_conf"):
-            sb_upsert_month(ym_key, nf, ("" if nb == "(선택)" else nb), ("" if na == "(선택)" else na))
-            st.success("저장되었습니다.")
-            st.rerun()
-
-        st.caption("이진용외과 수령자: 강현석 (고정)")
-
-    # ───────────────── 팀비 사용 (항상 펼침) ─────────────────
-    with st.container(border=True):
-        st.markdown("##### 팀비 사용 입력")
-        c1, c2, c3 = st.columns([1, 1, 2])
-        w = c1.selectbox("사용자", members_all, key="inp_teamfee_user")
-        a = c2.text_input("금액(만원)", "", key="inp_teamfee_amount")
-        m = c3.text_input("메모", "", key="inp_teamfee_memo")
+if section == "정산":
+    with tab_in:
+        st.markdown("#### 월별 입력")
 
-        if st.button("팀비 사용 추가", type="primary", key="inp_teamfee_add"):
-            if str(a).strip().isdigit():
-                sb_add("settlement_teamfee", {"ym_key": ym_key, "who": w, "amount": int(a), "memo": m})
+        # ───────────────── 기본 설정 (항상 펼침) ─────────────────
+        with st.container(border=True):
+            st.markdown("##### 기본 설정")
+            c1, c2, c3 = st.columns(3)
+            nf = c1.number_input("성모 고정액(만원)", value=int(sungmo_fixed), step=10, key="inp_fixed")
+            bs_opts = ["(선택)"] + members_all
+            nb = c2.selectbox("부산숨 수령자", bs_opts, index=(bs_opts.index(recv_bs) if recv_bs in bs_opts else 0), key="inp_recv_bs")
+            am_opts = ["(선택)"] + members_all
+            na = c3.selectbox("아미유 수령자", am_opts, index=(am_opts.index(recv_am) if recv_am in am_opts else 0), key="inp_recv_am")
+
+            if st.button("저장", type="primary", key="inp_save_month_conf"):
+                sb_upsert_month(ym_key, nf, ("" if nb == "(선택)" else nb), ("" if na == "(선택)" else na))
+                st.success("저장되었습니다.")
                 st.rerun()
-            else:
-                st.error("금액은 숫자로 입력하세요.")
 
-        st.markdown("###### 팀비 사용 내역")
-        tf = sb_list("settlement_teamfee", ym_key)
-        if not tf:
-            st.caption("아직 팀비 사용 내역이 없습니다.")
-        else:
-            for r in tf:
-                rid = r["id"]
-                st.session_state.setdefault(f"tf_edit_{rid}", False)
-
-                row1 = st.columns([1, 1, 2, 1, 1])
-                row1[0].write(r["who"])
-                row1[1].write(f"{int(r['amount'])}만원")
-                row1[2].write(r.get("memo",""))
-
-                # 수정 토글
-                if row1[3].button("수정", key=f"tf_btn_edit_{rid}"):
-                    st.session_state[f"tf_edit_{rid}"] = not st.session_state[f"tf_edit_{rid}"]
-
-                # 삭제(확인 없이 즉시)
-                if row1[4].button("삭제", key=f"tf_btn_del_{rid}"):
-                    sb_delete("settlement_teamfee", rid)
+            st.caption("이진용외과 수령자: 강현석 (고정)")
+
+        # ───────────────── 팀비 사용 (항상 펼침) ─────────────────
+        with st.container(border=True):
+            st.markdown("##### 팀비 사용 입력")
+            c1, c2, c3 = st.columns([1, 1, 2])
+            w = c1.selectbox("사용자", members_all, key="inp_teamfee_user")
+            a = c2.text_input("금액(만원)", "", key="inp_teamfee_amount")
+            m = c3.text_input("메모", "", key="inp_teamfee_memo")
+
+            if st.button("팀비 사용 추가", type="primary", key="inp_teamfee_add"):
+                if str(a).strip().isdigit():
+                    sb_add("settlement_teamfee", {"ym_key": ym_key, "who": w, "amount": int(a), "memo": m})
                     st.rerun()
+                else:
+                    st.error("금액은 숫자로 입력하세요.")
 
-                # 편집 영역
-                if st.session_state[f"tf_edit_{rid}"]:
-                    ec1, ec2, ec3 = st.columns([1, 2, 1])
-                    new_a = ec1.text_input("금액", str(int(r["amount"])), key=f"tf_edit_amount_{rid}")
-                    new_m = ec2.text_input("메모", r.get("memo",""), key=f"tf_edit_memo_{rid}")
-                    if ec3.button("저장", key=f"tf_btn_save_{rid}"):
-                        if str(new_a).strip().isdigit():
-                            sb_update("settlement_teamfee", rid, {"amount": int(new_a), "memo": new_m})
-                            st.session_state[f"tf_edit_{rid}"] = False
-                            st.success("수정되었습니다.")
-                            st.rerun()
-                        else:
-                            st.error("금액은 숫자로 입력하세요.")
-
-    # ───────────────── 팀원 간 이체 (항상 펼침 / 수정 가능) ─────────────────
-    with st.container(border=True):
-        st.markdown("##### 팀원 간 이체 입력")
-        # 고정 이체 안내
-        if (FIXED_TRANSFER_FROM in members_all) and (FIXED_TRANSFER_TO in members_all):
-            st.caption(f"고정 포함: {FIXED_TRANSFER_FROM} → {FIXED_TRANSFER_TO} {FIXED_TRANSFER_AMT}만원")
-        c1, c2, c3, c4 = st.columns([1, 1, 1, 2])
-        f = c1.selectbox("보낸 사람", members_all, key="inp_tr_from")
-        t = c2.selectbox("받는 사람", [x for x in members_all if x != f], key="inp_tr_to")
-        ta = c3.text_input("금액(만원)", "", key="inp_tr_amount")
-        tm = c4.text_input("메모", "", key="inp_tr_memo")
-
-        if st.button("이체 추가", type="primary", key="inp_tr_add"):
-            if str(ta).strip().isdigit():
-                sb_add("settlement_transfer", {"ym_key": ym_key, "from": f, "to": t, "amount": int(ta), "memo": tm})
-                st.rerun()
+            st.markdown("###### 팀비 사용 내역")
+            tf = sb_list("settlement_teamfee", ym_key)
+            if not tf:
+                st.caption("아직 팀비 사용 내역이 없습니다.")
             else:
-                st.error("금액은 숫자로 입력하세요.")
-
-        st.markdown("###### 이체 내역")
-        tr = sb_list("settlement_transfer", ym_key)
-
-        # 고정 이체(가상 행) + 사용자 입력 이체(단, 고정과 동일한 행은 중복 방지)
-        tr_rows = []
-        if (FIXED_TRANSFER_FROM in members_all) and (FIXED_TRANSFER_TO in members_all):
-            tr_rows.append({
-                "id": "__fixed__",
-                "from": FIXED_TRANSFER_FROM,
-                "to": FIXED_TRANSFER_TO,
-                "amount": FIXED_TRANSFER_AMT,
-                "memo": FIXED_TRANSFER_MEMO,
-            })
-        tr_rows.extend([r for r in tr if not _is_fixed_transfer_row(r)])
+                for r in tf:
+                    rid = r["id"]
+                    st.session_state.setdefault(f"tf_edit_{rid}", False)
+
+                    row1 = st.columns([1, 1, 2, 1, 1])
+                    row1[0].write(r["who"])
+                    row1[1].write(f"{int(r['amount'])}만원")
+                    row1[2].write(r.get("memo",""))
 
-        if not tr_rows:
-            st.caption("등록된 이체 내역이 없습니다.")
-        else:
-            for r in tr_rows:
-                rid = r["id"]
-                if rid != "__fixed__":
-                    st.session_state.setdefault(f"tr_edit_{rid}", False)
-
-                row = st.columns([1, 0.3, 1, 2, 1, 1])
-                row[0].write(r["from"])
-                row[1].write("→")
-                row[2].write(r["to"])
-                row[3].write(r.get("memo",""))
-                row[4].write(f"{int(r['amount'])}만원")
-
-                if rid == "__fixed__":
-                    row[5].write("고정")
-                else:
                     # 수정 토글
-                    if row[4].button("수정", key=f"tr_btn_edit_{rid}"):
-                        st.session_state[f"tr_edit_{rid}"] = not st.session_state[f"tr_edit_{rid}"]
+                    if row1[3].button("수정", key=f"tf_btn_edit_{rid}"):
+                        st.session_state[f"tf_edit_{rid}"] = not st.session_state[f"tf_edit_{rid}"]
 
                     # 삭제(확인 없이 즉시)
-                    if row[5].button("삭제", key=f"tr_btn_del_{rid}"):
-                        sb_delete("settlement_transfer", rid)
+                    if row1[4].button("삭제", key=f"tf_btn_del_{rid}"):
+                        sb_delete("settlement_teamfee", rid)
                         st.rerun()
 
-                # 편집 영역 (보낸사람/받는사람/금액/메모 모두 수정 가능)
-                if rid != "__fixed__" and st.session_state[f"tr_edit_{rid}"]:
-                    # 현재 값이 members_all에 없을 수도 있으니 방어적으로 index 계산
-                    cur_from = r.get("from","")
-                    cur_to   = r.get("to","")
-                    from_idx = members_all.index(cur_from) if cur_from in members_all else 0
-                    to_opts  = [x for x in members_all if x != cur_from]
-                    to_idx   = to_opts.index(cur_to) if cur_to in to_opts else 0
-
-                    ec1, ec2, ec3, ec4, ec5 = st.columns([1, 1, 1, 2, 1])
-                    new_from = ec1.selectbox("보낸 사람", members_all, index=from_idx, key=f"tr_edit_from_{rid}")
-                    # 받는 사람 옵션은 보낸 사람과 달라야 하므로 new_from 기준으로 다시 계산
-                    to_opts2 = [x for x in members_all if x != new_from]
-                    # 기존 받는 사람이 to_opts2에 없을 수 있으니 방어
-                    to_idx2 = to_opts2.index(cur_to) if cur_to in to_opts2 else 0
-                    new_to   = ec2.selectbox("받는 사람", to_opts2, index=to_idx2, key=f"tr_edit_to_{rid}")
-                    new_amt  = ec3.text_input("금액", str(int(r["amount"])), key=f"tr_edit_amount_{rid}")
-                    new_memo = ec4.text_input("메모", r.get("memo",""), key=f"tr_edit_memo_{rid}")
-
-                    if ec5.button("저장", key=f"tr_btn_save_{rid}"):
-                        try:
-                            amt_int = int(str(new_amt).strip())
-                        except:
-                            st.error("금액은 숫자로 입력하세요.")
-                        else:
-                            payload = {"from": new_from, "to": new_to, "amount": amt_int, "memo": new_memo}
-                            sb_update("settlement_transfer", rid, payload)
-                            st.session_state[f"tr_edit_{rid}"] = False
-                            st.success("수정되었습니다.")
+                    # 편집 영역
+                    if st.session_state[f"tf_edit_{rid}"]:
+                        ec1, ec2, ec3 = st.columns([1, 2, 1])
+                        new_a = ec1.text_input("금액", str(int(r["amount"])), key=f"tf_edit_amount_{rid}")
+                        new_m = ec2.text_input("메모", r.get("memo",""), key=f"tf_edit_memo_{rid}")
+                        if ec3.button("저장", key=f"tf_btn_save_{rid}"):
+                            if str(new_a).strip().isdigit():
+                                sb_update("settlement_teamfee", rid, {"amount": int(new_a), "memo": new_m})
+                                st.session_state[f"tf_edit_{rid}"] = False
+                                st.success("수정되었습니다.")
+                                st.rerun()
+                            else:
+                                st.error("금액은 숫자로 입력하세요.")
+
+        # ───────────────── 팀원 간 이체 (항상 펼침 / 수정 가능) ─────────────────
+        with st.container(border=True):
+            st.markdown("##### 팀원 간 이체 입력")
+            # 고정 이체 안내
+            if (FIXED_TRANSFER_FROM in members_all) and (FIXED_TRANSFER_TO in members_all):
+                st.caption(f"고정 포함: {FIXED_TRANSFER_FROM} → {FIXED_TRANSFER_TO} {FIXED_TRANSFER_AMT}만원")
+            c1, c2, c3, c4 = st.columns([1, 1, 1, 2])
+            f = c1.selectbox("보낸 사람", members_all, key="inp_tr_from")
+            t = c2.selectbox("받는 사람", [x for x in members_all if x != f], key="inp_tr_to")
+            ta = c3.text_input("금액(만원)", "", key="inp_tr_amount")
+            tm = c4.text_input("메모", "", key="inp_tr_memo")
+
+            if st.button("이체 추가", type="primary", key="inp_tr_add"):
+                if str(ta).strip().isdigit():
+                    sb_add("settlement_transfer", {"ym_key": ym_key, "from": f, "to": t, "amount": int(ta), "memo": tm})
+                    st.rerun()
+                else:
+                    st.error("금액은 숫자로 입력하세요.")
+
+            st.markdown("###### 이체 내역")
+            tr = sb_list("settlement_transfer", ym_key)
+
+            # 고정 이체(가상 행) + 사용자 입력 이체(단, 고정과 동일한 행은 중복 방지)
+            tr_rows = []
+            if (FIXED_TRANSFER_FROM in members_all) and (FIXED_TRANSFER_TO in members_all):
+                tr_rows.append({
+                    "id": "__fixed__",
+                    "from": FIXED_TRANSFER_FROM,
+                    "to": FIXED_TRANSFER_TO,
+                    "amount": FIXED_TRANSFER_AMT,
+                    "memo": FIXED_TRANSFER_MEMO,
+                })
+            tr_rows.extend([r for r in tr if not _is_fixed_transfer_row(r)])
+
+            if not tr_rows:
+                st.caption("등록된 이체 내역이 없습니다.")
+            else:
+                for r in tr_rows:
+                    rid = r["id"]
+                    if rid != "__fixed__":
+                        st.session_state.setdefault(f"tr_edit_{rid}", False)
+
+                    row = st.columns([1, 0.3, 1, 2, 1, 1])
+                    row[0].write(r["from"])
+                    row[1].write("→")
+                    row[2].write(r["to"])
+                    row[3].write(r.get("memo",""))
+                    row[4].write(f"{int(r['amount'])}만원")
+
+                    if rid == "__fixed__":
+                        row[5].write("고정")
+                    else:
+                        # 수정 토글
+                        if row[4].button("수정", key=f"tr_btn_edit_{rid}"):
+                            st.session_state[f"tr_edit_{rid}"] = not st.session_state[f"tr_edit_{rid}"]
+
+                        # 삭제(확인 없이 즉시)
+                        if row[5].button("삭제", key=f"tr_btn_del_{rid}"):
+                            sb_delete("settlement_transfer", rid)
                             st.rerun()
 
+                    # 편집 영역 (보낸사람/받는사람/금액/메모 모두 수정 가능)
+                    if rid != "__fixed__" and st.session_state[f"tr_edit_{rid}"]:
+                        # 현재 값이 members_all에 없을 수도 있으니 방어적으로 index 계산
+                        cur_from = r.get("from","")
+                        cur_to   = r.get("to","")
+                        from_idx = members_all.index(cur_from) if cur_from in members_all else 0
+                        to_opts  = [x for x in members_all if x != cur_from]
+                        to_idx   = to_opts.index(cur_to) if cur_to in to_opts else 0
+
+                        ec1, ec2, ec3, ec4, ec5 = st.columns([1, 1, 1, 2, 1])
+                        new_from = ec1.selectbox("보낸 사람", members_all, index=from_idx, key=f"tr_edit_from_{rid}")
+                        # 받는 사람 옵션은 보낸 사람과 달라야 하므로 new_from 기준으로 다시 계산
+                        to_opts2 = [x for x in members_all if x != new_from]
+                        # 기존 받는 사람이 to_opts2에 없을 수 있으니 방어
+                        to_idx2 = to_opts2.index(cur_to) if cur_to in to_opts2 else 0
+                        new_to   = ec2.selectbox("받는 사람", to_opts2, index=to_idx2, key=f"tr_edit_to_{rid}")
+                        new_amt  = ec3.text_input("금액", str(int(r["amount"])), key=f"tr_edit_amount_{rid}")
+                        new_memo = ec4.text_input("메모", r.get("memo",""), key=f"tr_edit_memo_{rid}")
+
+                        if ec5.button("저장", key=f"tr_btn_save_{rid}"):
+                            try:
+                                amt_int = int(str(new_amt).strip())
+                            except:
+                                st.error("금액은 숫자로 입력하세요.")
+                            else:
+                                payload = {"from": new_from, "to": new_to, "amount": amt_int, "memo": new_memo}
+                                sb_update("settlement_transfer", rid, payload)
+                                st.session_state[f"tr_edit_{rid}"] = False
+                                st.success("수정되었습니다.")
+                                st.rerun()
+
+
+        # ==================== 정산 ====================
+        with tab_out:
+            st.markdown("#### 정산 결과")
+            dfM = df[df["month"]==month]
+
+            tf = sb_list("settlement_teamfee", ym_key)
+            tr = sb_list("settlement_transfer", ym_key)
+
+            # ───────── 마감 여부 / 입력 체크섬 ─────────
+            cur_sums = input_checksums(_settle_inputs(dfM, mrow, tf, tr))
+            snap = sb_month_bundle(ym_key).get("snapshot")
+
+            if snap:
+                # 🔒 마감된 달: 저장된 스냅샷만 표시 (재계산 없음), 입력이 바뀌었으면 경고
+                st.success(f"🔒 {ym_key} 마감됨 — {str(snap.get('closed_at') or '')[:16].replace('T', ' ')} (UTC)")
+                drift = drifted_parts(_json_field(snap, "checksums_json", {}), cur_sums)
+                if drift:
+                    labels = {"incomes": "수입", "month": "월 설정", "teamfee": "팀비", "transfer": "이체"}
+                    st.warning(
+                        "⚠️ 마감 후 입력이 변경되었습니다: " + ", ".join(labels.get(d, d) for d in drift)
+                        + " — 아래 값은 마감 시점 그대로입니다. 반영하려면 마감 해제 후 다시 마감하세요."
+                    )
+                summary = _json_field(snap, "summary_json", {})
+                st.dataframe(pd.DataFrame(_json_field(snap, "net_json", [])), use_container_width=True, hide_index=True)
+                st.markdown(f"##### 최종 지급 지시서 (개인 정산) — {snap.get('pay_mode') or ''}")
+                st.dataframe(
+                    pd.DataFrame(_json_field(snap, "orders_json", []), columns=["from", "to", "amount"])
+                      .rename(columns={"from": "From", "to": "To", "amount": "금액(만원)"}),
+                    use_container_width=True, hide_index=True,
+                )
+                st.markdown(f"##### 팀비 (별도) — 잔액 {int(snap.get('teamfee_balance') or 0)}만원")
+                if summary:
+                    st.caption(f"{summary.get('sm_name', '')}: 고정액 {summary.get('sungmo_fixed', 0)} - 성모 지급합계 "
+                               f"{summary.get('sm_sum', 0)} - 팀비 사용합계 {summary.get('tf_sum', 0)}")
+                if st.button("🔓 마감 해제", key="settle_reopen"):
+                    sb_reopen_month(ym_key); st.rerun()
+            else:
+                # ✅ 필수 수령자(해당월 입력값) 검증 — 1월에 월 설정이 비어있으면 결과가 엉뚱해지므로 여기서 차단
+                if not recv_bs:
+                    st.warning("부산숨 수령자가 지정되지 않았습니다. [입력] → [기본 설정]에서 부산숨 수령자를 선택 후 저장하세요.")
+                    st.stop()
+                if not recv_am:
+                    st.warning("아미유 수령자가 지정되지 않았습니다. [입력] → [기본 설정]에서 아미유 수령자를 선택 후 저장하세요.")
+                    st.stop()
+
+                def locdf(n):
+                    d = dfM[dfM["location"]==n]
+                    if d.empty:
+                        return pd.DataFrame(columns=["member","amount"])
+                    return d.groupby("member", as_index=False)["amount"].sum()
+
+                # 위치명(데이터 표기에 맞게 필요시 확장)
+                def _pick_loc(default_label: str, keywords: list[str]) -> str:
+                    cand = [str(x) for x in (dfM["location"].dropna().unique().tolist() if "location" in dfM.columns else [])]
+                    # 우선: 기본 라벨이 정확히 존재하면 사용
+                    for x in cand:
+                        if _norm_text(x) == _norm_text(default_label):
+                            return x
+                    # 다음: 키워드 포함(정규화 기준)
+                    for kw in keywords:
+                        nkw = _norm_text(kw)
+                        for x in cand:
+                            if nkw and (nkw in _norm_text(x)):
+                                return x
+                    return default_label
+
+                # 사용자 운영 기준 기본 라벨
+                bs_name  = _pick_loc("부산숨",   ["부산숨", "숨"])
+                sm_name  = _pick_loc("성모안과", ["성모안과", "성모"])
+                amy_name = _pick_loc("아미유외과", ["아미유외과", "아미유"])
+                lee_name = _pick_loc("이진용외과", ["이진용외과", "이진용"])
+
+                # 지점별 집계
+                ib = locdf(bs_name)
+                im = locdf(sm_name)
+                il = locdf(lee_name)
+
+                # ✅ 아미유: '보험'만 포함, '비보험' 포함된 건 제외
+                amy_rows = dfM[dfM["location"].astype(str).str.contains("아미유", na=False)].copy()
+                if not amy_rows.empty:
+                    amy_rows = amy_rows[ amy_rows["category"].apply(_is_insurance_category) ].copy()
+                    if not amy_rows.empty:
+                        ia = amy_rows.groupby("member", as_index=False)["amount"].sum()
+                    else:
+                        ia = pd.DataFrame(columns=["member","amount"])
+                else:
+                    ia = pd.DataFrame(columns=["member","amount"])
 
-    # ==================== 정산 ====================
-    with tab_out:
-        st.markdown("#### 정산 결과")
-        dfM = df[(df["year"]==year) & (df["month"]==month)]
+                # ───────── 트랜잭션 원장 ─────────
+                tx = []
 
-        # ✅ 필수 수령자(해당월 입력값) 검증 — 1월에 월 설정이 비어있으면 결과가 엉뚱해지므로 여기서 차단
-        if not recv_bs:
-            st.warning("부산숨 수령자가 지정되지 않았습니다. [입력] → [기본 설정]에서 부산숨 수령자를 선택 후 저장하세요.")
-            st.stop()
-        if not recv_am:
-            st.warning("아미유 수령자가 지정되지 않았습니다. [입력] → [기본 설정]에서 아미유 수령자를 선택 후 저장하세요.")
-            st.stop()
+                # ① 성모 고정액(외부 유입) → 강현석 (순액 계산에서 제외, 원장에만 기록)
+                if sungmo_fixed:
+                    tx.append({"from":"외부","to":recv_lee,"amount":int(sungmo_fixed),"reason":"성모 고정 수입"})
 
-        def locdf(n):
-            d = dfM[dfM["location"]==n]
-            if d.empty:
-                return pd.DataFrame(columns=["member","amount"])
-            return d.groupby("member", as_index=False)["amount"].sum()
-
-        # 위치명(데이터 표기에 맞게 필요시 확장)
-        def _pick_loc(default_label: str, keywords: list[str]) -> str:
-            cand = [str(x) for x in (dfM["location"].dropna().unique().tolist() if "location" in dfM.columns else [])]
-            # 우선: 기본 라벨이 정확히 존재하면 사용
-            for x in cand:
-                if _norm_text(x) == _norm_text(default_label):
-                    return x
-            # 다음: 키워드 포함(정규화 기준)
-            for kw in keywords:
-                nkw = _norm_text(kw)
-                for x in cand:
-                    if nkw and (nkw in _norm_text(x)):
-                        return x
-            return default_label
-
-        # 사용자 운영 기준 기본 라벨
-        bs_name  = _pick_loc("부산숨",   ["부산숨", "숨"])
-        sm_name  = _pick_loc("성모안과", ["성모안과", "성모"])
-        amy_name = _pick_loc("아미유외과", ["아미유외과", "아미유"])
-        lee_name = _pick_loc("이진용외과", ["이진용외과", "이진용"])
-
-        # 지점별 집계
-        ib = locdf(bs_name)
-        im = locdf(sm_name)
-        il = locdf(lee_name)
-
-        # ✅ 아미유: '보험'만 포함, '비보험' 포함된 건 제외
-        amy_rows = dfM[dfM["location"].astype(str).str.contains("아미유", na=False)].copy()
-        if not amy_rows.empty:
-            amy_rows = amy_rows[ amy_rows["category"].apply(_is_insurance_category) ].copy()
-            if not amy_rows.empty:
-                ia = amy_rows.groupby("member", as_index=False)["amount"].sum()
-            else:
-                ia = pd.DataFrame(columns=["member","amount"])
-        else:
-            ia = pd.DataFrame(columns=["member","amount"])
-
-        tf = sb_list("settlement_teamfee", ym_key)
-        tr = sb_list("settlement_transfer", ym_key)
-
-        # ───────── 트랜잭션 원장 ─────────
-        tx = []
-
-        # ① 성모 고정액(외부 유입) → 강현석 (순액 계산에서 제외, 원장에만 기록)
-        if sungmo_fixed:
-            tx.append({"from":"외부","to":recv_lee,"amount":int(sungmo_fixed),"reason":"성모 고정 수입"})
-
-        # ② 부산숨: 수령자 → 팀원 (자기지급 제외)
-        if recv_bs and not ib.empty:
-            for _, r in ib.iterrows():
-                m, a = r["member"], int(r["amount"])
-                if m and a and not _same_person(m, recv_bs):
-                    tx.append({"from":recv_bs,"to":m,"amount":a,"reason":bs_name})
-
-        # ③ 성모: 강현석 → 팀원 (자기지급 제외)
-        if not im.empty:
-            for _, r in im.iterrows():
-                m, a = r["member"], int(r["amount"])
-                if m and a and not _same_person(m, recv_lee):
-                    tx.append({"from":recv_lee,"to":m,"amount":a,"reason":sm_name})
-
-        # ④ 이진용: 강현석 → 팀원 (자기지급 제외)
-        if not il.empty:
-            for _, r in il.iterrows():
-                m, a = r["member"], int(r["amount"])
-                if m and a and not _same_person(m, recv_lee):
-                    tx.append({"from":recv_lee,"to":m,"amount":a,"reason":lee_name})
-
-        # ⑤ 아미유(보험만 집계됨): 수령자 → 팀원 (자기지급 제외)
-        if recv_am and not ia.empty:
-            for _, r in ia.iterrows():
-                m, a = r["member"], int(r["amount"])
-                if m and a and not _same_person(m, recv_am):
-                    tx.append({"from":recv_am,"to":m,"amount":a,"reason":amy_name})
-
-        # ⑥ 팀원 간 이체
-        # 고정 이체는 항상 포함 (단, 구성원에 없으면 건너뜀)
-        if (FIXED_TRANSFER_FROM in members_all) and (FIXED_TRANSFER_TO in members_all) and int(FIXED_TRANSFER_AMT):
-            tx.append({
-                "from": FIXED_TRANSFER_FROM,
-                "to": FIXED_TRANSFER_TO,
-                "amount": int(FIXED_TRANSFER_AMT),
-                "reason": f"이체:{FIXED_TRANSFER_MEMO}",
-            })
+                def _amounts(d):
+                    return dict(zip(d["member"], d["amount"])) if not d.empty else {}
 
-        # 사용자 입력 이체 (고정 이체와 동일한 행은 중복 방지)
-        for r in tr:
-            if _is_fixed_transfer_row(r):
-                continue
-            amt = int(r.get("amount", 0) or 0)
-            if amt:
-                tx.append({"from":r["from"],"to":r["to"],"amount":amt,"reason":f"이체:{r.get('memo','')}"})
-
-        # ⑦ 팀비 지출: 강현석 → 사용자
-        for x in tf:
-            amt = int(x.get("amount", 0) or 0)
-            who = x.get("who", "")
-            if who and amt:
-                tx.append({"from":recv_lee,"to":who,"amount":amt,"reason":f"팀비:{x.get('memo','')}"})
-
-        # ───────── 팀비 잔액 (별도 표기) ─────────
-        sm_sum = int(im["amount"].sum()) if not im.empty else 0
-        tf_sum = sum(int(x.get("amount", 0) or 0) for x in tf)
-        teamfee_bal = int(sungmo_fixed) - sm_sum - tf_sum
-
-        if not tx:
-            st.info("정산할 항목이 없습니다."); st.stop()
-
-        # ───────── 개인 순액 계산 (‘외부’ 제외) ─────────
-        tx_df = pd.DataFrame(tx)
-        tx_df = tx_df[tx_df["from"] != "외부"].copy()  # 외부→강 650 제외
-
-        people = sorted(set(tx_df["from"]) | set(tx_df["to"]))
-        bal = {p: 0 for p in people}
-        for _, r in tx_df.iterrows():
-            f, t, a = r["from"], r["to"], int(r["amount"])
-            bal[f] -= a
-            bal[t] += a
-
-        # 실제 순액 표
-        net = pd.DataFrame([{"사람": k, "순액(만원)": v} for k, v in bal.items()]).sort_values("순액(만원)", ascending=False)
-
-        # 표시용 보정: 성모 수령자(현재 강현석) 표기에서 팀비잔액 분리 (예: 575 - 320 = 255)
-        net_display = net.copy()
-        if (net_display["사람"] == recv_lee).any():
-            net_display.loc[net_display["사람"] == recv_lee, "순액(만원)"] = \
-                net_display.loc[net_display["사람"] == recv_lee, "순액(만원)"].astype(int) - int(teamfee_bal)
-
-        st.dataframe(net_display, use_container_width=True, hide_index=True)
-
-        # ───────── 최종 지급 지시서 (허브=부산숨 수령자) ─────────
-        st.markdown("##### 최종 지급 지시서 (개인 정산)")
-        hub = recv_bs
-        orders = []
-        for _, r in net_display.iterrows():  # 화면 표시 기준으로 지시서 생성
-            p, b = r["사람"], int(r["순액(만원)"])
-            if _same_person(p, hub):
-                continue
-            if b > 0:
-                orders.append({"From": hub, "To": p, "금액(만원)": b})
-            elif b < 0:
-                orders.append({"From": p, "To": hub, "금액(만원)": abs(b)})
-        st.dataframe(pd.DataFrame(orders), use_container_width=True, hide_index=True)
-
-        # ───────── 팀비 (별도) ─────────
-        st.markdown(f"##### 팀비 (별도) — 잔액 {teamfee_bal}만원")
-        st.caption(f"{sm_name}: 고정액 {sungmo_fixed} - 성모 지급합계 {sm_sum} - 팀비 사용합계 {tf_sum}")
-
-        # 성모 지급 요약(개인별)
-        st.markdown("###### 성모안과 지급 요약")
-        if not im.empty:
-            sm_view = im.rename(columns={"member":"수취자","amount":"금액(만원)"}).sort_values("금액(만원)", ascending=False)
-            st.dataframe(sm_view, use_container_width=True, hide_index=True)
-            st.caption(f"성모 지급합계: {int(sm_view['금액(만원)'].sum())}만원")
-        else:
-            st.caption("이번 달 성모안과 지급이 없습니다.")
-
-        # 팀비 사용 내역
-        st.markdown("###### 팀비 사용 내역")
-        if tf:
-            tf_df = pd.DataFrame(tf).copy()
-            tf_df["amount"] = pd.to_numeric(tf_df["amount"], errors="coerce").fillna(0).astype(int)
-            cols = ["who","amount","memo"]
-            if "created_at" in tf_df.columns:
-                try:
-                    tf_df["일시"] = pd.to_datetime(tf_df["created_at"], errors="coerce")\
-                                       .dt.tz_convert("Asia/Seoul")\
-                                       .dt.strftime("%Y-%m-%d %H:%M")
-                    cols = ["일시"] + cols
-                except Exception:
-                    pass
-            view = tf_df[[c for c in cols if c in tf_df.columns]]\
-                     .rename(columns={"who":"사용자","amount":"금액(만원)","memo":"메모"})
-            st.dataframe(view, use_container_width=True, hide_index=True)
-            st.caption(f"팀비 사용합계: {int(tf_df['amount'].sum())}만원")
-        else:
-            st.caption("이번 달 팀비 사용 내역이 없습니다.")
+                # ② 부산숨: 수령자 → 팀원 (자기지급 제외)
+                if recv_bs:
+                    tx += payout_entries(recv_bs, _amounts(ib), bs_name, same=_same_person)
+
+                # ③ 성모: 강현석 → 팀원 (자기지급 제외)
+                tx += payout_entries(recv_lee, _amounts(im), sm_name, same=_same_person)
+
+                # ④ 이진용: 강현석 → 팀원 (자기지급 제외)
+                tx += payout_entries(recv_lee, _amounts(il), lee_name, same=_same_person)
+
+                # ⑤ 아미유(보험만 집계됨): 수령자 → 팀원 (자기지급 제외)
+                if recv_am:
+                    tx += payout_entries(recv_am, _amounts(ia), amy_name, same=_same_person)
+
+                # ⑥ 팀원 간 이체
+                # 고정 이체는 항상 포함 (단, 구성원에 없으면 건너뜀)
+                if (FIXED_TRANSFER_FROM in members_all) and (FIXED_TRANSFER_TO in members_all) and int(FIXED_TRANSFER_AMT):
+                    tx.append({
+                        "from": FIXED_TRANSFER_FROM,
+                        "to": FIXED_TRANSFER_TO,
+                        "amount": int(FIXED_TRANSFER_AMT),
+                        "reason": f"이체:{FIXED_TRANSFER_MEMO}",
+                    })
+
+                # 사용자 입력 이체 (고정 이체와 동일한 행은 중복 방지)
+                for r in tr:
+                    if _is_fixed_transfer_row(r):
+                        continue
+                    amt = int(r.get("amount", 0) or 0)
+                    if amt:
+                        tx.append({"from":r["from"],"to":r["to"],"amount":amt,"reason":f"이체:{r.get('memo','')}"})
+
+                # ⑦ 팀비 지출: 강현석 → 사용자
+                for x in tf:
+                    amt = int(x.get("amount", 0) or 0)
+                    who = x.get("who", "")
+                    if who and amt:
+                        tx.append({"from":recv_lee,"to":who,"amount":amt,"reason":f"팀비:{x.get('memo','')}"})
+
+                # ───────── 팀비 잔액 (별도 표기) ─────────
+                sm_sum = int(im["amount"].sum()) if not im.empty else 0
+                tf_sum = sum(int(x.get("amount", 0) or 0) for x in tf)
+                teamfee_bal = int(sungmo_fixed) - sm_sum - tf_sum
+
+                if not tx:
+                    st.info("정산할 항목이 없습니다."); st.stop()
+
+                # ───────── 개인 순액 계산 (‘외부’ 제외 — 외부→강 650 제외) ─────────
+                bal = net_balances(tx)
+
+                # 실제 순액 표
+                net = pd.DataFrame([{"사람": k, "순액(만원)": v} for k, v in bal.items()]).sort_values("순액(만원)", ascending=False)
+
+                # 표시용 보정: 성모 수령자(현재 강현석) 표기에서 팀비잔액 분리 (예: 575 - 320 = 255)
+                net_display = net.copy()
+                if (net_display["사람"] == recv_lee).any():
+                    net_display.loc[net_display["사람"] == recv_lee, "순액(만원)"] = \
+                        net_display.loc[net_display["사람"] == recv_lee, "순액(만원)"].astype(int) - int(teamfee_bal)
+
+                st.dataframe(net_display, use_container_width=True, hide_index=True)
+                export_controls(
+                    "settle_ledger_export", f"settlement_ledger_{ym_key}", lambda: iter([tx]),
+                    {"from": "From", "to": "To", "amount": "금액(만원)", "reason": "사유"}, numeric=("amount",),
+                )
+
+                # ───────── 최종 지급 지시서 (최소 이체 / 허브=부산숨 수령자) ─────────
+                st.markdown("##### 최종 지급 지시서 (개인 정산)")
+                pay_mode = st.radio("지급 방식", ["최소 이체", "허브(부산숨 수령자)"], horizontal=True, index=0, key="settle_pay_mode")
+                hub = recv_bs
+                # 화면 표시 기준 순액으로 지시서 생성 (허브는 차액 흡수 — 두 방식 동일)
+                disp_bal = {p: int(b) for p, b in zip(net_display["사람"], net_display["순액(만원)"])}
+                orders = settle(disp_bal, "hub" if pay_mode.startswith("허브") else "minimal", hub=hub, same=_same_person)
+                st.dataframe(
+                    pd.DataFrame(orders, columns=["from", "to", "amount"])
+                      .rename(columns={"from": "From", "to": "To", "amount": "금액(만원)"}),
+                    use_container_width=True, hide_index=True,
+                )
+                st.caption(f"지급 {len(orders)}건")
+
+                # ───────── 팀비 (별도) ─────────
+                st.markdown(f"##### 팀비 (별도) — 잔액 {teamfee_bal}만원")
+                st.caption(f"{sm_name}: 고정액 {sungmo_fixed} - 성모 지급합계 {sm_sum} - 팀비 사용합계 {tf_sum}")
+
+                # 성모 지급 요약(개인별)
+                st.markdown("###### 성모안과 지급 요약")
+                if not im.empty:
+                    sm_view = im.rename(columns={"member":"수취자","amount":"금액(만원)"}).sort_values("금액(만원)", ascending=False)
+                    st.dataframe(sm_view, use_container_width=True, hide_index=True)
+                    st.caption(f"성모 지급합계: {int(sm_view['금액(만원)'].sum())}만원")
+                else:
+                    st.caption("이번 달 성모안과 지급이 없습니다.")
+
+                # 팀비 사용 내역
+                st.markdown("###### 팀비 사용 내역")
+                if tf:
+                    tf_df = pd.DataFrame(tf).copy()
+                    tf_df["amount"] = pd.to_numeric(tf_df["amount"], errors="coerce").fillna(0).astype(int)
+                    cols = ["who","amount","memo"]
+                    if "created_at" in tf_df.columns:
+                        try:
+                            tf_df["일시"] = pd.to_datetime(tf_df["created_at"], errors="coerce")\
+                                               .dt.tz_convert("Asia/Seoul")\
+                                               .dt.strftime("%Y-%m-%d %H:%M")
+                            cols = ["일시"] + cols
+                        except Exception:
+                            pass
+                    view = tf_df[[c for c in cols if c in tf_df.columns]]\
+                             .rename(columns={"who":"사용자","amount":"금액(만원)","memo":"메모"})
+                    st.dataframe(view, use_container_width=True, hide_index=True)
+                    st.caption(f"팀비 사용합계: {int(tf_df['amount'].sum())}만원")
+                else:
+                    st.caption("이번 달 팀비 사용 내역이 없습니다.")
+
+                # ───────── 이 달 마감 (스냅샷 저장) ─────────
+                st.divider()
+                if st.button("🔒 이 달 마감 (정산 결과 스냅샷 저장)", key="settle_close"):
+                    closed = False
+                    try:
+                        sb_close_month(ym_key, {
+                            "pay_mode": pay_mode,
+                            "teamfee_balance": int(teamfee_bal),
+                            "net": net_display.to_dict("records"),
+                            "orders": orders,
+                            "summary": {"sm_name": sm_name, "sungmo_fixed": int(sungmo_fixed),
+                                        "sm_sum": int(sm_sum), "tf_sum": int(tf_sum)},
+                            "checksums": cur_sums,
+                        })
+                        closed = True
+                    except Exception as e:
+                        st.error(f"마감 실패: {e} (sql/007_settlement_snapshot.sql 적용 여부를 확인하세요)")
+                    if closed:
+                        st.rerun()
 
 # ============================
 # Tab 4: 계산서 (입력 / 수정·삭제)
 # ============================
-with tab4:
+if section == "계산서":
     import streamlit as st
     import pandas as pd
     from datetime import datetime
@@ -1909,42 +3608,6 @@ with tab4:
     except Exception:
         NOW_KST = datetime.now()
 
-    # ───────────────── Supabase 클라이언트 ─────────────────
-    from supabase import create_client
-
-    @st.cache_resource
-    def _get_supabase():
-        url = st.secrets["SUPABASE_URL"]
-        key = st.secrets["SUPABASE_ANON_KEY"]
-        return create_client(url, key)
-
-    _sb = _get_supabase()
-
-    # ───────────────── 컬럼 키 매핑(Camel ↔ snake) ─────────────────
-    def _to_db_keys(d: dict) -> dict:
-        mapping = {
-            "teamMemberId": "team_member_id",
-            "locationId": "location_id",
-            "insType": "ins_type",
-            "issueAmount": "issue_amount",
-            "taxAmount": "tax_amount",
-            "ym": "ym",
-            "id": "id",
-        }
-        return {mapping.get(k, k): v for k, v in d.items()}
-
-    def _to_client_keys(d: dict) -> dict:
-        mapping = {
-            "team_member_id": "teamMemberId",
-            "location_id": "locationId",
-            "ins_type": "insType",
-            "issue_amount": "issueAmount",
-            "tax_amount": "taxAmount",
-            "ym": "ym",
-            "id": "id",
-        }
-        return {mapping.get(k, k): v for k, v in d.items()}
-
     # ───────────────── 안전 rerun ─────────────────
     def _inv_safe_rerun():
         try:
@@ -1962,80 +3625,6 @@ with tab4:
     ss.setdefault("edit_invoice_id", None)
     ss.setdefault("confirm_delete_invoice_id", None)
 
-    # ───────────────── 공통 헬퍼 ─────────────────
-    def _name_from(_id: str, coll: list[dict]) -> str:
-        for x in coll:
-            if x.get("id") == _id:
-                return x.get("name", "")
-        return ""
-
-    def _member_id_by_name(name: str) -> str | None:
-        for m in ss.get("team_members", []):
-            if m.get("name") == name:
-                return m.get("id")
-        return None
-
-    def _loc_id_by_name(name: str) -> str | None:
-        for l in ss.get("locations", []):
-            if l.get("name") == name:
-                return l.get("id")
-        return None
-
-    # ───────────────── Supabase CRUD ─────────────────
-    def invoice_insert(payload: dict) -> tuple[bool, str | None]:
-        """
-        payload 예:
-        {
-          "ym": "2025-11",
-          "teamMemberId": "...",
-          "locationId": "...",
-          "insType": "보험" | "비보험",
-          "issueAmount": 120.0,  # 만원
-          "taxAmount": 12.0,     # 만원
-        }
-        """
-        try:
-            res = _sb.table("invoices").insert(_to_db_keys(payload), returning="representation").execute()
-            if getattr(res, "error", None):
-                return False, str(res.error)
-            return True, None
-        except Exception as e:
-            return False, str(e)
-
-    def invoice_update(invoice_id: str, patch: dict) -> tuple[bool, str | None]:
-        try:
-            res = _sb.table("invoices").update(_to_db_keys(patch)).eq("id", invoice_id).execute()
-            if getattr(res, "error", None):
-                return False, str(res.error)
-            return True, None
-        except Exception as e:
-            return False, str(e)
-
-    def invoice_delete(invoice_id: str) -> bool:
-        try:
-            res = _sb.table("invoices").delete().eq("id", invoice_id).execute()
-            return not bool(getattr(res, "error", None))
-        except Exception:
-            return False
-
-    def reload_invoice_records(year: int) -> None:
-        """지정 연도의 데이터로 ss.invoice_records 갱신 (ym LIKE 'YYYY-%')."""
-        try:
-            q = (
-                _sb.table("invoices")
-                  .select("*")
-                  .like("ym", f"{year:04d}-%")
-                  .order("ym", desc=False)
-                  .execute()
-            )
-            if getattr(q, "error", None):
-                st.error(f"계산서 로드 실패: {q.error}")
-                return
-            rows = q.data or []
-            ss.invoice_records = [_to_client_keys(r) for r in rows]
-        except Exception as e:
-            st.error(f"계산서 로드 실패: {e}")
-
     # ───────────────── 서브탭 ─────────────────
     tab6_input, tab6_manage = st.tabs(["입력", "수정·삭제"])
 
@@ -2063,12 +3652,12 @@ with tab4:
         # 팀원
         member_names = [m.get("name", "") for m in ss.get("team_members", [])]
         member_name = st.selectbox("팀원", member_names, key="inv_member") if member_names else None
-        member_id = _member_id_by_name(member_name) if member_name else None
+        member_id = ref.member_id.get(member_name) if member_name else None
 
         # 보험/비보험 → 업체
         ins_type = st.radio("구분", ["보험", "비보험"], horizontal=True, index=0, key="inv_ins")
                 # Tab1(수입 입력)과 동일한 방식: 선택한 구분에 해당하는 업체만 보여줌
-        filtered_locations = [l for l in ss.get("locations", []) if l.get("category") == ins_type]
+        filtered_locations = ref.locations_in(ins_type)
         loc_options = {l.get("name", ""): l.get("id") for l in filtered_locations if l.get("name")}
 
         if not loc_options:
@@ -2106,10 +3695,6 @@ with tab4:
                     "taxAmount":   float(tax_amount),
                 })
                 if ok:
-                    try:
-                        reload_invoice_records(in_year)
-                    except Exception:
-                        pass
                     st.success(f"{ym} 계산서가 저장되었습니다 ✅")
                     _inv_safe_rerun()
                 else:
@@ -2124,17 +3709,7 @@ with tab4:
         # 연도 선택 (DB/세션 기반) + 해당 연도 데이터 로드
         years = get_invoice_year_options()
         # 기본 선택: '데이터가 있는 최신 연도' → 없으면 올해
-        default_year = NOW_KST.year
-        if sb:
-            try:
-                rmax = sb.table("invoices").select("ym").order("ym", desc=True).limit(1).execute()
-                if rmax and getattr(rmax, "data", None):
-                    try:
-                        default_year = int(str((rmax.data or [{}])[0].get("ym", ""))[:4]) or default_year
-                    except Exception:
-                        pass
-            except Exception:
-                pass
+        default_year = latest_invoice_year(NOW_KST.year)
         # 세션에 데이터가 있다면 그 최신 연도로 보정
         try:
             sess_years = []
@@ -2159,15 +3734,12 @@ with tab4:
                 key="inv_year_sel"
             )
 
-        # ✅ 선택한 연도의 계산서 데이터를 DB에서 다시 로드 (연도 변경 시에만)
-        if sb:
-            loaded_y = ss.get("_t6_inv_loaded_year")
-            if loaded_y != year_sel:
-                load_invoices(year_sel)
-                ss["_t6_inv_loaded_year"] = year_sel
-                ss["inv_page"] = 0
+        # ✅ 선택 연도 계산서 (연도별 공유 캐시) — 연도가 바뀌면 첫 페이지로
+        if ss.get("_t6_inv_year") != year_sel:
+            ss["_t6_inv_year"] = year_sel
+            ss["inv_page"] = 0
 
-        inv = ss.get("invoice_records", []) or []
+        inv = invoice_year(year_sel)
         if not inv:
             st.info(f"{year_sel}년 계산서 데이터가 없습니다. (다른 연도를 선택해 보세요)")
             st.stop()
@@ -2179,13 +3751,13 @@ with tab4:
             "year": int(r.get("ym", "0000-00")[:4]) if r.get("ym") else None,
             "month": int(r.get("ym", "0000-00")[5:7]) if r.get("ym") else None,
             "member_id": r.get("teamMemberId"),
-            "member": _name_from(r.get("teamMemberId"), ss.get("team_members", [])),
             "location_id": r.get("locationId"),
-            "location": _name_from(r.get("locationId"), ss.get("locations", [])),
             "ins_type": r.get("insType", ""),
             "issue": float(r.get("issueAmount", 0) or 0.0),
             "tax":   float(r.get("taxAmount",   0) or 0.0),
         } for r in inv])
+        df["member"] = df["member_id"].map(ref.member_name).fillna("")
+        df["location"] = df["location_id"].map(ref.location_name).fillna("")
 
         # 연/월/정렬/필터
         with c2:
@@ -2202,9 +3774,7 @@ with tab4:
         with c5:
             ins_sel = st.selectbox("구분", ["전체", "보험", "비보험"], index=0, key="inv_ins_sel")
         with c6:
-            loc_pool = ss.get("locations", [])
-            if ins_sel != "전체":
-                loc_pool = [l for l in loc_pool if l.get("category") == ins_sel]
+            loc_pool = list(ref.locations) if ins_sel == "전체" else ref.locations_in(ins_sel)
             loc_opts = ["전체"] + [l.get("name", "") for l in loc_pool]
             loc_sel = st.selectbox("업체", loc_opts, index=0, key="inv_loc_sel")
 
@@ -2242,9 +3812,16 @@ with tab4:
         start = ss.inv_page * PAGE_SIZE
         page_df = q.iloc[start:start + PAGE_SIZE].copy()
 
+        export_controls(
+            "inv_export", f"invoices_{year_sel}" + (f"-{int(month_sel):02d}" if month_sel != "전체" else ""),
+            lambda: frame_chunks(q),
+            {"ym": "연월", "member": "팀원", "location": "업체", "ins_type": "구분", "issue": "발행금액(만원)", "tax": "세준금(만원)"},
+            numeric=("issue", "tax"),
+        )
+
         # 표
         st.markdown("#### 결과 표")
-        st.dataframe(
+        picked = st.dataframe(
             page_df[["ym", "member", "location", "ins_type", "issue", "tax"]].rename(
                 columns={"ym": "연월", "member": "팀원", "location": "업체", "ins_type": "구분", "issue": "발행금액(만원)", "tax": "세준금(만원)"}
             ),
@@ -2252,9 +3829,21 @@ with tab4:
             column_config={
                 "발행금액(만원)": st.column_config.NumberColumn(format="%.0f"),
                 "세준금(만원)":   st.column_config.NumberColumn(format="%.0f"),
-            }
+            },
+            on_select="rerun", selection_mode="multi-row",
+            key=f"inv_pick_{abs(hash((year_sel, month_sel, mem_sel, ins_sel, loc_sel, order_by, ss.inv_page)))}",
         )
 
+        # 일괄 작업: 표에서 고른 행 또는 필터 결과 전체 (연월 이동은 개월 단위)
+        with st.expander("일괄 작업 (선택 행 / 필터 결과 전체)"):
+            inv_by_id = {r.get("id"): r for r in inv}
+            bulk_ids = q["id"].tolist() if st.checkbox(f"필터 결과 전체 {total:,}건 대상", key="inv_bulk_all") \
+                else [page_df["id"].iloc[i] for i in picked.selection.rows]
+            bulk_controls(
+                "inv_bulk", [inv_by_id[i] for i in bulk_ids if i in inv_by_id], ref, "개월",
+                lambda rows, action, value: bulk_invoice_action(rows, action, value)[1],
+            )
+
         # 카드형 수정/삭제
         st.markdown("#### 선택/수정/삭제")
         for _, row in page_df.iterrows():
@@ -2264,7 +3853,7 @@ with tab4:
                 with right:
                     col_a, col_b = st.columns(2)
                     with col_a:
-                        if st.button("🖉 수정", key=f"edit_inv_{row['id']}"):
+                        if st.button("🖉 수정", key=f"edit_inv_{row['id']}_open"):
                             ss.edit_invoice_id = row["id"]; _inv_safe_rerun()
                     with col_b:
                         if st.button("🗑 삭제", key=f"del_inv_{row['id']}"):
@@ -2278,24 +3867,25 @@ with tab4:
                 c1, c2 = st.columns(2)
                 with c1:
                     if st.button("✅ 삭제 확정", key="inv_delete_confirm"):
-                        if invoice_delete(rid):
+                        ok, err = invoice_delete(rid)
+                        if ok:
                             ss.confirm_delete_invoice_id = None
                             st.success("삭제되었습니다."); _inv_safe_rerun()
                         else:
-                            st.error("삭제 실패(권한/RLS/네트워크)")
+                            st.error(f"삭제 실패: {err or '권한/RLS/네트워크'}")
                 with c2:
                     if st.button("❌ 취소", key="inv_delete_cancel"):
                         ss.confirm_delete_invoice_id = None; _inv_safe_rerun()
 
         # 수정 폼
         if ss.edit_invoice_id:
-            target = next((x for x in ss.invoice_records if x.get("id") == ss.edit_invoice_id), None)
+            target = next((x for x in inv if x.get("id") == ss.edit_invoice_id), None)
             if target:
                 st.markdown("#### 선택한 계산서 수정")
 
                 cur_year  = int(target["ym"][:4]); cur_month = int(target["ym"][5:7])
-                cur_member_name = _name_from(target["teamMemberId"], ss.get("team_members", []))
-                cur_loc = next((l for l in ss.get("locations", []) if l.get("id") == target.get("locationId")), None)
+                cur_member_name = ref.member_name.get(target["teamMemberId"], "")
+                cur_loc = ref.location_by_id.get(target.get("locationId"))
                 cur_ins = target.get("insType", "보험")
 
                 # ⚠️ form 내부에서는 라디오 변경으로 업체 목록이 즉시 갱신되지 않으므로(입력 탭과 동일한 이슈)
@@ -2323,12 +3913,12 @@ with tab4:
                         horizontal=True,
                         key=f"{edit_prefix}_ins",
                     )
-                    filtered_locs = [l for l in ss.get("locations", []) if l.get("category") == ins_edit and l.get("name")]
+                    filtered_locs = [l for l in ref.locations_in(ins_edit) if l.get("name")]
                     if filtered_locs:
                         loc_options = {l.get("name", ""): l.get("id") for l in filtered_locs}
                     else:
                         # 현재 선택된 업체라도 표시되게 fallback
-                        fallback_name = (_name_from(target.get("locationId"), ss.get("locations", [])) or "")
+                        fallback_name = ref.location_name.get(target.get("locationId"), "")
                         loc_options = {fallback_name: target.get("locationId")}
 
                     loc_names = list(loc_options.keys())
@@ -2392,9 +3982,5 @@ with tab4:
                             st.error(f"저장 실패: {err or '원인 미상'}")
                         else:
                             ss.edit_invoice_id = None
-                            try:
-                                reload_invoice_records(edit_year)
-                            except Exception:
-                                pass
                             st.success("수정되었습니다.")
                             _inv_safe_rerun()
@@ -0,0 +1,183 @@
+"""
+정산 엔진 — 원장(누가 누구에게 얼마) → 개인 순액 → 지급 지시서 (Streamlit 의존 없음, 순수 함수)
+
+  ledger  : [{"from": 지급자, "to": 수취자, "amount": 만원(int), "reason": 사유}, ...]
+  balances: {사람: 순액}  (+ 받을 돈 / - 낼 돈)
+  orders  : [{"from": ..., "to": ..., "amount": ...}, ...]
+
+지급 방식
+  - "minimal": 채권자/채무자 최대값끼리 맞추는 탐욕 상계 (금액이 정확히 같은 쌍은 먼저 1건으로 처리)
+               → 지급 건수 ≤ (순액이 0이 아닌 사람 수 - 1)
+  - "hub"    : 모든 사람이 허브 1명과만 주고받음 (기존 부산숨 수령자 방식)
+허브를 지정하면 두 방식 모두 허브의 순액은 "나머지 사람 순액 합의 반대"로 간주합니다
+(표시용 보정으로 합이 0이 아니어도 허브가 차액을 흡수 — 기존 화면 동작과 동일).
+
+python settlement.py [사람 수] [원장 건수] 로 대규모 팀 벤치마크를 실행합니다.
+"""
+from __future__ import annotations
+
+import hashlib
+import heapq
+import json
+from typing import Callable, Iterable, Mapping
+
+import numpy as np
+
+EXTERNAL = "외부"   # 외부 유입(순액 계산에서 제외, 원장에만 기록)
+
+SamePerson = Callable[[str, str], bool]
+
+
+def _same_default(a: str, b: str) -> bool:
+    return a == b
+
+
+def payout_entries(payer: str, amounts: Mapping[str, float], reason: str,
+                   same: SamePerson = _same_default) -> list[dict]:
+    """payer → 팀원별 지급 원장 (0원/자기지급/이름 없음 제외, 금액은 만원 정수)."""
+    out = []
+    for member, amount in amounts.items():
+        a = int(amount or 0)
+        if member and a and not same(member, payer):
+            out.append({"from": payer, "to": member, "amount": a, "reason": reason})
+    return out
+
+
+def net_balances(ledger: Iterable[Mapping], exclude: Iterable[str] = (EXTERNAL,)) -> dict[str, int]:
+    """원장 → 개인 순액 (exclude 가 지급자인 건 제외). 사람 목록은 이름순."""
+    skip = set(exclude)
+    rows = [r for r in ledger if r.get("from") not in skip]
+    if not rows:
+        return {}
+    src = np.asarray([str(r["from"]) for r in rows], dtype=object)
+    dst = np.asarray([str(r["to"]) for r in rows], dtype=object)
+    amt = np.asarray([int(r.get("amount", 0) or 0) for r in rows], dtype=np.int64)
+    people, codes = np.unique(np.concatenate([src, dst]), return_inverse=True)
+    n = len(rows)
+    bal = np.bincount(codes[n:], weights=amt, minlength=len(people)) \
+        - np.bincount(codes[:n], weights=amt, minlength=len(people))
+    return {str(p): int(round(b)) for p, b in zip(people, bal)}
+
+
+def _with_hub(balances: Mapping[str, int], hub: str | None, same: SamePerson) -> dict[str, int]:
+    """허브의 순액을 나머지 합의 반대로 맞춘 순액 (허브가 없으면 그대로)."""
+    out = {p: int(b) for p, b in balances.items() if not (hub and same(p, hub))}
+    if hub:
+        out[hub] = -sum(out.values())
+    return out
+
+
+def hub_orders(balances: Mapping[str, int], hub: str, same: SamePerson = _same_default) -> list[dict]:
+    """모든 사람 ↔ 허브 지급 지시서 (balances 순서 유지)."""
+    orders = []
+    for p, b in balances.items():
+        b = int(b)
+        if same(p, hub) or not b:
+            continue
+        if b > 0:
+            orders.append({"from": hub, "to": p, "amount": b})
+        else:
+            orders.append({"from": p, "to": hub, "amount": -b})
+    return orders
+
+
+def minimal_orders(balances: Mapping[str, int]) -> list[dict]:
+    """순액(합 0) → 최소에 가까운 지급 지시서.
+
+    1) 채무 = 채권 금액이 정확히 같은 쌍을 먼저 1건으로 상계
+    2) 남은 사람은 최대 채권자 ↔ 최대 채무자를 반복 상계 (힙, O(n log n))
+    """
+    if sum(int(b) for b in balances.values()) != 0:
+        raise ValueError("순액 합이 0이 아닙니다 (허브를 지정하거나 원장을 확인하세요).")
+    orders: list[dict] = []
+    creditors: dict[int, list[str]] = {}
+    for p, b in balances.items():
+        if int(b) > 0:
+            creditors.setdefault(int(b), []).append(p)
+    debtors = []
+    for p, b in balances.items():
+        b = int(b)
+        if b < 0 and creditors.get(-b):
+            orders.append({"from": p, "to": creditors[-b].pop(0), "amount": -b})
+        elif b < 0:
+            debtors.append((b, p))                     # 음수 그대로 → 최소 힙 = 최대 채무자
+    cred = [(-b, p) for b, ps in creditors.items() for p in ps]
+    heapq.heapify(cred)
+    heapq.heapify(debtors)
+    while cred and debtors:
+        c, cp = heapq.heappop(cred)
+        d, dp = heapq.heappop(debtors)
+        pay = min(-c, -d)
+        orders.append({"from": dp, "to": cp, "amount": pay})
+        if -c > pay:
+            heapq.heappush(cred, (c + pay, cp))
+        if -d > pay:
+            heapq.heappush(debtors, (d + pay, dp))
+    return orders
+
+
+def settle(balances: Mapping[str, int], mode: str = "minimal", hub: str | None = None,
+           same: SamePerson = _same_default) -> list[dict]:
+    """순액 → 지급 지시서. mode: "minimal" | "hub" (hub 모드는 hub 필수)."""
+    if mode == "hub":
+        if not hub:
+            raise ValueError("허브 방식에는 hub 가 필요합니다.")
+        return hub_orders(balances, hub, same)
+    return minimal_orders(_with_hub(balances, hub, same))
+
+
+def input_checksums(parts: Mapping[str, object]) -> dict[str, str]:
+    """정산 입력 묶음별 체크섬 (정규화 JSON의 sha256 앞 16자) + 전체 "all".
+    마감 스냅샷에 저장해 두고 다시 계산해 비교하면 마감 후 입력 변경(drift)을 알 수 있습니다."""
+    out = {
+        name: hashlib.sha256(
+            json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+        ).hexdigest()[:16]
+        for name, value in parts.items()
+    }
+    out["all"] = hashlib.sha256("|".join(f"{k}={out[k]}" for k in sorted(out)).encode()).hexdigest()[:16]
+    return out
+
+
+def drifted_parts(saved: Mapping[str, str], current: Mapping[str, str]) -> list[str]:
+    """저장된 체크섬과 현재 체크섬이 다른 입력 묶음 이름 ("all" 제외)."""
+    return sorted(k for k in set(saved) | set(current) if k != "all" and saved.get(k) != current.get(k))
+
+
+def benchmark(n_people: int = 500, n_entries: int = 200_000, seed: int = 0) -> dict:
+    """무작위 원장으로 순액/지시서 계산 시간을 잰다 (초, 지시서 건수)."""
+    import time
+
+    rng = np.random.default_rng(seed)
+    names = [f"p{i}" for i in range(n_people)]
+    src = rng.integers(0, n_people, n_entries)
+    dst = rng.integers(0, n_people, n_entries)
+    amt = rng.integers(1, 500, n_entries)
+    ledger = [{"from": names[s], "to": names[d], "amount": int(a)} for s, d, a in zip(src, dst, amt) if s != d]
+
+    t0 = time.perf_counter()
+    bal = net_balances(ledger)
+    t1 = time.perf_counter()
+    minimal = settle(bal, "minimal")
+    t2 = time.perf_counter()
+    hub = settle(bal, "hub", hub=names[0])
+    t3 = time.perf_counter()
+    return {
+        "people": n_people, "entries": len(ledger),
+        "net_sec": round(t1 - t0, 4), "minimal_sec": round(t2 - t1, 4), "hub_sec": round(t3 - t2, 4),
+        "minimal_orders": len(minimal), "hub_orders": len(hub),
+    }
+
+
+def main(argv: list[str] | None = None) -> dict:
+    """python settlement.py [사람 수] [원장 건수] — 벤치마크 결과를 출력하고 반환."""
+    import sys
+
+    args = [int(x) for x in (sys.argv[1:] if argv is None else argv)[:2]]
+    result = benchmark(*args)
+    print(result)
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+-- ─────────────────────────────────────────
+-- 증분 동기화(delta sync)용 스키마
+--   - team_members / locations / incomes 에 updated_at(변경 시각) 컬럼 + 자동 갱신 트리거
+--   - 삭제된 행은 sync_tombstones 에 기록 (앱이 마지막 동기화 이후 삭제분만 가져감)
+--   - 시각은 clock_timestamp(): 앱은 워터마크보다 SYNC_OVERLAP_SEC 앞에서부터 겹쳐 읽어
+--     동기화 중에 커밋된 트랜잭션도 놓치지 않음 (이미 적용된 DB는 이 파일을 다시 실행하면 함수만 교체)
+-- Supabase SQL Editor 에서 1회 실행
+-- ─────────────────────────────────────────
+
+create table if not exists public.sync_tombstones (
+  table_name text        not null,
+  row_id     text        not null,
+  deleted_at timestamptz not null default clock_timestamp(),
+  primary key (table_name, row_id)
+);
+create index if not exists sync_tombstones_deleted_at_idx
+  on public.sync_tombstones (table_name, deleted_at);
+
+create or replace function public.touch_updated_at() returns trigger
+language plpgsql as $$
+begin
+  new.updated_at := clock_timestamp();   -- 트랜잭션 시작이 아닌 실제 기록 시각
+  return new;
+end $$;
+
+create or replace function public.record_tombstone() returns trigger
+language plpgsql as $$
+begin
+  insert into public.sync_tombstones (table_name, row_id, deleted_at)
+  values (tg_table_name, old.id::text, clock_timestamp())
+  on conflict (table_name, row_id) do update set deleted_at = excluded.deleted_at;
+  return old;
+end $$;
+
+do $$
+declare t text;
+begin
+  foreach t in array array['team_members', 'locations', 'incomes'] loop
+    execute format('alter table public.%I add column if not exists updated_at timestamptz not null default clock_timestamp()', t);
+    execute format('create index if not exists %I on public.%I (updated_at)', t || '_updated_at_idx', t);
+    execute format('drop trigger if exists %I on public.%I', t || '_touch_updated_at', t);
+    execute format('create trigger %I before insert or update on public.%I for each row execute function public.touch_updated_at()', t || '_touch_updated_at', t);
+    execute format('drop trigger if exists %I on public.%I', t || '_tombstone', t);
+    execute format('create trigger %I after delete on public.%I for each row execute function public.record_tombstone()', t || '_tombstone', t);
+  end loop;
+end $$;
@@ -0,0 +1,14 @@
+-- ─────────────────────────────────────────
+-- 수입 연도 인덱스: 연도 드롭다운용 (행 데이터 없이 연도 목록만)
+-- Supabase SQL Editor 에서 1회 실행
+-- ─────────────────────────────────────────
+
+create index if not exists incomes_date_idx on public.incomes (date);
+
+create or replace function public.income_years()
+returns table (year int)
+language sql stable as $$
+  select distinct extract(year from date::date)::int as year
+  from public.incomes
+  order by 1
+$$;
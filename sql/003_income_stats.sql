@@ -0,0 +1,39 @@
+-- ─────────────────────────────────────────
+-- 통계 탭 서버 집계: (연, 월, 팀원, 업체, 분류) 단위 합계/건수
+--   - 원본 행 대신 그룹 행만 반환 → 전송량/클라이언트 연산이 그룹 수에 비례
+--   - income_stats_v: 전체 연도 집계 뷰 (대시보드/점검용)
+--   - income_stats(p_year): 앱이 호출하는 연도별 RPC (incomes_date_idx 범위 스캔)
+-- Supabase SQL Editor 에서 1회 실행
+-- ─────────────────────────────────────────
+
+create or replace view public.income_stats_v as
+select
+  extract(year  from i.date::date)::int as year,
+  extract(month from i.date::date)::int as month,
+  i.team_member_id::text                as team_member_id,
+  i.location_id::text                   as location_id,
+  coalesce(l.category, '')              as category,
+  sum(i.amount)::float8                 as amount,
+  count(*)::int                         as cnt
+from public.incomes i
+left join public.locations l on l.id = i.location_id
+group by 1, 2, 3, 4, 5;
+
+create or replace function public.income_stats(p_year int)
+returns table (
+  month int, team_member_id text, location_id text, category text, amount float8, cnt int
+)
+language sql stable as $$
+  select
+    extract(month from i.date::date)::int,
+    i.team_member_id::text,
+    i.location_id::text,
+    coalesce(l.category, ''),
+    sum(i.amount)::float8,
+    count(*)::int
+  from public.incomes i
+  left join public.locations l on l.id = i.location_id
+  where i.date::date >= make_date(p_year, 1, 1) and i.date::date < make_date(p_year + 1, 1, 1)
+  group by 1, 2, 3, 4
+  order by 1, 2, 3
+$$;
@@ -0,0 +1,108 @@
+-- ─────────────────────────────────────────
+-- 월별 수입 롤업: (ym, team_member_id, location_id) → 합계/건수
+--   - incomes 의 insert/update/delete 트리거가 증분 반영 (앱 쓰기 경로 변경 없음)
+--   - income_stats(p_year) 는 원본 대신 롤업을 읽음 → 조회 비용이 그룹 수에 비례
+--   - income_monthly_verify(): 원본 재계산과 비교해 어긋난 그룹을 반환
+--   - income_monthly_rebuild(): 원본에서 다시 만들고 어긋났던 그룹 수를 반환
+-- sql/003_income_stats.sql 이후 Supabase SQL Editor 에서 1회 실행
+-- ─────────────────────────────────────────
+
+create table if not exists public.income_monthly (
+  ym             text    not null,              -- 'YYYY-MM'
+  team_member_id text    not null default '',   -- 없음 = ''
+  location_id    text    not null default '',
+  amount         float8  not null default 0,
+  cnt            int     not null default 0,
+  primary key (ym, team_member_id, location_id)
+);
+
+create or replace function public.income_monthly_add(
+  p_date text, p_member text, p_location text, p_amount float8, p_cnt int
+) returns void
+language sql as $$
+  insert into public.income_monthly as m (ym, team_member_id, location_id, amount, cnt)
+  values (left(p_date, 7), coalesce(p_member, ''), coalesce(p_location, ''), p_amount, p_cnt)
+  on conflict (ym, team_member_id, location_id)
+  do update set amount = m.amount + excluded.amount, cnt = m.cnt + excluded.cnt;
+  delete from public.income_monthly
+   where ym = left(p_date, 7) and team_member_id = coalesce(p_member, '')
+     and location_id = coalesce(p_location, '') and cnt <= 0;
+$$;
+
+create or replace function public.income_monthly_apply() returns trigger
+language plpgsql as $$
+begin
+  if tg_op in ('UPDATE', 'DELETE') then
+    perform public.income_monthly_add(old.date::text, old.team_member_id::text, old.location_id::text,
+                                      -coalesce(old.amount, 0)::float8, -1);
+  end if;
+  if tg_op in ('INSERT', 'UPDATE') then
+    perform public.income_monthly_add(new.date::text, new.team_member_id::text, new.location_id::text,
+                                      coalesce(new.amount, 0)::float8, 1);
+  end if;
+  return null;
+end $$;
+
+drop trigger if exists incomes_monthly_rollup on public.incomes;
+create trigger incomes_monthly_rollup
+  after insert or update of date, team_member_id, location_id, amount or delete on public.incomes
+  for each row execute function public.income_monthly_apply();
+
+create or replace function public.income_monthly_verify()
+returns table (
+  ym text, team_member_id text, location_id text,
+  expected_amount float8, actual_amount float8, expected_cnt int, actual_cnt int
+)
+language sql stable as $$
+  with src as (
+    select left(date::text, 7) as ym, coalesce(team_member_id::text, '') as team_member_id,
+           coalesce(location_id::text, '') as location_id,
+           sum(amount)::float8 as amount, count(*)::int as cnt
+    from public.incomes group by 1, 2, 3
+  )
+  select coalesce(s.ym, m.ym), coalesce(s.team_member_id, m.team_member_id),
+         coalesce(s.location_id, m.location_id),
+         coalesce(s.amount, 0), coalesce(m.amount, 0), coalesce(s.cnt, 0), coalesce(m.cnt, 0)
+  from src s
+  full join public.income_monthly m
+    on m.ym = s.ym and m.team_member_id = s.team_member_id and m.location_id = s.location_id
+  where coalesce(s.cnt, 0) <> coalesce(m.cnt, 0)
+     or abs(coalesce(s.amount, 0) - coalesce(m.amount, 0)) > 1e-6
+  order by 1, 2, 3
+$$;
+
+create or replace function public.income_monthly_rebuild() returns int
+language plpgsql as $$
+declare drift int;
+begin
+  lock table public.incomes in share mode;   -- 재구성 중 쓰기 차단 (트리거와 경합 방지)
+  select count(*) into drift from public.income_monthly_verify();
+  delete from public.income_monthly;
+  insert into public.income_monthly (ym, team_member_id, location_id, amount, cnt)
+  select left(date::text, 7), coalesce(team_member_id::text, ''), coalesce(location_id::text, ''),
+         sum(amount)::float8, count(*)::int
+  from public.incomes group by 1, 2, 3;
+  return drift;
+end $$;
+
+-- 최초 채우기
+select public.income_monthly_rebuild();
+
+-- 통계 RPC: 롤업에서 읽도록 교체 (반환 모양은 003 과 동일)
+create or replace function public.income_stats(p_year int)
+returns table (
+  month int, team_member_id text, location_id text, category text, amount float8, cnt int
+)
+language sql stable as $$
+  select
+    substr(m.ym, 6, 2)::int,
+    nullif(m.team_member_id, ''),
+    nullif(m.location_id, ''),
+    coalesce(l.category, ''),
+    m.amount,
+    m.cnt
+  from public.income_monthly m
+  left join public.locations l on l.id::text = m.location_id
+  where m.ym >= lpad(p_year::text, 4, '0') || '-01' and m.ym <= lpad(p_year::text, 4, '0') || '-12'
+  order by 1, 2, 3
+$$;
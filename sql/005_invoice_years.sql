@@ -0,0 +1,16 @@
+-- ─────────────────────────────────────────
+-- 계산서 연도 인덱스: 연도 드롭다운/기본 연도용 (행 데이터 없이 연도별 최신 ym 만)
+-- Supabase SQL Editor 에서 1회 실행
+-- ─────────────────────────────────────────
+
+create index if not exists invoices_ym_idx on public.invoices (ym);
+
+create or replace function public.invoice_years()
+returns table (year int, latest_ym text)
+language sql stable as $$
+  select left(ym, 4)::int as year, max(ym) as latest_ym
+  from public.invoices
+  where ym ~ '^[0-9]{4}-'
+  group by 1
+  order by 1
+$$;
@@ -0,0 +1,20 @@
+-- ─────────────────────────────────────────
+-- 정산 월 묶음 조회: 월 설정 + 팀비 + 이체를 한 번의 RPC 로
+--   반환: {"month": {...} | null, "teamfee": [...], "transfer": [...]}  (목록은 created_at 순)
+-- Supabase SQL Editor 에서 1회 실행
+-- ─────────────────────────────────────────
+
+create index if not exists settlement_teamfee_ym_key_idx  on public.settlement_teamfee  (ym_key);
+create index if not exists settlement_transfer_ym_key_idx on public.settlement_transfer (ym_key);
+
+create or replace function public.settlement_bundle(p_ym_key text)
+returns json
+language sql stable as $$
+  select json_build_object(
+    'month', (select to_json(m) from public.settlement_month m where m.ym_key = p_ym_key limit 1),
+    'teamfee', coalesce((select json_agg(t order by t.created_at)
+                         from public.settlement_teamfee t where t.ym_key = p_ym_key), '[]'::json),
+    'transfer', coalesce((select json_agg(t order by t.created_at)
+                          from public.settlement_transfer t where t.ym_key = p_ym_key), '[]'::json)
+  )
+$$;
@@ -0,0 +1,43 @@
+-- ─────────────────────────────────────────
+-- 마감 월 정산 스냅샷 (불변): 순액표/지급 지시서/팀비 잔액 + 입력 체크섬
+--   - 마감 시 1회 계산해 저장, 다시 열 때는 스냅샷만 읽음 (settlement_bundle 에 포함)
+--   - 입력(수입 집계/월 설정/팀비/이체) 체크섬이 달라지면 앱이 "마감 후 변경"으로 표시
+--   - JSON 은 text 로 저장 (SQLite 백엔드와 같은 모양)
+-- sql/006_settlement_bundle.sql 이후 Supabase SQL Editor 에서 1회 실행
+-- ─────────────────────────────────────────
+
+create table if not exists public.settlement_snapshot (
+  ym_key          text primary key,
+  closed_at       timestamptz not null default now(),
+  pay_mode        text not null default '',
+  teamfee_balance int  not null default 0,
+  net_json        text not null default '[]',
+  orders_json     text not null default '[]',
+  summary_json    text not null default '{}',
+  checksums_json  text not null default '{}'
+);
+
+-- 불변: 수정 금지 (마감 해제 = 삭제 후 다시 마감)
+create or replace function public.settlement_snapshot_immutable() returns trigger
+language plpgsql as $$
+begin
+  raise exception 'settlement_snapshot is immutable (delete and close again)';
+end $$;
+
+drop trigger if exists settlement_snapshot_no_update on public.settlement_snapshot;
+create trigger settlement_snapshot_no_update
+  before update on public.settlement_snapshot
+  for each row execute function public.settlement_snapshot_immutable();
+
+create or replace function public.settlement_bundle(p_ym_key text)
+returns json
+language sql stable as $$
+  select json_build_object(
+    'month', (select to_json(m) from public.settlement_month m where m.ym_key = p_ym_key limit 1),
+    'teamfee', coalesce((select json_agg(t order by t.created_at)
+                         from public.settlement_teamfee t where t.ym_key = p_ym_key), '[]'::json),
+    'transfer', coalesce((select json_agg(t order by t.created_at)
+                          from public.settlement_transfer t where t.ym_key = p_ym_key), '[]'::json),
+    'snapshot', (select to_json(s) from public.settlement_snapshot s where s.ym_key = p_ym_key)
+  )
+$$;
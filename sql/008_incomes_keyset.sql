@@ -0,0 +1,10 @@
+-- ─────────────────────────────────────────
+-- 기록 관리 키셋 페이지 인덱스: 필터(기간/팀원/업체) + 정렬 (날짜, id) / (금액, 날짜, id)
+--   앱은 한 페이지(20행)만 조회하고, 다음 페이지는 직전 마지막 행의 정렬 키 이후로 이어 받음
+-- Supabase SQL Editor 에서 1회 실행
+-- ─────────────────────────────────────────
+
+create index if not exists incomes_date_id_idx on public.incomes (date, id);
+create index if not exists incomes_amount_date_idx on public.incomes (amount, date, id);
+create index if not exists incomes_member_date_idx on public.incomes (team_member_id, date);
+create index if not exists incomes_location_date_idx on public.incomes (location_id, date);
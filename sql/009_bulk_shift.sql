@@ -0,0 +1,25 @@
+-- ─────────────────────────────────────────
+-- 일괄 날짜/연월 이동: 선택한 id 목록을 한 문장으로 갱신하고 바뀐 행을 반환
+--   incomes_shift_date(p_ids, p_days)    : date  += p_days 일
+--   invoices_shift_ym(p_ids, p_months)   : ym    += p_months 개월 ('YYYY-MM')
+--   (삭제/팀원·업체 변경은 앱이 .in_("id", ...) 로 직접 처리)
+-- Supabase SQL Editor 에서 1회 실행
+-- ─────────────────────────────────────────
+
+create or replace function public.incomes_shift_date(p_ids text[], p_days int)
+returns setof public.incomes
+language sql as $$
+  update public.incomes
+     set date = (date::date + p_days)
+   where id::text = any(p_ids)
+  returning *
+$$;
+
+create or replace function public.invoices_shift_ym(p_ids text[], p_months int)
+returns setof public.invoices
+language sql as $$
+  update public.invoices
+     set ym = to_char((ym || '-01')::date + make_interval(months => p_months), 'YYYY-MM')
+   where id::text = any(p_ids) and ym ~ '^[0-9]{4}-[0-9]{2}$'
+  returning *
+$$;
@@ -0,0 +1,521 @@
+"""
+로컬 SQLite 저장소 — Supabase 클라이언트(postgrest 쿼리 빌더)와 같은 모양의 대체 백엔드
+
+app.py 가 쓰는 부분집합만 구현합니다:
+  client.table(t).select(cols, count="exact").eq/gte/lt/like/in_/or_(...).order(col, desc=).range(a, b).limit(n).execute()
+  client.table(t).insert(rows, returning=) / upsert(rows, on_conflict=) / update(values).eq(...) / delete().eq(...)
+  client.rpc(name, params).execute(),  client.schema("public")
+execute() 결과는 .data(list[dict]) / .count 를 갖습니다.
+
+Supabase 쪽 SQL 마이그레이션(sql/*.sql)의 트리거 동작(updated_at 갱신, sync_tombstones 기록)은
+여기서 코드로 흉내 내고, 월별 롤업(income_monthly)은 SQLite 트리거로 같은 방식으로 유지합니다.
+WAL 모드 + 조회 컬럼 인덱스로 네트워크 없이 서브 밀리초 조회.
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+SCHEMA = """
+create table if not exists team_members (
+  id text primary key, name text not null, "order" integer not null default 0, updated_at text
+);
+create table if not exists locations (
+  id text primary key, name text not null, category text not null default '',
+  "order" integer not null default 0, updated_at text
+);
+create table if not exists incomes (
+  id text primary key, date text not null, team_member_id text, location_id text,
+  amount real not null default 0, memo text not null default '', updated_at text
+);
+create index if not exists incomes_date_idx on incomes (date);
+create index if not exists incomes_member_idx on incomes (team_member_id);
+create index if not exists incomes_location_idx on incomes (location_id);
+create index if not exists incomes_updated_at_idx on incomes (updated_at);
+create index if not exists incomes_date_id_idx on incomes (date, id);
+create index if not exists incomes_amount_date_idx on incomes (amount, date, id);
+create index if not exists incomes_member_date_idx on incomes (team_member_id, date);
+create index if not exists incomes_location_date_idx on incomes (location_id, date);
+
+create table if not exists invoices (
+  id text primary key, ym text not null, team_member_id text, location_id text,
+  ins_type text not null default '', issue_amount real not null default 0,
+  tax_amount real not null default 0, created_at text
+);
+create index if not exists invoices_ym_idx on invoices (ym);
+create index if not exists invoices_member_idx on invoices (team_member_id);
+create index if not exists invoices_location_idx on invoices (location_id);
+
+create table if not exists settlement_month (
+  ym_key text primary key, sungmo_fixed integer not null default 0,
+  receiver_busansoom text not null default '', receiver_amiyou text not null default '', updated_at text
+);
+create table if not exists settlement_teamfee (
+  id text primary key, ym_key text not null, who text, amount integer not null default 0,
+  memo text not null default '', created_at text
+);
+create index if not exists settlement_teamfee_ym_key_idx on settlement_teamfee (ym_key);
+create table if not exists settlement_transfer (
+  id text primary key, ym_key text not null, "from" text, "to" text, amount integer not null default 0,
+  memo text not null default '', created_at text
+);
+create index if not exists settlement_transfer_ym_key_idx on settlement_transfer (ym_key);
+
+create table if not exists sync_tombstones (
+  table_name text not null, row_id text not null, deleted_at text not null,
+  primary key (table_name, row_id)
+);
+create index if not exists sync_tombstones_deleted_at_idx on sync_tombstones (table_name, deleted_at);
+
+create table if not exists settlement_snapshot (
+  ym_key text primary key, closed_at text, pay_mode text not null default '',
+  teamfee_balance integer not null default 0, net_json text not null default '[]',
+  orders_json text not null default '[]', summary_json text not null default '{}',
+  checksums_json text not null default '{}'
+);
+create trigger if not exists settlement_snapshot_no_update before update on settlement_snapshot begin
+  select raise(abort, 'settlement_snapshot is immutable (delete and close again)');
+end;
+
+-- 월별 롤업 (sql/004_income_monthly.sql 과 같은 모양, 트리거로 증분 유지)
+create table if not exists income_monthly (
+  ym text not null, team_member_id text not null default '', location_id text not null default '',
+  amount real not null default 0, cnt integer not null default 0,
+  primary key (ym, team_member_id, location_id)
+);
+create trigger if not exists incomes_monthly_ins after insert on incomes begin
+  insert into income_monthly (ym, team_member_id, location_id, amount, cnt)
+  values (substr(new.date, 1, 7), coalesce(new.team_member_id, ''), coalesce(new.location_id, ''), new.amount, 1)
+  on conflict (ym, team_member_id, location_id)
+  do update set amount = amount + excluded.amount, cnt = cnt + excluded.cnt;
+end;
+create trigger if not exists incomes_monthly_del after delete on incomes begin
+  update income_monthly set amount = amount - old.amount, cnt = cnt - 1
+   where ym = substr(old.date, 1, 7) and team_member_id = coalesce(old.team_member_id, '')
+     and location_id = coalesce(old.location_id, '');
+  delete from income_monthly
+   where ym = substr(old.date, 1, 7) and team_member_id = coalesce(old.team_member_id, '')
+     and location_id = coalesce(old.location_id, '') and cnt <= 0;
+end;
+create trigger if not exists incomes_monthly_upd after update of date, team_member_id, location_id, amount on incomes begin
+  update income_monthly set amount = amount - old.amount, cnt = cnt - 1
+   where ym = substr(old.date, 1, 7) and team_member_id = coalesce(old.team_member_id, '')
+     and location_id = coalesce(old.location_id, '');
+  delete from income_monthly
+   where ym = substr(old.date, 1, 7) and team_member_id = coalesce(old.team_member_id, '')
+     and location_id = coalesce(old.location_id, '') and cnt <= 0;
+  insert into income_monthly (ym, team_member_id, location_id, amount, cnt)
+  values (substr(new.date, 1, 7), coalesce(new.team_member_id, ''), coalesce(new.location_id, ''), new.amount, 1)
+  on conflict (ym, team_member_id, location_id)
+  do update set amount = amount + excluded.amount, cnt = cnt + excluded.cnt;
+end;
+"""
+
+# 기본 키 (upsert/반환 행 재조회용)
+PRIMARY_KEYS = {"settlement_month": "ym_key", "settlement_snapshot": "ym_key", "sync_tombstones": "row_id"}
+# 삭제 시 sync_tombstones 에 기록하는 테이블 (sql/001_delta_sync.sql 과 동일)
+TOMBSTONE_TABLES = {"team_members", "locations", "incomes"}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+_FILTER_OPS = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+def _split_top(s: str) -> list[str]:
+    """쉼표로 나누되 괄호/큰따옴표 안의 쉼표는 무시."""
+    parts, depth, quoted, cur = [], 0, False, ""
+    for ch in s:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ",":
+            parts.append(cur); cur = ""
+            continue
+        cur += ch
+    parts.append(cur)
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _logic_sql(joiner: str, body: str) -> tuple[str, list]:
+    sqls, params = [], []
+    for term in _split_top(body):
+        for kw in ("and", "or"):
+            if term.startswith(kw + "(") and term.endswith(")"):
+                sql, ps = _logic_sql(kw, term[len(kw) + 1:-1])
+                break
+        else:
+            col, op, value = term.split(".", 2)
+            if len(value) >= 2 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            sql, ps = f"{_q(col)} {_FILTER_OPS[op]} ?", [value]
+        sqls.append(sql); params.extend(ps)
+    return "(" + f" {joiner} ".join(sqls) + ")", params
+
+
+class _Result:
+    def __init__(self, data: list[dict], count: int | None = None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    """postgrest 요청 빌더 흉내 — 메서드 체인은 self 를 반환하고 execute()에서 SQL 실행."""
+
+    def __init__(self, store: "SqliteStore", table: str):
+        self.store = store
+        self.table = table
+        self.op = "select"
+        self.cols = "*"
+        self.count = None
+        self.where: list[tuple[str, list]] = []
+        self.orders: list[str] = []
+        self.offset: int | None = None
+        self.limit_n: int | None = None
+        self.values: Any = None
+        self.on_conflict: str | None = None
+        self.ignore_duplicates = False
+        self.returning = "representation"
+
+    # ── 읽기/반환 컬럼
+    def select(self, cols: str = "*", count: str | None = None, head: bool = False):
+        self.cols = cols or "*"
+        self.count = count
+        if head:
+            self.limit_n = 0
+        return self
+
+    # ── 필터
+    def _add(self, sql: str, *params):
+        self.where.append((sql, list(params)))
+        return self
+
+    def eq(self, col, v):   return self._add(f"{_q(col)} = ?", v)
+    def neq(self, col, v):  return self._add(f"{_q(col)} <> ?", v)
+    def gt(self, col, v):   return self._add(f"{_q(col)} > ?", v)
+    def gte(self, col, v):  return self._add(f"{_q(col)} >= ?", v)
+    def lt(self, col, v):   return self._add(f"{_q(col)} < ?", v)
+    def lte(self, col, v):  return self._add(f"{_q(col)} <= ?", v)
+    def like(self, col, pattern):  return self._add(f"{_q(col)} like ?", pattern.replace("*", "%"))
+    def ilike(self, col, pattern): return self._add(f"lower({_q(col)}) like lower(?)", pattern.replace("*", "%"))
+
+    def in_(self, col, values):
+        values = list(values)
+        if not values:
+            return self._add("0")
+        return self._add(f"{_q(col)} in ({', '.join('?' * len(values))})", *values)
+
+    def is_(self, col, v):
+        return self._add(f"{_q(col)} is null" if v in (None, "null") else f"{_q(col)} is not null")
+
+    def or_(self, filters: str):
+        """postgrest or 필터 문자열 ("a.lt.1,and(a.eq.1,b.gt.x)") — 비교 연산자와 and()/or() 중첩만 지원."""
+        sql, params = _logic_sql("or", filters)
+        return self._add(sql, *params)
+
+    # ── 정렬/페이지
+    def order(self, col, desc: bool = False):
+        self.orders.append(f"{_q(col)} {'desc' if desc else 'asc'}")
+        return self
+
+    def range(self, start: int, end: int):
+        self.offset, self.limit_n = start, end - start + 1
+        return self
+
+    def limit(self, n: int):
+        self.limit_n = n
+        return self
+
+    # ── 쓰기
+    def insert(self, rows, returning: str = "representation", upsert: bool = False, **_):
+        self.op, self.values, self.returning = ("upsert" if upsert else "insert"), rows, returning
+        return self
+
+    def upsert(self, rows, on_conflict: str | None = None, returning: str = "representation",
+               ignore_duplicates: bool = False, **_):
+        self.op, self.values, self.on_conflict, self.returning = "upsert", rows, on_conflict, returning
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values: dict, returning: str = "representation", **_):
+        self.op, self.values, self.returning = "update", values, returning
+        return self
+
+    def delete(self, returning: str = "representation", **_):
+        self.op, self.returning = "delete", returning
+        return self
+
+    # ── 실행
+    def _where_sql(self) -> tuple[str, list]:
+        if not self.where:
+            return "", []
+        return " where " + " and ".join(s for s, _ in self.where), [p for _, ps in self.where for p in ps]
+
+    def _col_sql(self) -> str:
+        cols = [c.strip() for c in self.cols.split(",") if c.strip()]
+        return "*" if (not cols or "*" in cols) else ", ".join(_q(c) for c in cols)
+
+    def _select(self, conn) -> _Result:
+        where, params = self._where_sql()
+        sql = f"select {self._col_sql()} from {_q(self.table)}{where}"
+        if self.orders:
+            sql += " order by " + ", ".join(self.orders)
+        if self.limit_n is not None or self.offset is not None:
+            sql += " limit ? offset ?"
+            params = params + [self.limit_n if self.limit_n is not None else -1, self.offset or 0]
+        data = [dict(r) for r in conn.execute(sql, params)]
+        count = None
+        if self.count:
+            w, p = self._where_sql()
+            count = conn.execute(f"select count(*) from {_q(self.table)}{w}", p).fetchone()[0]
+        return _Result(data, count)
+
+    def _fetch_by_keys(self, conn, key: str, keys: list) -> list[dict]:
+        if not keys or self.returning == "minimal":
+            return []
+        marks = ", ".join("?" * len(keys))
+        sql = f"select {self._col_sql()} from {_q(self.table)} where {_q(key)} in ({marks})"
+        return [dict(r) for r in conn.execute(sql, keys)]
+
+    def _write(self, conn) -> _Result:
+        st = self.store
+        cols = st.columns(conn, self.table)
+        pk = PRIMARY_KEYS.get(self.table, "id")
+        now = _now()
+
+        if self.op in ("insert", "upsert"):
+            rows = self.values if isinstance(self.values, list) else [self.values]
+            keys = []
+            for raw in rows:
+                row = {k: v for k, v in raw.items() if k in cols}
+                if pk == "id" and not row.get("id"):
+                    row["id"] = uuid.uuid4().hex
+                if "created_at" in cols and not row.get("created_at"):
+                    row["created_at"] = now
+                if "updated_at" in cols:
+                    row["updated_at"] = now
+                names = list(row)
+                sql = f"insert into {_q(self.table)} ({', '.join(_q(c) for c in names)}) values ({', '.join('?' * len(names))})"
+                if self.op == "upsert":
+                    target = self.on_conflict or pk
+                    sets = [f"{_q(c)} = excluded.{_q(c)}" for c in names if c != target]
+                    sql += f" on conflict ({_q(target)}) do " + (
+                        f"update set {', '.join(sets)}" if sets and not self.ignore_duplicates else "nothing")
+                cur = conn.execute(sql, [row[c] for c in names])
+                if self.ignore_duplicates and cur.rowcount == 0:
+                    continue  # ignore_duplicates: 기존 행은 그대로, 응답에서도 제외(PostgREST와 동일)
+                keys.append(row[pk] if pk in row else row.get(self.on_conflict or pk))
+            return _Result(self._fetch_by_keys(conn, pk, keys))
+
+        where, params = self._where_sql()
+        keys = [r[0] for r in conn.execute(f"select {_q(pk)} from {_q(self.table)}{where}", params)]
+
+        if self.op == "update":
+            values = {k: v for k, v in dict(self.values).items() if k in cols}
+            if "updated_at" in cols:
+                values["updated_at"] = now
+            if keys and values:
+                sets = ", ".join(f"{_q(c)} = ?" for c in values)
+                conn.execute(f"update {_q(self.table)} set {sets}{where}", list(values.values()) + params)
+            return _Result(self._fetch_by_keys(conn, pk, keys))
+
+        # delete
+        gone = self._fetch_by_keys(conn, pk, keys)
+        conn.execute(f"delete from {_q(self.table)}{where}", params)
+        if self.table in TOMBSTONE_TABLES and keys:
+            conn.executemany(
+                "insert into sync_tombstones (table_name, row_id, deleted_at) values (?, ?, ?) "
+                "on conflict (table_name, row_id) do update set deleted_at = excluded.deleted_at",
+                [(self.table, str(k), now) for k in keys],
+            )
+        return _Result(gone)
+
+    def execute(self) -> _Result:
+        with self.store.lock:
+            conn = self.store.conn
+            if self.op == "select":
+                return self._select(conn)
+            conn.execute("begin immediate")
+            try:
+                res = self._write(conn)
+            except Exception:
+                conn.execute("rollback")
+                raise
+            conn.execute("commit")
+            return res
+
+
+class _Rpc:
+    def __init__(self, store: "SqliteStore", name: str, params: dict | None):
+        self.store, self.name, self.params = store, name, dict(params or {})
+
+    def execute(self) -> _Result:
+        fn = self.store.rpcs.get(self.name)
+        if fn is None:
+            raise KeyError(f"알 수 없는 RPC: {self.name}")
+        with self.store.lock:
+            return _Result(fn(self.store.conn, self.params))
+
+
+def _rpc_income_years(conn, params) -> list[dict]:
+    sql = "select distinct cast(substr(date, 1, 4) as integer) as year from incomes order by 1"
+    return [dict(r) for r in conn.execute(sql)]
+
+
+def _rpc_invoice_years(conn, params) -> list[dict]:
+    sql = """
+        select cast(substr(ym, 1, 4) as integer) as year, max(ym) as latest_ym
+        from invoices where ym glob '[0-9][0-9][0-9][0-9]-*'
+        group by 1 order by 1
+    """
+    return [dict(r) for r in conn.execute(sql)]
+
+
+def _rpc_settlement_bundle(conn, params) -> dict:
+    """sql/007_settlement_snapshot.sql 의 settlement_bundle(p_ym_key) 와 같은 모양 (스냅샷 포함)."""
+    key = params["p_ym_key"]
+    month = conn.execute("select * from settlement_month where ym_key = ? limit 1", (key,)).fetchone()
+    snap = conn.execute("select * from settlement_snapshot where ym_key = ?", (key,)).fetchone()
+    return {
+        "month": dict(month) if month else None,
+        "teamfee": [dict(r) for r in conn.execute(
+            "select * from settlement_teamfee where ym_key = ? order by created_at", (key,))],
+        "transfer": [dict(r) for r in conn.execute(
+            "select * from settlement_transfer where ym_key = ? order by created_at", (key,))],
+        "snapshot": dict(snap) if snap else None,
+    }
+
+
+def _rpc_income_stats(conn, params) -> list[dict]:
+    """sql/004_income_monthly.sql 의 income_stats(p_year) 와 같은 모양 — 롤업에서 읽음."""
+    year = int(params["p_year"])
+    sql = """
+        select cast(substr(m.ym, 6, 2) as integer) as month,
+               nullif(m.team_member_id, '') as team_member_id, nullif(m.location_id, '') as location_id,
+               coalesce(l.category, '') as category, m.amount, m.cnt
+        from income_monthly m left join locations l on l.id = m.location_id
+        where m.ym >= ? and m.ym <= ?
+        order by 1, 2, 3
+    """
+    return [dict(r) for r in conn.execute(sql, (f"{year:04d}-01", f"{year:04d}-12"))]
+
+
+_ROLLUP_SOURCE = """
+    select substr(date, 1, 7) as ym, coalesce(team_member_id, '') as team_member_id,
+           coalesce(location_id, '') as location_id, sum(amount) as amount, count(*) as cnt
+    from incomes group by 1, 2, 3
+"""
+
+
+def _rpc_income_monthly_verify(conn, params) -> list[dict]:
+    """원본 재계산 ↔ 롤업 비교: 어긋난 그룹만 반환 (SQLite 는 full join 대신 양방향 left join)."""
+    sql = f"""
+        with src as ({_ROLLUP_SOURCE}),
+        pairs as (
+          select s.ym, s.team_member_id, s.location_id, s.amount as expected_amount,
+                 coalesce(m.amount, 0) as actual_amount, s.cnt as expected_cnt, coalesce(m.cnt, 0) as actual_cnt
+          from src s left join income_monthly m using (ym, team_member_id, location_id)
+          union all
+          select m.ym, m.team_member_id, m.location_id, 0, m.amount, 0, m.cnt
+          from income_monthly m left join src s using (ym, team_member_id, location_id)
+          where s.ym is null
+        )
+        select * from pairs
+        where expected_cnt <> actual_cnt or abs(expected_amount - actual_amount) > 1e-6
+        order by 1, 2, 3
+    """
+    return [dict(r) for r in conn.execute(sql)]
+
+
+def _rpc_income_monthly_rebuild(conn, params) -> int:
+    conn.execute("begin immediate")
+    try:
+        drift = len(_rpc_income_monthly_verify(conn, params))
+        conn.execute("delete from income_monthly")
+        conn.execute(f"insert into income_monthly (ym, team_member_id, location_id, amount, cnt) {_ROLLUP_SOURCE}")
+        conn.execute("commit")
+    except Exception:
+        conn.execute("rollback")
+        raise
+    return drift
+
+
+def _shift_rows(conn, table: str, set_sql: str, ids: list, extra_where: str = "") -> list[dict]:
+    ids = [str(i) for i in ids or []]
+    if not ids:
+        return []
+    marks = ", ".join("?" * len(ids))
+    where = f"id in ({marks}){extra_where}"
+    conn.execute("begin immediate")
+    try:
+        conn.execute(f"update {table} set {set_sql} where {where}", ids)
+        conn.execute("commit")
+    except Exception:
+        conn.execute("rollback")
+        raise
+    return [dict(r) for r in conn.execute(f"select * from {table} where {where}", ids)]
+
+
+def _rpc_incomes_shift_date(conn, params) -> list[dict]:
+    days = int(params.get("p_days") or 0)
+    return _shift_rows(conn, "incomes", f"date = date(date, '{days:+d} days'), updated_at = '{_now()}'",
+                       params.get("p_ids"))
+
+
+def _rpc_invoices_shift_ym(conn, params) -> list[dict]:
+    months = int(params.get("p_months") or 0)
+    return _shift_rows(conn, "invoices", f"ym = strftime('%Y-%m', ym || '-01', '{months:+d} months')",
+                       params.get("p_ids"), " and ym glob '[0-9][0-9][0-9][0-9]-[0-9][0-9]'")
+
+
+class SqliteStore:
+    """Supabase 클라이언트 대신 쓰는 로컬 SQLite 저장소 (스레드 간 공유, 쓰기는 잠금으로 직렬화)."""
+
+    def __init__(self, path: str = "teamincome.db"):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("pragma journal_mode = wal")
+        self.conn.execute("pragma synchronous = normal")
+        self.conn.executescript(SCHEMA)
+        self._columns: dict[str, set[str]] = {}
+        self.rpcs: dict[str, Callable[[sqlite3.Connection, dict], Any]] = {
+            "income_years": _rpc_income_years,
+            "income_stats": _rpc_income_stats,
+            "invoice_years": _rpc_invoice_years,
+            "settlement_bundle": _rpc_settlement_bundle,
+            "income_monthly_verify": _rpc_income_monthly_verify,
+            "income_monthly_rebuild": _rpc_income_monthly_rebuild,
+            "incomes_shift_date": _rpc_incomes_shift_date,
+            "invoices_shift_ym": _rpc_invoices_shift_ym,
+        }
+        # 롤업 도입 전에 만들어진 DB: 최초 1회 채우기
+        if self.conn.execute("select exists(select 1 from incomes) and not exists(select 1 from income_monthly)").fetchone()[0]:
+            _rpc_income_monthly_rebuild(self.conn, {})
+
+    def columns(self, conn, table: str) -> set[str]:
+        if table not in self._columns:
+            self._columns[table] = {r[1] for r in conn.execute(f"pragma table_info({_q(table)})")}
+        return self._columns[table]
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: dict | None = None) -> _Rpc:
+        return _Rpc(self, name, params)
+
+    def schema(self, _name: str) -> "SqliteStore":
+        return self
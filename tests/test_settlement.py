@@ -0,0 +1,93 @@
+"""settlement.py 정산 엔진 단위 테스트 (python -m pytest -q)."""
+import pytest
+
+from settlement import (
+    benchmark, drifted_parts, hub_orders, input_checksums, main, minimal_orders, net_balances, settle,
+)
+
+
+def _strip_same(a: str, b: str) -> bool:
+    return a.replace(" ", "") == b.replace(" ", "")
+
+
+def _apply(orders):
+    """지시서를 실행했을 때 사람별 순 변화 (+ 받음 / - 냄)."""
+    out = {}
+    for o in orders:
+        out[o["from"]] = out.get(o["from"], 0) - o["amount"]
+        out[o["to"]] = out.get(o["to"], 0) + o["amount"]
+    return {k: v for k, v in out.items() if v}
+
+
+def test_net_balances_excludes_external_and_sums_to_zero():
+    ledger = [
+        {"from": "외부", "to": "강", "amount": 650, "reason": "성모 고정 수입"},
+        {"from": "강", "to": "이", "amount": 100},
+        {"from": "박", "to": "이", "amount": 50},
+    ]
+    bal = net_balances(ledger)
+    assert bal == {"강": -100, "박": -50, "이": 150}
+    assert sum(bal.values()) == 0
+    assert net_balances([{"from": "외부", "to": "강", "amount": 1}]) == {}
+
+
+def test_minimal_orders_pairs_equal_amounts_first():
+    orders = minimal_orders({"A": 100, "B": -100, "C": 50, "D": -30, "E": -20})
+    assert {"from": "B", "to": "A", "amount": 100} in orders
+    assert _apply(orders) == {"A": 100, "B": -100, "C": 50, "D": -30, "E": -20}
+
+
+def test_minimal_orders_at_most_n_minus_one():
+    bal = {"A": 70, "B": 40, "C": -35, "D": -45, "E": -30}
+    orders = minimal_orders(bal)
+    assert len(orders) <= len(bal) - 1
+    assert _apply(orders) == bal
+
+
+def test_minimal_orders_rejects_nonzero_sum():
+    with pytest.raises(ValueError):
+        minimal_orders({"A": 10, "B": -5})
+
+
+def test_hub_orders_direction_and_sign():
+    orders = hub_orders({"A": 30, "B": -20, "H": -10}, "H")
+    assert orders == [
+        {"from": "H", "to": "A", "amount": 30},
+        {"from": "B", "to": "H", "amount": 20},
+    ]
+
+
+def test_settle_hub_absorbs_difference_with_custom_same():
+    # 합이 0이 아님(+10) → 허브가 -10 을 떠안음, 허브 표기가 달라도(" H") same 으로 같은 사람
+    bal = {"A": 30, "B": -20, " H": 0}
+    minimal = settle(bal, "minimal", hub="H", same=_strip_same)
+    assert _apply(minimal) == {"A": 30, "B": -20, "H": -10}
+    hub = settle(bal, "hub", hub="H", same=_strip_same)
+    assert hub == [
+        {"from": "H", "to": "A", "amount": 30},
+        {"from": "B", "to": "H", "amount": 20},
+    ]
+
+
+def test_settle_hub_mode_requires_hub():
+    with pytest.raises(ValueError):
+        settle({"A": 1, "B": -1}, "hub")
+
+
+def test_checksums_stable_and_detect_single_change():
+    parts = {"month": {"a": 1, "b": 2}, "teamfee": [{"who": "강", "amount": 10}], "transfer": []}
+    same = input_checksums({"transfer": [], "teamfee": [{"amount": 10, "who": "강"}], "month": {"b": 2, "a": 1}})
+    saved = input_checksums(parts)
+    assert saved == same
+    assert drifted_parts(saved, same) == []
+
+    changed = input_checksums({**parts, "teamfee": [{"who": "강", "amount": 11}]})
+    assert changed["all"] != saved["all"]
+    assert drifted_parts(saved, changed) == ["teamfee"]
+
+
+def test_benchmark_small_run():
+    r = benchmark(n_people=20, n_entries=500, seed=1)
+    assert r["people"] == 20 and r["entries"] > 0
+    assert r["minimal_orders"] <= 19
+    assert main(["20", "500"])["people"] == 20
@@ -0,0 +1,112 @@
+"""sqlite_store.py 로컬 저장소(postgrest 빌더 흉내) 단위 테스트 (python -m pytest -q)."""
+import pytest
+
+from sqlite_store import SqliteStore
+
+
+def _keyset(keys, cursor):
+    """app._keyset_filter 와 같은 모양의 or 문자열 (값은 큰따옴표)."""
+    terms = []
+    for i, (col, desc) in enumerate(keys):
+        conds = [f'{c}.eq."{cursor[j]}"' for j, (c, _) in enumerate(keys[:i])]
+        conds.append(f'{col}.{"lt" if desc else "gt"}."{cursor[i]}"')
+        terms.append(f"and({','.join(conds)})" if len(conds) > 1 else conds[0])
+    return ",".join(terms)
+
+
+def _income(i, day, amount, member="m1"):
+    return {"id": f"r{i:04d}", "date": f"2026-01-{day:02d}", "team_member_id": member,
+            "location_id": "l1", "amount": amount, "memo": ""}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SqliteStore(str(tmp_path / "t.db"))
+
+
+@pytest.fixture
+def filled(store):
+    # 같은 날짜·금액이 여러 행 → 마지막 키(id)까지 써야 페이지 경계가 안정적
+    rows = [_income(i, 1 + i % 5, float(i % 3), "m1" if i % 2 else "m2") for i in range(47)]
+    store.table("incomes").insert(rows).execute()
+    return store
+
+
+@pytest.mark.parametrize("keys", [
+    [("date", True), ("id", True)],
+    [("amount", False), ("date", True), ("id", False)],
+])
+def test_keyset_or_paging_visits_every_row_once_in_order(filled, keys):
+    def page(cursor):
+        q = filled.table("incomes").select("*").eq("team_member_id", "m1")
+        if cursor is not None:
+            q = q.or_(_keyset(keys, cursor))
+        for col, desc in keys:
+            q = q.order(col, desc=desc)
+        return q.limit(4).execute().data
+
+    seen, cursor = [], None
+    while True:
+        rows = page(cursor)
+        if not rows:
+            break
+        seen.extend(rows)
+        cursor = tuple(rows[-1][c] for c, _ in keys)
+
+    full = filled.table("incomes").select("*").eq("team_member_id", "m1")
+    for col, desc in keys:
+        full = full.order(col, desc=desc)
+    expected = [r["id"] for r in full.execute().data]
+    assert [r["id"] for r in seen] == expected
+    assert len(set(expected)) == len(expected) == 23
+
+
+def test_count_exact_ignores_limit_and_range(filled):
+    res = filled.table("incomes").select("id", count="exact").eq("team_member_id", "m2").limit(1).execute()
+    assert len(res.data) == 1
+    assert res.count == 24
+    res = filled.table("incomes").select("id", count="exact").range(40, 49).execute()
+    assert len(res.data) == 7
+    assert res.count == 47
+
+
+def test_delete_writes_tombstone_and_keeps_other_rows(store):
+    store.table("incomes").insert([_income(1, 1, 5.0), _income(2, 2, 6.0)]).execute()
+    gone = store.table("incomes").delete().eq("id", "r0001").execute().data
+    assert [r["id"] for r in gone] == ["r0001"]
+    tomb = store.table("sync_tombstones").select("table_name, row_id, deleted_at").execute().data
+    assert [(t["table_name"], t["row_id"]) for t in tomb] == [("incomes", "r0001")]
+    assert tomb[0]["deleted_at"]
+    left = store.table("incomes").select("id, updated_at").execute().data
+    assert [r["id"] for r in left] == ["r0002"] and left[0]["updated_at"]
+
+
+def test_upsert_updates_existing_and_ignore_duplicates_keeps_it(store):
+    store.table("incomes").insert(_income(1, 1, 5.0)).execute()
+    store.table("incomes").upsert({**_income(1, 1, 7.0), "memo": "수정"}, on_conflict="id").execute()
+    res = store.table("incomes").upsert([_income(1, 1, 9.0), _income(2, 2, 3.0)],
+                                        on_conflict="id", ignore_duplicates=True).execute()
+    assert [r["id"] for r in res.data] == ["r0002"]
+    rows = {r["id"]: r for r in store.table("incomes").select("id, amount, memo").execute().data}
+    assert rows["r0001"]["amount"] == 7.0 and rows["r0001"]["memo"] == "수정"
+
+
+def test_rollup_stays_consistent_after_shift_update_and_delete(filled):
+    def verify():
+        return filled.rpc("income_monthly_verify").execute().data
+
+    assert verify() == []
+
+    ids = ["r0000", "r0003", "r0010"]
+    moved = filled.rpc("incomes_shift_date", {"p_ids": ids, "p_days": 31}).execute().data
+    assert sorted(r["date"][:7] for r in moved) == ["2026-02"] * 3
+    assert verify() == []
+
+    filled.table("incomes").update({"amount": 100.0, "team_member_id": "m9"}).eq("id", "r0004").execute()
+    filled.table("incomes").delete().in_("id", ["r0005", "r0006"]).execute()
+    assert verify() == []
+
+    stats = filled.rpc("income_stats", {"p_year": 2026}).execute().data
+    total = sum(r["amount"] for r in filled.table("incomes").select("amount").execute().data)
+    assert sum(r["amount"] for r in stats) == pytest.approx(total)
+    assert {r["month"] for r in stats} == {1, 2}